@@ -12,15 +12,20 @@ TODO
 """
  
 import U1000
-import WinspecCOM as Winspec
-import RacalDana
+import darkLibrary
+import catalog
 import os
 import time
 import importSPE
+import calibration
+import scanFile
+import backgroundWriter
 import numpy as np
 import spikes
+import merge
+import spectrum
+import peakFit
 import shutil
-import testMerge
 import pylab as pl
 import yaml
 import collections
@@ -45,12 +50,7 @@ def nextFile(folder, basemane, extension):
     assert isinstance(basemane, str)
     assert isinstance(extension, str)
 
-    highest_num = 0
-    for file in os.listdir(folder):
-        if file.startswith(basemane) and file.endswith(extension) :
-            a = int(file.replace(basemane, '', 1).replace(extension, ''))
-            if a > highest_num:
-                highest_num = a
+    highest_num = catalog.highestIndex(folder, basemane, extension)
     
     return basemane + str(highest_num+1) + extension
 
@@ -73,7 +73,7 @@ def ordered_dump(data, stream=None, Dumper=yaml.SafeDumper, default_flow_style=N
 
 class Mesure():
     
-    def __init__(self, position, laser=False, port='COM25', index=0, baseFilename=None):
+    def __init__(self, position, laser=False, port='COM25', index=0, baseFilename=None, CCD=None, spectrometer=None, darkFolder='darks', catalogFilename='catalog.sqlite', fsync='close', writeQueue=16, calibration=calibration.U1000CCD):
         """
         position
             wavelength on the the display of the spectrometer (A)
@@ -81,19 +81,66 @@ class Mesure():
             wavelength of the laser (A)
             Used for measures in cm-1
             False (default) means undefined
+        CCD
+            camera (see CCDbackend)
+            None (default): Winspec
+            ex.: CCDsim.simulatedCCD() to work without the lab PC
+        spectrometer
+            None (default): U1000 on port
+            ex.: U1000.U1000(U1000sim.U1000Simulator().port, initDelay=0)
+        darkFolder
+            folder of the dark frames library (see darkLibrary), subtracted from each measurement
+            A dark is acquired only for new settings (exposure, ROI, temperature...)
+            None: no dark subtraction
+        catalogFilename
+            SQLite catalog of the saved scans (see catalog.Catalog)
+            None: no catalog (files are numbered by listing the folder)
+        fsync, writeQueue
+            files are written in a thread (see backgroundWriter), so a slow disk 
+            (network) does not delay the measurement. 
+            fsync: 'never', 'close', 'always'
+            writeQueue: writes waiting before the measurement waits for the disk
+        calibration
+            pixel -> wavelength of the windows (see calibration.Calibration), also 
+            given to the spectrometer (U1000.pixel2A)
+            calibration.U1000CCD (default): parameters of the Matlab version
+            calibration.U1000CCDNe: dv fitted on Ne @ 6929.4673
         """
-        self.CCD = Winspec.winspec()  # CCD Detector
+        if CCD is None:
+            import WinspecCOM as Winspec  # only on the lab PC (COM)
+            CCD = Winspec.winspec()
+        self.CCD = CCD  # CCD Detector
+        self.CCD.frameRingSize = 2  # raw frames are processed (copied) before the next acquisition
+        if darkFolder is not None:
+            self.CCD.darkLibrary = darkLibrary.DarkLibrary(darkFolder)
         try:
+            import RacalDana
             self.PMT = RacalDana.RacalDana()  # PMT Detector
         except:
                 pass
-        self.spectrometer = U1000.U1000(port)  # Spectrometer
+        if spectrometer is None:
+            spectrometer = U1000.U1000(port)
+        self.spectrometer = spectrometer  # Spectrometer
+        self.calibration = calibration
+        self.spectrometer.calibration = calibration  # same pixel -> wavelength everywhere
         self.spectrometer.displayPosition = position
         self.laser = laser
         self.index = index
         self.baseFilename = baseFilename
         if self.baseFilename is None:
             self.baseFilename = time.strftime("%y%m%d")
+        # Auto exposure (see autoExposure)
+        self.saturationLevel = 64000  # counts per accumulation (ADC saturates at 65535, less the dark)
+        self.minExposure = 1e-3  # s
+        # Exposure planning (see CCDbackend.planExposure)
+        self.expectedSignal = None  # electrons/s in the weakest pixel of interest (None: no planning)
+        self.minImages = 5  # despike needs 5 images
+        self.exposurePlan = None  # plan of the last measurement
+        self.spectraFiles = []  # .SPE files of the last measurement
+        self.catalog = None
+        if catalogFilename is not None:
+            self.catalog = catalog.Catalog(catalogFilename)
+        self.writer = backgroundWriter.BackgroundWriter(writeQueue, fsync)
         
     def close(self):
         """
@@ -104,6 +151,9 @@ class Mesure():
         print('Current self.laser: ' + str(self.laser) + ' A')
         
         self.spectrometer.close()
+        self.writer.close()  # all files are written
+        if self.catalog is not None:
+            self.catalog.close()
         try:
             self.PMT.close()
         except:
@@ -150,10 +200,101 @@ class Mesure():
             print(str(round(position, 3)) + ' A' )
             self.spectrometer.goto(position)
 
+    def gotoAsync(self, position, unit='cm-1', callback=None):
+        """
+        Start moving the spectrometer and return immediately
+        
+        position
+            destination (unit)
+        unit
+            'A', 'cm-1'
+        callback
+            function called with the Future when the movement is over
+        Returns the movement (concurrent.futures.Future).
+        self.spectrometer.wait() waits for its end.
+        """
+        if unit == 'cm-1':
+            L = self.wn2A(position)  # corresponding wavelength (A)
+            print(str(round(position, 2)) + ' cm-1,  ' + str(round(L, 3)) + ' A' )
+        else:
+            L = position
+            print(str(round(position, 3)) + ' A' )
+        return self.spectrometer.gotoAsync(L, callback=callback)
+
     def stop(self):
         """Stop movement of the spectrometer"""
         self.spectrometer.stop()
 
+    def nextFile(self, folder, basemane, extension):
+        """
+        next available file basemane + <number> + extension (see nextFile)
+        Numbered by the catalog (if any), without listing the folder
+        """
+        if self.catalog is None:
+            return nextFile(folder, basemane, extension)
+        return self.catalog.nextFile(folder, basemane, extension)
+
+    def saturated(self, y, accumulations=1):
+        """Return True if the is a least one pixel saturated on the camera"""
+        return np.any(y > self.saturationLevel * accumulations)
+
+    def autoExposure(self, totalTime, images=1, accumulations=1, previewTime=.1, fraction=.7, filename=False):
+        """
+        Split totalTime in images so the brightest pixel reaches fraction of saturation
+        A short preview (shortened while it is saturated) predicts the exposure,
+        counts being proportional to the exposure.
+        Returns exposure time (per image) and number of images (at least images)
+        
+        totalTime
+            time per position (s)
+        """
+        previewTime = min(previewTime, totalTime)
+        x, y, previewFile = self.CCD.measureSimple(exposureTime=previewTime, images=1, accumulations=accumulations, filename=filename)
+        while self.saturated(y, accumulations) and previewTime / 10 >= self.minExposure:
+            previewTime = previewTime / 10
+            x, y, previewFile = self.CCD.measureSimple(exposureTime=previewTime, images=1, accumulations=accumulations, filename=filename)
+        peak = max(np.max(y) / accumulations, 1.)
+        exposureTime = max(previewTime * fraction * self.saturationLevel / peak, self.minExposure)
+        images = max(images, int(np.ceil(totalTime / exposureTime)))
+        return totalTime / images, images
+
+    def setROI(self, maskCCD=None, tracks=None):
+        """
+        Only read maskCCD pixels of the CCD, binned vertically (shorter readout)
+        Returns the previous ROIs (see restoreROI)
+        
+        maskCCD
+            first and last valid pixels on the CCD (first pixel of the chip: 0)
+            None: pixels of the current ROI
+        tracks
+            rows of each track (ex.: sample and reference fibres), each one binned
+            [[ymin, ymax], [ymin, ymax], ...]  (first row of the chip: 1)
+            None: one track, rows of the current ROI
+        """
+        previous = (self.CCD.useROI()[0], self.CCD.ROIs())
+        if previous[1]:
+            xmin, xmax, xgroup, ymin, ymax, ygroup = previous[1][0]
+        else:  # no ROI: full chip
+            xmin, xmax, xgroup, ymin, ymax, ygroup = 1, self.CCD.nPixel, 1, 1, self.CCD.nRows, self.CCD.nRows
+        if maskCCD is not None:
+            xmin, xmax, xgroup = maskCCD[0]+1, maskCCD[1]+1, 1
+        if tracks is None:
+            tracks = [[ymin, ymax]]
+        self.CCD.ROIs([[xmin, xmax, xgroup, track[0], track[1], track[1]-track[0]+1] for track in tracks])
+        return previous
+
+    def restoreROI(self, previous):
+        """
+        Restore the ROIs returned by setROI (full chip if there was no ROI)
+        """
+        useROI, rois = previous
+        if useROI and rois:
+            self.CCD.ROIs(rois)
+        else:
+            if not rois:
+                self.CCD.clearROI()
+            self.CCD.useROI(False)
+
 #    def acquisition(self):
 #        #self.S.start()  # Start measurement
 #        return self.CCD.measureSimple(exposureTime=.33, images=5)  # Perform measurement and return the filename of the new file
@@ -184,7 +325,60 @@ class Mesure():
             #print(len(out))
             return np.array(out)
     
-    def measureRange(self, Range , nOverlap=3, accTime=1, images=False, accumulations=1, unit='cm-1', maskCCD=None, plot=True, spectroSlits=10, detector='CCD', rootFilename='.', baseFilename=None, sample='', comment=''):
+    def __rangePositions(self, Range, nOverlap, unit, maskCCD, detector):
+        """
+        Calculate spectrometer positions (A) to measure a single range
+        
+        Range
+            [Begin, End] or [Begin, End, step] (PMT), see measureRange
+        Returns start, end (A) and positions (A)
+        """
+        try:
+            start = Range[0]  
+            try:
+                end = Range[1]
+            except IndexError:
+                end = Range[0]
+                nOverlap = 1
+        except TypeError:
+            start = Range
+            end = Range
+            nOverlap = 1
+        try:
+            step = Range[2]
+        except TypeError:
+            step = 1
+        except IndexError:
+            step = 1
+            
+        print(str(start) + " -> " + str(end))
+        
+        if detector == 'CCD':
+            if unit == 'cm-1':  # convert to A
+                start = self.wn2A(start)
+                end = self.wn2A(end)          
+
+            x = self.calibration.pixel2A(start, np.array([maskCCD[0], maskCCD[1]])) 
+            #print(x)
+            largeurFenetre = abs(x[0] - x[1])
+            #mprint(largeurFenetre)
+            offset = -np.mean(x) + start  
+            # small correction if maskCCD is not centered on the center of the detector
+            # but we move the spectrometer assuming that the center of the detector will be the center of the detection region
+            #print(offset)
+            #print(start)
+            #positions = self.__positionsRange(start, end, largeurFenetre, nOverlap)
+            positions = self.__positionsRange(start+offset, end+offset, largeurFenetre, nOverlap)
+        elif detector == 'PMT':
+            positions = np.linspace(start, end, int(round((end-start)/step))+1)  
+            if unit == 'cm-1':  # convert back to A
+                positions = self.wn2A(positions)
+                start = self.wn2A(start)
+                end = self.wn2A(end)          
+
+        return start, end, np.atleast_1d(positions)
+
+    def measureRange(self, Range , nOverlap=3, accTime=1, images=False, accumulations=1, unit='cm-1', maskCCD=None, plot=True, spectroSlits=10, detector='CCD', rootFilename='.', baseFilename=None, sample='', comment='', hardwareROI=True, tracks=None, autoExposure=False, snr=None, compression=None):
         """
         Measure in a range of position
         Each point is garanted to come from the have the same number of points
@@ -193,6 +387,8 @@ class Mesure():
             Range of the of measurement
             [Begin, End]
             End is optionnal. If omited, will take one window centered on Start
+            A list of ranges measures all of them in one pass
+            [[Begin, End], [Begin, End], ...]
         nOverlap
             number of time the same position will be measured 
             (the CCD detector will be centered at different positions)
@@ -233,91 +429,66 @@ class Mesure():
             leading part of filename (will be numbered)
                 None: get current date in format AAMMDD
             (string)
+        compression
+            of the .scan file (see scanFile.ScanWriter)
+                None (default), 'zlib'
+            Text (CSV): scanFile.exportCSV(<file>.scan)
         """
-        def saturation(y):
-            """Return True if the is a least one pixel saturated on the camera"""
-            return np.any(y>65000)
-           
         tInitial = time.time()           
            
         if baseFilename is None:
             baseFilename = time.strftime("%y%m%d-")
 
-        try:
-            start = Range[0]  
-            try:
-                end = Range[1]
-            except IndexError:
-                end = Range[0]
-                nOverlap = 1
-        except TypeError:
-            start = Range
-            end = Range
-            nOverlap = 1
-        try:
-            step = Range[2]
-        except TypeError:
-            step = 1
-        except IndexError:
-            step = 1
-            
-        print(str(start) + " -> " + str(end))
-        
-        if detector == 'CCD':
-            if unit == 'cm-1':  # convert to A
-                start = self.wn2A(start)
-                end = self.wn2A(end)          
+        # Many ranges (ex.: few Raman regions) can be measured in one call
+        if isinstance(Range, (list, tuple)) and len(Range) > 0 and isinstance(Range[0], (list, tuple, np.ndarray)):
+            ranges = Range
+        else:
+            ranges = [Range]
 
-            if maskCCD is None:
-                if spectroSlits == 10:
-#                    maskCCD = [163, 1143]
-#                    maskCCD = [170, 1120]  # corrige le 12 novembre 2015
-                    maskCCD = [200, 1110]  # corrige le 8 septembre 2016
-                elif spectroSlits == 9:
-                    maskCCD = [169, 1095]
-                elif spectroSlits == 8:
-                    maskCCD = [220, 1041]
-                elif spectroSlits == 7:
-                    maskCCD = [277, 983]
-                elif spectroSlits == 6:
-                    maskCCD = [331, 928]
-                elif spectroSlits == 5:
-                    maskCCD = [391, 868]
-                elif spectroSlits == 4:
-                    maskCCD = [442, 815]
-                elif spectroSlits == 3:
-#                    maskCCD = [495, 762]  # ne semble plus valide
-                    maskCCD = [580, 850]  # 18 avril 2016
-                elif spectroSlits == 2:
-                    maskCCD = [555, 706]
-                elif spectroSlits == 1:
-                    maskCCD = [619, 661]
-            
-            x = importSPE.pixel2A(np.array([maskCCD[0], maskCCD[1]]), start) 
-            #print(x)
-            largeurFenetre = abs(x[0] - x[1])
-            #mprint(largeurFenetre)
-            offset = -np.mean(x) + start  
-            # small correction if maskCCD is not centered on the center of the detector
-            # but we move the spectrometer assuming that the center of the detector will be the center of the detection region
-            #print(offset)
-            #print(start)
-            #positions = self.__positionsRange(start, end, largeurFenetre, nOverlap)
-            positions = self.__positionsRange(start+offset, end+offset, largeurFenetre, nOverlap)
-        elif detector == 'PMT':
-            positions = np.linspace(start, end, (end-start)/step+1)  
-            if unit == 'cm-1':  # convert back to A
-                positions = self.wn2A(positions)
-                start = self.wn2A(start)
-                end = self.wn2A(end)          
+        if detector == 'CCD' and maskCCD is None:
+            if spectroSlits == 10:
+#                maskCCD = [163, 1143]
+#                maskCCD = [170, 1120]  # corrige le 12 novembre 2015
+                maskCCD = [200, 1110]  # corrige le 8 septembre 2016
+            elif spectroSlits == 9:
+                maskCCD = [169, 1095]
+            elif spectroSlits == 8:
+                maskCCD = [220, 1041]
+            elif spectroSlits == 7:
+                maskCCD = [277, 983]
+            elif spectroSlits == 6:
+                maskCCD = [331, 928]
+            elif spectroSlits == 5:
+                maskCCD = [391, 868]
+            elif spectroSlits == 4:
+                maskCCD = [442, 815]
+            elif spectroSlits == 3:
+#                maskCCD = [495, 762]  # ne semble plus valide
+                maskCCD = [580, 850]  # 18 avril 2016
+            elif spectroSlits == 2:
+                maskCCD = [555, 706]
+            elif spectroSlits == 1:
+                maskCCD = [619, 661]
+
+        limits = []  # [start, end] of each range (A)
+        positions = []
+        for r in ranges:
+            start, end, p = self.__rangePositions(r, nOverlap, unit, maskCCD, detector)
+            limits.append([start, end])
+            positions.append(p)
+
+        # Visit all positions from the same side (minimise backlash moves)
+        positions = np.hstack(positions)[U1000.planPath(positions)]
+        limits = np.array(limits)
         
         print('A  :')
         print(str(np.round(positions, 3)))
+        travelTime = self.spectrometer.travelTime(positions)
+        print('Predicted travel time: ' + str(round(travelTime, 1)) + ' s')
 
         if unit == 'cm-1':  # convert back to cm-1
             positions = self.A2wn(positions)
-            start = self.A2wn(start)
-            end = self.A2wn(end)
+            limits = self.A2wn(limits)
             print('cm-1 :')
             print(str(np.round(positions, 1)))       
         
@@ -352,26 +523,22 @@ class Mesure():
         #This should be corrected/checked
         #accTime = accTime/nOverlap
         if detector == 'CCD':
-            x, y = self.measure(positions, accTime=accTime, images=images, accumulations=accumulations, unit=unit, maskCCD=maskCCD, plot=False)
+            outFilename = self.nextFile(rootFilename, baseFilename, '.scan').replace('.scan', '', 1)
+            writer = self.writer.scanWriter(outFilename + ".scan", compression=compression)
+            try:
+                # raw windows are appended to the file during the scan
+                x, y = self.measure(positions, accTime=accTime, images=images, accumulations=accumulations, unit=unit, maskCCD=maskCCD, plot=False, hardwareROI=hardwareROI, tracks=tracks, autoExposure=autoExposure, snr=snr, writer=writer)
+            except:
+                writer.close()
+                raise
             #total measurement time
             tMeasure = time.time() - tInitial        
 
-            if end > start:
-                I = np.where(np.all([x>=start, x<=end], axis=0))[0]
+            if np.all(limits[:, 1] > limits[:, 0]):
+                I = np.where(np.any([np.all([x>=start, x<=end], axis=0) for start, end in limits], axis=0))[0]
                 #print(I)
                 x = x[I]
-                y = y[I]
-            outFilename = nextFile(rootFilename, baseFilename, '.csv').replace('.csv', '', 1)
-            #np.savez_compressed(outFilename, x=x, y=y)
-            #print("Data saved in " + outFilename + ".npz" )
-            toSave = np.append([x],[y], axis=0).transpose()
-            np.savetxt(outFilename + ".csv", toSave, delimiter=',', fmt='%.8e', header='Position,Intensity', comments='')
-            print("Data saved in " + outFilename + ".csv" )
-            import zipfile
-            zf = zipfile.ZipFile(outFilename + ".csv.zip", "w", zipfile.ZIP_DEFLATED); 
-            zf.write(outFilename + ".csv", outFilename + ".csv")
-            zf.close()
-            print("Data saved in " + outFilename + ".csv.zip" )
+                y = y[..., I]
             #export experiment conditions
             #import yaml
             #import collections
@@ -383,6 +550,7 @@ class Mesure():
 #            state['spectrometer']['speedFast'] = self.spectrometer.speedFast()
             state['spectrometer']['speedSlow'] = self.spectrometer.speedSlow
             state['spectrometer']['speedFast'] = self.spectrometer.speedFast
+            state['spectrometer']['latency_s'] = {command: stat['mean'] for command, stat in self.spectrometer.latency.items()}
             state['detector'] = {}
             state['detector']['name'] = detector
             state['detector']['actualTemperature'] = self.CCD.actualTemperature()[0]
@@ -390,8 +558,9 @@ class Mesure():
             state['detector']['adcSpeed'] = self.CCD.adcSpeed()[0]
             state['detector']['cosmicMode'] = self.CCD.cosmicMode()[0]
             state['detector']['cosmicSensitivity'] = self.CCD.cosmicSensitivity()[0]
-            state['outFilename'] = outFilename + ".csv"
-            state['configFilename'] = outFilename + ".yaml"
+            state['detector']['darkSubtracted'] = self.CCD.darkLibrary is not None
+            state['outFilename'] = outFilename + ".scan"
+            state['compression'] = compression
             state['Range'] = Range
             state['nOverlap'] = nOverlap
             state['accTime_s'] = accTime
@@ -399,28 +568,44 @@ class Mesure():
             state['accumulations'] = accumulations
             state['unit'] = unit
             state['maskCCD'] = maskCCD
+            state['hardwareROI'] = hardwareROI
+            state['tracks'] = tracks
+            state['autoExposure'] = autoExposure
+            state['snr'] = snr
+            state['exposurePlan'] = self.exposurePlan
             state['plot'] = plot
             state['spectroSlits_mm'] = spectroSlits
+            state['predictedTravelTime_s'] = travelTime
             state['sample'] = sample
             state['comment'] = comment
             state['date'] = time.strftime('%Y%m%d%H%M%S')
             state['measureTime_s'] = tMeasure
             state['laser_A'] = self.laser
             print(ordered_dump(state))
-            with open(outFilename + ".yaml", 'w') as outfile:
-                outfile.write(ordered_dump(state))
+            result = spectrum.Spectrum(x, y, unit, state)
+            result.write(writer)
+            writer.close()
+            print("Data saved in " + outFilename + ".scan" )
+            if self.catalog is not None and len(x) > 0:
+                A = self.wn2A(x) if unit == 'cm-1' else x
+                covered = [[np.min(A), np.max(A)]]
+                if np.all(limits[:, 1] > limits[:, 0]):  # one entry per range (not the gaps between them)
+                    inRange = [np.all([x>=start, x<=end], axis=0) for start, end in limits]
+                    covered = [[np.min(A[I]), np.max(A[I])] for I in inRange if np.any(I)]
+                files = [outFilename + ".scan"] + self.spectraFiles
+                self.catalog.add(state, files, config=ordered_dump(state), ranges=covered)
         elif detector == 'PMT':
-            x, y = self.measurePMT(positions, accTime=accTime, unit=unit, plot=False)
+            result = self.measurePMT(positions, accTime=accTime, unit=unit, plot=False, sample=sample, comment=comment)
 
         #y = y * nOverlap
         if plot:
             pl.cla()
-            pl.plot(x,y)
+            pl.plot(result.x, np.transpose(result.y))
             pl.xlabel(unit)
 
-        return x, y
+        return result
 
-    def measurePMT(self, positions, accTime=1, unit='cm-1', plot=True):
+    def measurePMT(self, positions, accTime=1, unit='cm-1', plot=True, sample='', comment=''):
         """
         Perform a measurements at positions for accTime (per position)
         Filter data from spikes (if images >=5)
@@ -438,6 +623,8 @@ class Mesure():
             'A', 'cm-1'
         plot
             plot result or not
+        sample, comment
+            recorded in the catalog
         """
         self.log = open("log.txt","w") #opens file with name of "test.txt"
         self.log.write("#position(A), filename" + "\n")
@@ -473,19 +660,25 @@ class Mesure():
             #time.sleep(1)
         
         outFilename = detectorBaseFilename
-        np.savez_compressed(outFilename, x=x, y=y)
-        print("Data saved in " + outFilename + ".npz" )
-        toSave = np.append([x],[y], axis=0).transpose()
-        np.savetxt(outFilename + ".txt", toSave)
-        print("Data saved in " + outFilename + ".txt" )
+        state = {'outFilename': outFilename + ".scan", 'detector': {'name': 'PMT'}, 'unit': unit, 'accTime_s': accTime,
+                 'spectrometer': {'positionOffset': self.spectrometer.positionOffset}, 'laser_A': self.laser,
+                 'Range': [float(np.min(positions)), float(np.max(positions))], 'sample': sample, 'comment': comment,
+                 'date': time.strftime('%Y%m%d%H%M%S')}
+        result = spectrum.Spectrum(x, y, unit, state)
+        with self.writer.scanWriter(outFilename + ".scan") as writer:
+            result.write(writer)
+        print("Data saved in " + outFilename + ".scan" )
 
         self.log.close()
         logFile = outFilename + ".log"
-        shutil.copy("log.txt", logFile)       
+        self.writer.copyFile("log.txt", logFile)
         print("Logfile in    " + logFile )
-        return x, y
+        if self.catalog is not None and len(x) > 0:
+            A = self.wn2A(x) if unit == 'cm-1' else x
+            self.catalog.add(state, [outFilename + ".scan", logFile], np.min(A), np.max(A))
+        return result
 
-    def measure(self, positions, accTime=1, images=False, accumulations=1, unit='cm-1', maskCCD=[175, 1125], plot=True, saveFile=False):
+    def measure(self, positions, accTime=1, images=False, accumulations=1, unit='cm-1', maskCCD=[175, 1125], plot=True, saveFile=False, hardwareROI=True, tracks=None, autoExposure=False, snr=None, writer=None, mergeStep=None):
         """
         Perform a measurements at positions for accTime (per position)
         Filter data from spikes (if images >=5)
@@ -503,6 +696,10 @@ class Mesure():
             number of images per position
             starting at 5, there will be a nice despike feature activated
             if False (default), will guess best value. Total accumulation time per position will be kept to accTime
+            With snr, or self.expectedSignal set, exposure, images, accumulations and 
+            ADC speed are planned for the detector instead (see CCDbackend.planExposure):
+            best SNR with accTime per position (readouts included), or shortest 
+            measurement reaching snr. The ADC speed is restored at the end.
         accumulations
             number of accumulation per image
             The accumulations are done by the camera itself.
@@ -514,12 +711,63 @@ class Mesure():
             first and last valid pixels on the CCD
         plot
             plot result or not
+        hardwareROI
+            True: the CCD only reads maskCCD pixels (binned vertically), 
+            which is faster. The previous ROI is restored at the end.
+            False: the full ROI is read and maskCCD applied afterward
+        tracks
+            rows of each track, measured in the same exposures (see setROI)
+            [[ymin, ymax], [ymin, ymax], ...]
+            y is then (tracks x points)
+        autoExposure
+            True: accTime*images (total time per position) is split in images
+            so the brightest pixel is near saturation (see autoExposure).
+            Saturated windows are measured again with shorter images.
+        snr
+            SNR to reach on self.expectedSignal (if images is False, self.expectedSignal
+            should be set)
+        writer
+            scanFile.ScanWriter (or self.writer.scanWriter): each window (window/x in A, window/y) is appended 
+            as soon as it is measured (see measureRange)
+        saveFile
+            save windows and merged spectrum in <last SPE file>.scan
+            (result.metadata['outFilename'])
+            Changed: measure used to return x, y, outFilename with saveFile,
+            it now returns the Spectrum like without saveFile:
+                result = self.measure(..., saveFile=True)
+                x, y = result
+                outFilename = result.metadata['outFilename']
+        mergeStep
+            step of the merged spectrum (A) (see merge.WindowMerger)
+            None: smallest pixel spacing over all positions (same bins in any order)
+        Windows are merged as they are measured: self.merger.result() gives the
+        spectrum during the measurement. Windows are kept in memory (self.scan, 
+        see spectrum.Scan) only without writer.
+        Returns a spectrum.Spectrum (x, y = self.measure(...) still works)
         """
         self.log = open("log.txt","w") #opens file with name of "test.txt"
         self.log.write("#position(A), filename" + "\n")
 
-        # If images is False, calculate itsbest values for both accTime and images
-        if not images:
+        def despike(y):
+            """Remove spikes of (images x pixels)"""
+            y = spikes.cleanSpikes(y)  # remove spikes (different images)
+            return spikes.removeSpike1D(y, threshold=3, kernelSize=5)  # remove spikes (bad pixels)
+
+        plan = not autoExposure and not images and (snr or self.expectedSignal is not None)
+        if plan and self.expectedSignal is None:
+            raise ValueError('self.expectedSignal is needed for snr')
+
+        changeROI = hardwareROI or tracks is not None
+        if changeROI:
+            previousROI = self.setROI(maskCCD if hardwareROI else None, tracks)
+        if plan:
+            previousAdcSpeed = self.CCD.adcSpeed()[0]
+
+        # If images is False, calculate its best values for both accTime and images (with the ROIs)
+        self.exposurePlan = None
+        if autoExposure:
+            images = images or 1  # minimum, autoExposure adds more
+        elif not images and not plan:
             if accTime <= 60:
                 images = 1
             elif accTime <= 25*60:
@@ -528,8 +776,18 @@ class Mesure():
             else:
                 images = int(np.round(accTime/(5*60)))
                 accTime = accTime/images
-                
-        maskCCD = np.arange(maskCCD[0], maskCCD[1]+1)  # mask for good pixels
+        elif not images:
+            options = {'minImages': self.minImages}
+            if accumulations > 1:
+                options['accumulations'] = (accumulations,)
+            try:
+                self.exposurePlan = self.CCD.planExposure(self.expectedSignal, snr=snr, totalTime=None if snr else accTime, **options)
+                print('Exposure plan: ' + str(self.exposurePlan))
+                accTime = self.exposurePlan['exposure']
+                images = self.exposurePlan['images']
+                accumulations = self.exposurePlan['accumulations']
+            except ValueError:  # accTime too short for the readouts
+                images = 1
         
         #if len(np.array(positions)) > 1:
         #    print("Positions de mesure: " + str(positions))
@@ -541,49 +799,83 @@ class Mesure():
         if len(np.shape(positions)) < 1:  # Special case if there is just one position
             positions = np.array([positions])
         #print(positions)
-        for i in positions:
-            self.CCD.stop()
-            #print("Goto: " + str(i))
-            if unit == 'cm-1':
-                self.wavenumber(i)
-            elif unit == 'A':
-                self.A(i)
-            #self.acquisition()  
-            #time.sleep(accTime + 2)
-            #lastFile = self.getLastFileName()
-            self.index = self.index + 1
-            #print("new measure")
-            detectorBaseFilename = self.baseFilename + '-' + str(self.index)
-            x, y, lastFile = self.CCD.measureSimple(exposureTime=accTime, images=images, accumulations=accumulations, filename=detectorBaseFilename)  # Perform measurement and return the filename of the new file
-            #print(np.shape(x))
-            #print(np.shape(y))
-            #print("lastfile: " + lastFile)
-            message = str(self.spectrometer.posi()) + ", "  + lastFile + "\n"
-            self.log.write(message)
-            realPosition = self.spectrometer.getRealPosition() # Replace that by a getRealPosition in Spectrometer class
+        # Visit positions from the same side (minimise backlash moves)
+        positions = np.asarray(positions)
+        if unit == 'cm-1':
+            positions = positions[U1000.planPath(self.wn2A(positions))]
+        else:
+            positions = positions[U1000.planPath(positions)]
+        # The spectrometer moves to the next window while the current one is processed
+        if unit == 'cm-1':
+            self.wavenumber(positions[0])
+        elif unit == 'A':
+            self.A(positions[0])
+        self.spectraFiles = []
+        self.scan = spectrum.Scan(unit='A')  # raw windows
+        if mergeStep is None:  # from the calibration, before the first window
+            A = self.wn2A(positions) if unit == 'cm-1' else positions
+            mergeStep = merge.minimumStep(self.calibration.pixel2A(np.atleast_1d(A), np.arange(maskCCD[0], maskCCD[1] + 1)))
+        self.merger = merge.WindowMerger(mergeStep)
+        try:
+            if self.exposurePlan is not None:
+                self.CCD.adcSpeed(self.exposurePlan['adcSpeed'])  # restored at the end
+            for n, i in enumerate(positions):
+                self.CCD.stop()
+                #print("Goto: " + str(i))
+                self.spectrometer.wait()  # end of the movement to i
+                #self.acquisition()  
+                #time.sleep(accTime + 2)
+                #lastFile = self.getLastFileName()
+                self.index = self.index + 1
+                #print("new measure")
+                detectorBaseFilename = self.baseFilename + '-' + str(self.index)
+                exposureTime, nImages = accTime, images
+                if autoExposure:
+                    exposureTime, nImages = self.autoExposure(accTime * images, images, accumulations, filename=detectorBaseFilename + '-preview')
+                x, y, lastFile = self.CCD.measureSimple(exposureTime=exposureTime, images=nImages, accumulations=accumulations, filename=detectorBaseFilename)  # Perform measurement and return the filename of the new file
+                while autoExposure and self.saturated(y, accumulations) and exposureTime / 2 >= self.minExposure:
+                    # measure again right away, same total time
+                    exposureTime, nImages = exposureTime / 2, nImages * 2
+                    print('Saturation, exposure: ' + str(exposureTime) + ' s x ' + str(nImages))
+                    x, y, lastFile = self.CCD.measureSimple(exposureTime=exposureTime, images=nImages, accumulations=accumulations, filename=detectorBaseFilename)
+                #print(np.shape(x))
+                #print(np.shape(y))
+                #print("lastfile: " + lastFile)
+                # positions come from the spectrometer motion state model (no serial round trip)
+                message = str(self.spectrometer.posi()) + ", "  + lastFile + "\n"
+                self.log.write(message)
+                self.spectraFiles.append(lastFile)
+                realPosition = self.spectrometer.getRealPosition() # Replace that by a getRealPosition in Spectrometer class
+                if n+1 < len(positions):
+                    self.gotoAsync(positions[n+1], unit)
  
-            #x,y = importSPE.importSPE(lastFile, realPosition, maskCCD=maskCCD)
-            #print(realPosition)
-            x = importSPE.pixel2A(x, realPosition)  # convert unit from pixels to A
-            #Apply mask for good pixels         
-            x, y = importSPE.applyMask(x, y, maskCCD)  # only keep good pixels
-            #print(str(x[0]) + "  " +  str(x[-1]))
+                #x,y = importSPE.importSPE(lastFile, realPosition, maskCCD=maskCCD)
+                #print(realPosition)
+                good = np.where(np.all([x >= maskCCD[0], x <= maskCCD[1]], axis=0))[0]  # x are chip pixels, whatever the ROI
+                pixels = x[good]  # chip pixels of the window (see resample)
+                x = self.calibration.pixel2A(realPosition, pixels)  # convert unit from pixels to A
+                #Apply mask for good pixels         
+                y = y[..., good]  # only keep good pixels
+                #print(str(x[0]) + "  " +  str(x[-1]))
 
-            y = spikes.cleanSpikes(y)  # remove spikes (different images)
-            y = spikes.removeSpike1D(y, threshold=3, kernelSize=5)  # remove spikes (bad pixels)
-            try:
-                xx = np.append(xx, [x], axis=0)
-                yy = np.append(yy, [y], axis=0)
-            except NameError:
-                xx = [x]
-                yy = [y]
-                
-        # export raw data
-        #np.save('dumpX.npy', xx)        
-        #np.save('dumpY.npy', yy)  
-        np.savez('dumpXY.npz', x=xx, y=yy)
-                
-        x,y = testMerge.merge(xx, yy)
+                if np.ndim(y) == 3:  # (images x tracks x pixels): each track is a spectrum
+                    y = np.array([despike(y[:, track]) for track in range(np.size(y, 1))])
+                else:
+                    y = despike(y)
+                if writer is not None:
+                    writer.write('window/x', x, position=realPosition, file=lastFile, pixels=[pixels[0], pixels[-1]])
+                    writer.write('window/y', y, position=realPosition, file=lastFile, pixels=[pixels[0], pixels[-1]])
+                else:  # keep raw data (windows)
+                    self.scan.pixels = pixels
+                    self.scan.append(realPosition, x, y, lastFile)
+                self.merger.add(x, y)
+        finally:
+            if changeROI:
+                self.restoreROI(previousROI)  # even if the measurement is interrupted
+            if plan:
+                self.CCD.adcSpeed(previousAdcSpeed)
+
+        x, y = self.merger.result()  # each track is merged (same positions)
         
         if unit == 'cm-1':
 #            x = 1e8 * (1/self.laser - 1/x)  # convert to A
@@ -591,25 +883,25 @@ class Mesure():
         
         if plot:
             pl.cla()
-            pl.plot(x,y)
+            pl.plot(x, np.transpose(y))
             pl.xlabel(unit)
             #time.sleep(1)
         
+        result = spectrum.Spectrum(x, y, unit, {'unit': unit, 'accTime_s': accTime, 'maskCCD': maskCCD, 'laser_A': self.laser,
+                                                'exposurePlan': self.exposurePlan, 'date': time.strftime('%Y%m%d%H%M%S')})
         if saveFile:
             outFilename = lastFile.replace('.SPE', '')
-            np.savez_compressed(outFilename, x=x, y=y)
-            print("Data saved in " + outFilename + ".npz" )
-            toSave = np.append([x],[y], axis=0).transpose()
-            np.savetxt(outFilename + ".txt", toSave)
-            print("Data saved in " + outFilename + ".txt" )
+            result.metadata['outFilename'] = outFilename + ".scan"
+            with self.writer.scanWriter(outFilename + ".scan") as saved:
+                self.scan.write(saved)  # empty with writer (windows already there)
+                result.write(saved)
+            print("Data saved in " + outFilename + ".scan" )
             
             self.log.close()
             logFile = outFilename + ".log"
-            shutil.copy("log.txt", logFile)       
+            self.writer.copyFile("log.txt", logFile)
             print("Logfile in    " + logFile )
-            return x, y, outFilename
-        else:
-            return x, y
+        return result
 
     def wn2A(self, energy):
         """
@@ -624,23 +916,32 @@ class Mesure():
         return U1000.A2cm1(position, self.laser)
 
         
-    def calibrateOffset(self, referencePosition, approximativeOffset=False):
+    def calibrateOffset(self, referencePosition, approximativeOffset=False, accTime=.1, kind='gaussian', halfWidth=10):
         """
         Calibrate the spectrometer position with a known (strong) peak
         referencePosition    wavelgnth of the peak
+        approximativeOffset  True: find the peak (centroid) without offset first
+                             float: known approximative offset (A)
+                             False: start from no offset
+        kind                 profile fitted on the peak (see peakFit.fit)
+        halfWidth            points on each side of the maximum used in the fit
+        Returns the fit of the peak (see peakFit.fitPeaks)
         """
-        import calibrateSpectrometer as cal 
-        
-        if approximativeOffset:
+        if approximativeOffset is True:
             # Get approximative offset
             self.spectrometer.positionOffset = 0
-            x, y = self.measure(referencePosition, .1, images=5, unit='A')
-            I = y.argmax()
-            readPosition = x[I]
-            approximativeOffset = referencePosition - readPosition
+            x, y = self.measure([referencePosition], accTime, images=5, unit='A', plot=False)
+            amplitude, readPosition, width, offset = peakFit.centroid(x, y)
+            approximativeOffset = referencePosition - readPosition[0]
             
-        self.spectrometer.positionOffset = 0
-        self.spectrometer.positionOffset = cal.getSpectrometerOffset(referencePosition, self, approximativeOffset=approximativeOffset)
+        self.spectrometer.positionOffset = approximativeOffset or 0
+        x, y = self.measure([referencePosition], accTime, images=5, unit='A', plot=False)
+        fit = peakFit.fitPeaks(x, y, [[x[np.argmax(y)]]], halfWidth=halfWidth, kind=kind)
+        readPosition = fit['center'][0, 0]
+        print('read position: ' + str(readPosition) + ' +- ' + str(fit['centerError'][0, 0]) + ' A')
+        self.spectrometer.positionOffset = self.spectrometer.positionOffset + referencePosition - readPosition
+        print('positionOffset: ' + str(self.spectrometer.positionOffset) + ' A')
+        return fit
         
     #Following two function will be used (in future) by the GUI
     #Need to be rewrited to match measureRange
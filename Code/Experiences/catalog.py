@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Catalog (SQLite) of the measurements saved by U1000_scan.Mesure
+
+Every saved scan is recorded with its files, sample, comment, range, unit,
+accumulation time, spectrometer offset, laser and detector state, so scans
+are found without listing folders. It also numbers output files
+(see nextFile) without scanning the folder each time.
+
+ex.:
+    cat = catalog.Catalog('catalog.sqlite')
+    for scan in cat.scans(sample='GaAs', cover=[500, 600], unit='cm-1'):
+        print(scan['outFilename'], scan['date'])
+    cat.files(scan['id'])
+"""
+
+import os
+import re
+import time
+import sqlite3
+import calibration
+
+def highestIndex(folder, base, extension):
+    """
+    Highest n of the files base + <n> + extension in folder (0 if none)
+    """
+    highest = 0
+    pattern = re.compile(re.escape(base) + r'(\d+)' + re.escape(extension) + '$')
+    for name in os.listdir(folder):
+        match = pattern.match(name)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+class Catalog():
+    def __init__(self, filename='catalog.sqlite'):
+        """
+        filename
+            SQLite database (created if needed)
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    folder TEXT, base TEXT, extension TEXT, last INTEGER,
+                    PRIMARY KEY (folder, base, extension));
+                CREATE TABLE IF NOT EXISTS scans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT, outFilename TEXT, sample TEXT, comment TEXT,
+                    detector TEXT, unit TEXT, range TEXT,
+                    xmin_A REAL, xmax_A REAL, xmin_cm1 REAL, xmax_cm1 REAL,
+                    accTime_s REAL, positionOffset REAL, laser_A REAL,
+                    actualTemperature REAL, adcSpeed TEXT, config TEXT);
+                CREATE TABLE IF NOT EXISTS files (
+                    scan INTEGER REFERENCES scans(id), path TEXT, kind TEXT);
+                CREATE TABLE IF NOT EXISTS ranges (
+                    scan INTEGER REFERENCES scans(id),
+                    xmin_A REAL, xmax_A REAL, xmin_cm1 REAL, xmax_cm1 REAL);
+                CREATE INDEX IF NOT EXISTS scansSample ON scans (sample);
+                CREATE INDEX IF NOT EXISTS scansRange ON scans (xmin_cm1, xmax_cm1);
+                CREATE INDEX IF NOT EXISTS filesScan ON files (scan);
+                CREATE INDEX IF NOT EXISTS rangesScan ON ranges (scan);
+                -- catalogs made before the ranges table: one range per scan
+                INSERT INTO ranges SELECT id, xmin_A, xmax_A, xmin_cm1, xmax_cm1 FROM scans
+                    WHERE xmin_A IS NOT NULL AND id NOT IN (SELECT scan FROM ranges);
+                """)
+
+    def close(self):
+        self.connection.close()
+
+    def nextFile(self, folder, base, extension):
+        """
+        next available file in folder of the form base + <number> + extension
+        (same as U1000_scan.nextFile, the folder is only listed the first time)
+        """
+        key = (os.path.abspath(folder), base, extension)
+        with self.connection:
+            row = self.connection.execute('SELECT last FROM counters WHERE folder=? AND base=? AND extension=?', key).fetchone()
+            n = highestIndex(folder, base, extension) + 1 if row is None else row['last'] + 1
+            while os.path.exists(os.path.join(folder, base + str(n) + extension)):  # made outside of the catalog
+                n = n + 1
+            self.connection.execute('INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?)', key + (n,))
+        return base + str(n) + extension
+
+    def add(self, state, files, xmin=None, xmax=None, config=None, ranges=None):
+        """
+        Record a scan, returns its id
+
+        state
+            conditions of the scan (see U1000_scan.Mesure.measureRange)
+        files
+            paths of all the files of the scan
+        xmin, xmax
+            range covered (A)
+        config
+            text of the YAML file
+        ranges
+            [[xmin, xmax], ...] ranges covered (A), for a scan of many ranges
+            (replaces xmin, xmax). scans(cover=...) must fall in one of them.
+        """
+        laser = state.get('laser_A') or None
+        spectrometer = state.get('spectrometer', {})
+        detector = state.get('detector', {})
+        if ranges is None:
+            ranges = [] if xmin is None else [[xmin, xmax]]
+        rows = []
+        for low, high in ranges:
+            low, high = sorted([float(low), float(high)])
+            cm1 = [None, None]
+            if laser:
+                # same conversion as the scan (U1000.A2cm1, air wavelengths)
+                cm1 = sorted(float(calibration.U1000CCD.A2cm1(x, laser)) for x in (low, high))
+            rows.append([low, high] + cm1)
+        # whole span of the scan
+        xmin = xmax = None
+        cm1 = [None, None]
+        if rows:
+            xmin, xmax = min(row[0] for row in rows), max(row[1] for row in rows)
+            if laser:
+                cm1 = [min(row[2] for row in rows), max(row[3] for row in rows)]
+        values = (state.get('date', time.strftime('%Y%m%d%H%M%S')), state.get('outFilename'), state.get('sample', ''),
+                  state.get('comment', ''), detector.get('name'), state.get('unit'), str(state.get('Range')),
+                  xmin, xmax, cm1[0], cm1[1], state.get('accTime_s'), spectrometer.get('positionOffset'), laser,
+                  detector.get('actualTemperature'), detector.get('adcSpeed'), config)
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO scans (date, outFilename, sample, comment, detector, unit, range, '
+                                             'xmin_A, xmax_A, xmin_cm1, xmax_cm1, accTime_s, positionOffset, laser_A, '
+                                             'actualTemperature, adcSpeed, config) VALUES (' + ', '.join('?' * len(values)) + ')', values)
+            scan = cursor.lastrowid
+            self.connection.executemany('INSERT INTO files VALUES (?, ?, ?)',
+                                        [(scan, os.path.abspath(path), os.path.splitext(path)[1].lstrip('.').lower()) for path in files])
+            self.connection.executemany('INSERT INTO ranges VALUES (?, ?, ?, ?, ?)', [[scan] + row for row in rows])
+        return scan
+
+    def scans(self, sample=None, cover=None, unit='cm-1', since=None, until=None):
+        """
+        Scans (list of dict), newest first
+
+        sample
+            name of the sample (SQL LIKE pattern, ex.: 'GaAs%')
+        cover
+            [start, end] that one range of the scan should cover (unit)
+        unit
+            'cm-1', 'A'
+        since, until
+            dates 'YYYYMMDD'
+        """
+        conditions = []
+        arguments = []
+        if sample is not None:
+            conditions.append('sample LIKE ?')
+            arguments.append(sample)
+        if cover is not None:
+            column = {'cm-1': 'cm1', 'A': 'A'}[unit]
+            conditions.append('EXISTS (SELECT 1 FROM ranges WHERE ranges.scan = scans.id'
+                              ' AND ranges.xmin_' + column + ' <= ? AND ranges.xmax_' + column + ' >= ?)')
+            # tolerance: the range is stored in A and converted (rounding)
+            tolerance = 1e-6 * max(abs(min(cover)), abs(max(cover)), 1.)
+            arguments.extend([min(cover) + tolerance, max(cover) - tolerance])
+        if since is not None:
+            conditions.append('date >= ?')
+            arguments.append(str(since))
+        if until is not None:
+            conditions.append('date < ?')
+            arguments.append(str(int(until) + 1))
+        query = 'SELECT * FROM scans'
+        if conditions:
+            query = query + ' WHERE ' + ' AND '.join(conditions)
+        return [dict(row) for row in self.connection.execute(query + ' ORDER BY date DESC, id DESC', arguments)]
+
+    def files(self, scan, kind=None):
+        """
+        Paths of the files of scan (id), kind: extension ('csv', 'yaml', 'spe'...)
+        """
+        query = 'SELECT path FROM files WHERE scan=?'
+        arguments = [scan]
+        if kind is not None:
+            query = query + ' AND kind=?'
+            arguments.append(kind.lower())
+        return [row['path'] for row in self.connection.execute(query, arguments)]
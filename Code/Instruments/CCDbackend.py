@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Interface of a CCD camera, as used by U1000_scan.Mesure
+
+Implementations:
+    WinspecCOM.winspec     Winspec32 through COM (Windows, lab PC)
+    CCDsim.simulatedCCD    simulated camera (any computer)
+
+Frames are (pixels) with one ROI, (tracks x pixels) with many ROIs (see ROIs).
+
+Parameter methods get (no argument) or set (one argument) a parameter.
+Getters return [value, status] (status 0: no error), like Winspec.
+"""
+
+import numpy as np
+import exposurePlanner
+
+class FrameRing():
+    """
+    Ring of preallocated arrays, reused in turn.
+    Steady-state acquisition allocates no new frame arrays.
+    A buffer is overwritten nBuffers acquisitions later: copy it to keep it longer.
+    """
+    def __init__(self, nBuffers, shape, dtype):
+        self.buffers = np.empty((nBuffers,) + tuple(shape), dtype=dtype)
+        self.index = 0
+
+    def next(self):
+        """Next buffer of the ring"""
+        out = self.buffers[self.index]
+        self.index = (self.index + 1) % len(self.buffers)
+        return out
+
+class CCDbackend():
+    # numpy type of the frames for each dataType
+    frameDtype = {'long':np.int32, 'byte':np.uint8, 'int16':np.int16, 'uint16':np.uint16, 'float':np.float32}
+    readOutTime = 0.037  # second
+    # Detector model (see readOutTimeAt, planExposure). Typical values, to be measured on each camera
+    nPixel = 1340  # chip size
+    nRows = 100
+    gain = 1.  # electrons/count
+    darkCurrent = .002  # electrons/pixel/s
+    readNoise = {'100 kHz':3.5, '1 MHz':11.}  # electrons rms per readout
+    fullWell = 65535  # ADC saturation (counts)
+    readOutOverhead = .02  # vertical shifts, transfer... (s per readout)
+    adcRate = {'100 kHz':1e5, '1 MHz':1e6}  # pixels/s
+
+    def __init__(self):
+        # Frame buffers (see FrameRing)
+        self.frameRingSize = 0  # number of reused buffers per frame shape (0: new array for each measurement)
+        self._frameRings = {}
+        # Dark frames subtracted by measureSimple (see darkLibrary.DarkLibrary). None: no subtraction
+        self.darkLibrary = None
+
+    def _frameBuffer(self, shape, dtype, out=None):
+        """
+        Array where frames are written
+        
+        shape
+            (images, pixels) or (images, tracks, pixels)
+        out
+            array given by the user. If None, next buffer of the ring (if
+            self.frameRingSize > 0) or a new array.
+        """
+        if out is not None:
+            if np.shape(out) != tuple(shape):
+                raise ValueError('out should be of shape ' + str(tuple(shape)))
+            return out
+        if self.frameRingSize > 0:
+            key = (tuple(shape), np.dtype(dtype))
+            if key not in self._frameRings:
+                self._frameRings[key] = FrameRing(self.frameRingSize, shape, dtype)
+            return self._frameRings[key].next()
+        return np.empty(shape, dtype=dtype)
+
+    def pixelAxis(self, nPixel):
+        """
+        Chip pixel (0: first pixel of the chip) of each point of a frame
+        Takes the offset and the horizontal binning of the ROI into account
+        (center of the binned pixels).
+        """
+        if not self.useROI()[0]:
+            return np.arange(nPixel)
+        xmin, xmax, xgroup = self.ROI(1)[:3]
+        return xmin - 1 + (xgroup - 1) / 2. + xgroup * np.arange(nPixel)
+
+    def dark(self, exposureTime, accumulations=1):
+        """
+        Dark frame for exposureTime (s), accumulations and the current settings
+        Taken from self.darkLibrary, acquired (and added to it) if missing.
+        """
+        rois = self.ROIs() if self.useROI()[0] else None
+        key = self.darkLibrary.key(exposureTime, accumulations, self.adcSpeed()[0], rois, self.actualTemperature()[0])
+        frame = self.darkLibrary.get(key)
+        if frame is None:
+            frame = self.acquireDark()
+            self.darkLibrary.put(key, frame)
+        return frame
+
+    def acquireDark(self):
+        """
+        Acquire a frame with the shutter closed (current settings)
+        """
+        shutter = self.shutter()[0]
+        self.shutter('closed')
+        try:
+            x, y = self.measure()
+        finally:
+            self.shutter(shutter)
+        return np.array(y, dtype=float)
+
+    def _subtractDark(self, y, exposureTime, accumulations):
+        """
+        Subtract the dark (see dark) from each image of y, in place
+        Nothing is done without darkLibrary or if the camera already removes a background.
+        Integer frames are subtracted in float, rounded and clipped to their range
+        (unsigned: negative values are 0, no wrap around).
+        """
+        if self.darkLibrary is None or self.removeBackground()[0]:
+            return y
+        dark = self.dark(exposureTime, accumulations)
+        if np.issubdtype(y.dtype, np.integer):
+            limits = np.iinfo(y.dtype)
+            difference = np.subtract(y, dark, dtype=float)
+            np.clip(np.rint(difference, out=difference), limits.min, limits.max, out=difference)
+            y[...] = difference
+        else:
+            np.subtract(y, dark, out=y, casting='unsafe')
+        return y
+
+    def _readRois(self):
+        """ROIs read, full chip (fully binned) if ROIs are not used"""
+        if self.useROI()[0]:
+            return self.ROIs()
+        return [[1, self.nPixel, 1, 1, self.nRows, self.nRows]]
+
+    def readOutTimeAt(self, adcSpeed):
+        """
+        Readout time of a frame (s) with the current ROIs at adcSpeed
+        Overhead + digitization of the binned pixels
+        """
+        pixels = sum((xmax - xmin + 1) // xgroup * ((ymax - ymin + 1) // ygroup) for xmin, xmax, xgroup, ymin, ymax, ygroup in self._readRois())
+        return self.readOutOverhead + pixels / self.adcRate[adcSpeed]
+
+    def planExposure(self, signal, snr=None, totalTime=None, peak=None, **options):
+        """
+        Cheapest exposure, images, accumulations and adcSpeed for this camera
+        with the current ROIs (see exposurePlanner.planExposure for options)
+        
+        signal, peak
+            electrons/s in the (binned) pixel of interest, the brightest one
+        snr
+            SNR to reach
+        totalTime
+            time budget, readouts included (s)
+        """
+        xmin, xmax, xgroup, ymin, ymax, ygroup = self._readRois()[0]
+        binned = xgroup * ygroup  # pixels summed in a data point
+        readOutTime = dict((adcSpeed, self.readOutTimeAt(adcSpeed)) for adcSpeed in self.readNoise)
+        return exposurePlanner.planExposure(signal, snr, totalTime, darkCurrent=self.darkCurrent * binned, readNoise=self.readNoise, 
+                                            readOutTime=readOutTime, peak=peak, fullWell=self.fullWell * self.gain, **options)
+
+    def measureSimple(self, exposureTime=1, images=1, accumulations=1, filename=False, singleStart=None, out=None):
+        """
+        Do images measurements
+        Returns pixels, data (images x pixels) and filename
+        data is (images x tracks x pixels) with many ROIs
+        The dark is subtracted if there is a darkLibrary.
+        """
+        raise NotImplementedError
+
+    def measure(self, filename='filename.SPE', out=None):
+        """
+        Do a measurement (one image)
+        Returns pixels, data
+        """
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop current measurement"""
+        raise NotImplementedError
+
+# Acquisition time/images/accumulation
+    def exposure(self, a=None):
+        "exposure"
+        raise NotImplementedError
+
+    def exposureUnit(self, a=None):
+        "exposure unit 'ms', 's', 'min', 'h'"
+        raise NotImplementedError
+
+    def nImages(self, a=None):
+        "number of images"
+        raise NotImplementedError
+
+    def nAccumulations(self, a=None):
+        "number of accumulations"
+        raise NotImplementedError
+
+# ADC
+    def adcSpeed(self, a=None):
+        "ADC speed '100 kHz', '1 MHz'"
+        raise NotImplementedError
+
+# Data type
+    def dataType(self, a=None):
+        "data type 'long', 'byte', 'int16', 'uint16', 'float'"
+        raise NotImplementedError
+
+# ROI
+    def useROI(self, a=None):
+        """Use Roi or not (full chip)"""
+        raise NotImplementedError
+
+    def ROI(self, index=1, newRoi=None):
+        """
+        CCD ROI (region of interest)
+
+        index    index of the ROI 1,2,3...
+        roiList  (xmin, xmax, xgroup, ymin, ymax, ygroup)
+        """
+        rois = self.ROIs()
+        if newRoi is None:
+            return rois[index-1]
+        rois[index-1:index] = [newRoi]  # other ROIs are kept
+        self.ROIs(rois)
+
+    def ROIs(self, newRois=None):
+        """
+        All the ROIs (one track each)
+        
+        newRois
+            [(xmin, xmax, xgroup, ymin, ymax, ygroup), ...] replaces all the ROIs
+            All tracks have the same pixels (xmin, xmax, xgroup).
+        """
+        raise NotImplementedError
+
+    def clearROI(self):
+        raise NotImplementedError
+
+    def nTracks(self):
+        """Number of tracks (spectra) in each frame"""
+        if not self.useROI()[0]:
+            return 1
+        return len(self.ROIs())
+
+    @staticmethod
+    def _checkTracks(rois):
+        """Raise a ValueError if the tracks do not have the same pixels"""
+        if len(set(tuple(int(i) for i in roi[:3]) for roi in rois)) > 1:
+            raise ValueError('All ROIs should have the same xmin, xmax and xgroup')
+
+# Background
+    def removeBackground(self, a=None):
+        """Substract (or not) a background from measurement"""
+        raise NotImplementedError
+
+    def acquireBackground(self):
+        """Acquire the background"""
+        raise NotImplementedError
+
+    def shutter(self, a=None):
+        "shutter 'normal', 'closed', 'open'"
+        raise NotImplementedError
+
+# Temperature
+    def actualTemperature(self, a=None):
+        "actual detector temperature (C)"
+        raise NotImplementedError
+
+    def setTemperature(self, a=None):
+        "detector set temperature (C)"
+        raise NotImplementedError
+
+# Cosmic rays
+    def cosmicMode(self, a=None):
+        "cosmic removal mode 'off', 'temporal', 'spatial'"
+        raise NotImplementedError
+
+    def cosmicSensitivity(self, a=None):
+        "cosmic ray thershold"
+        raise NotImplementedError
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Simulated CCD camera (same interface as WinspecCOM.winspec, see CCDbackend)
+Used to profile and test acquisitions without the lab PC.
+
+Spectra have Poisson (shot) noise, dark current, read noise, bias,
+cosmic rays, saturation and take the time of a real acquisition
+(exposure + readout, see readOutTime).
+
+ex.:
+    spectro = U1000.U1000(sim.port, initDelay=0)
+    ccd = CCDsim.simulatedCCD(position=lambda: spectro.realPosition, calibration=calibration.U1000CCD)
+    x, y, filename = ccd.measureSimple(exposureTime=1, images=5)
+"""
+
+import threading
+import numpy as np
+from CCDbackend import CCDbackend
+
+def neonSpectrum(wavelength):
+    """
+    Default simulated spectrum: few Ne lines over a flat background
+
+    wavelength
+        (A)
+    Returns intensity (electrons/s per pixel, full chip height)
+    """
+    lines = np.array([5400.562, 5852.488, 6402.246, 6929.467])  # A (air)
+    out = 50. + np.zeros(np.shape(wavelength))
+    for line in lines:
+        out = out + 2e4 * np.exp(-(wavelength - line)**2 / (2 * .5**2))
+    return out
+
+class simulatedCCD(CCDbackend):
+    def __init__(self, spectrum=neonSpectrum, position=None, nPixel=1340, nRows=100, bias=600., gain=1., darkCurrent=.002, readNoise={'100 kHz':3.5, '1 MHz':11.}, cosmicRate=.05, fullWell=65535, timeScale=1., seed=None, baseFilename='test', filenameIndex=0, calibration=None):
+        """
+        spectrum
+            function(wavelength (A)) -> electrons/s per pixel
+        position
+            function() -> spectrometer position (A). If None, 5320 A.
+        nPixel, nRows
+            size of the chip
+        bias
+            ADC offset (counts)
+        gain
+            electrons per count
+        darkCurrent
+            electrons/pixel/s (before binning)
+        readNoise
+            electrons rms for each ADC speed
+        cosmicRate
+            mean number of cosmic rays per second of exposure
+        fullWell
+            saturation of the ADC (counts)
+        timeScale
+            multiply acquisition durations (ex.: 0 for instantaneous acquisitions)
+        calibration
+            pixel -> wavelength of the spectrometer (see Utilitaire/calibration.py, 
+            ex.: calibration.U1000CCD). If None, .05 A/pixel around position.
+        """
+        CCDbackend.__init__(self)
+        self.spectrum = spectrum
+        self.position = position
+        self.nPixel = nPixel
+        self.nRows = nRows
+        self.bias = bias
+        self.gain = gain
+        self.darkCurrent = darkCurrent
+        self.readNoise = readNoise
+        self.cosmicRate = cosmicRate
+        self.fullWell = fullWell
+        self.timeScale = timeScale
+        self.readOutOverhead = .02 + nRows * 1e-5  # vertical shift of every row
+        self.random = np.random.default_rng(seed)
+        self.baseFilename = baseFilename
+        self.calibration = calibration
+        self.filenameIndex = filenameIndex
+        self._abort = threading.Event()
+        self._background = None
+        self._params = {'exposure': 1., 'exposureUnit': 's', 'nImages': 1, 'nAccumulations': 1,
+                        'adcSpeed': '100 kHz', 'dataType': 'long', 'useROI': True,
+                        'removeBackground': False, 'filename': baseFilename,
+                        'setTemperature': -100, 'cosmicMode': 'spatial', 'cosmicSensitivity': 50,
+                        'shutter': 'normal'}
+        self._rois = [[1, nPixel, 1, 1, nRows, nRows]]  # (xmin, xmax, xgroup, ymin, ymax, ygroup), full vertical binning
+
+    def _param(self, name, a):
+        """Get (a is None) or set a parameter"""
+        if a is None:
+            return [self._params[name], 0]
+        self._params[name] = a
+        return 0
+
+    @property
+    def readOutTime(self):
+        """
+        Readout time of a frame (s)
+        Vertical shift of every row + digitization of the binned pixels
+        """
+        return self.readOutTimeAt(self._params['adcSpeed'])
+
+    def _exposureTime(self):
+        """Exposure (s)"""
+        return self._params['exposure'] * {'ms':1e-3, 's':1, 'min':60, 'h':3600}[self._params['exposureUnit']]
+
+    def _frame(self, exposure, accumulations, light=True):
+        """
+        Simulate a frame (sum of accumulations)
+        Returns pixels, data (counts), (tracks x pixels) with many ROIs
+        Each track is binned vertically (ymax-ymin+1 rows).
+        """
+        xmin, xmax, xgroup = self._rois[0][:3]
+        pixel = self.pixelAxis((xmax - xmin + 1) // xgroup)
+        rows = np.array([[(ymax - ymin + 1) * xgroup] for xmin, xmax, xgroup, ymin, ymax, ygroup in self._rois])  # pixels binned together
+        electrons = self.darkCurrent * rows * np.ones(len(pixel))
+        if light:
+            position = 5320. if self.position is None else self.position()
+            if self.calibration is None:
+                wavelength = position + .05 * (pixel - self.nPixel / 2)
+            else:
+                wavelength = self.calibration.pixel2A(position, pixel)
+            electrons = electrons + self.spectrum(wavelength) * rows / self.nRows
+        electrons = self.random.poisson(electrons * exposure * accumulations).astype(float)
+        # cosmic rays
+        for i in range(self.random.poisson(self.cosmicRate * exposure * accumulations)):
+            electrons[self.random.integers(len(rows)), self.random.integers(len(pixel))] += self.random.uniform(500, 5000)
+        noise = self.readNoise[self._params['adcSpeed']] * np.sqrt(accumulations)
+        counts = electrons / self.gain + self.bias * accumulations + self.random.normal(0, noise, np.shape(electrons))
+        counts = np.clip(counts, 0, self.fullWell * accumulations)
+        if len(counts) == 1:
+            counts = counts[0]
+        return pixel, counts
+
+    def measureSimple(self, exposureTime=1, images=1, accumulations=1, filename=False, singleStart=None, out=None):
+        """
+        Do images measurements
+        Returns pixels, data (images x pixels) and filename
+        data is (images x tracks x pixels) with many ROIs
+        The dark is subtracted if there is a darkLibrary (see CCDbackend.dark).
+        """
+        if not filename:
+            self.filenameIndex = self.filenameIndex + 1
+            filename = self.baseFilename + '-' + str(self.filenameIndex)
+        self._params.update({'filename': filename, 'exposureUnit': 's', 'exposure': exposureTime, 'nAccumulations': accumulations})
+        y = None
+        for i in range(images):
+            x, frame = self.measure(filename + '-' + str(i+1))
+            if y is None:
+                y = self._frameBuffer((images,) + frame.shape, frame.dtype, out)
+            y[i] = frame
+        self._subtractDark(y, exposureTime, accumulations)
+        return x, y, filename + '.SPE'
+
+    def measure(self, filename='filename.SPE', out=None):
+        """
+        Do a measurement (one image)
+        Returns pixels, data
+        """
+        self._abort.clear()
+        exposure = self._exposureTime()
+        accumulations = self._params['nAccumulations']
+        self._abort.wait((exposure + self.readOutTime) * accumulations * self.timeScale)
+        x, y = self._frame(exposure, accumulations, light=self._params['shutter'] != 'closed')
+        if self._params['removeBackground'] and self._background is not None:
+            y = y - self._background
+        y = y.astype(self.frameDtype[self._params['dataType']])
+        if out is not None:
+            out[...] = y
+            y = out
+        return x, y
+
+    def stop(self):
+        """Stop current measurement"""
+        self._abort.set()
+
+    def acquireBackground(self):
+        """Acquire the background (shutter closed) with current settings"""
+        exposure = self._exposureTime()
+        accumulations = self._params['nAccumulations']
+        self._abort.clear()
+        self._abort.wait((exposure + self.readOutTime) * accumulations * self.timeScale)
+        self._background = self._frame(exposure, accumulations, light=False)[1]
+
+# Parameters
+    def exposure(self, a=None):
+        "exposure"
+        return self._param('exposure', a)
+
+    def exposureUnit(self, a=None):
+        "exposure unit"
+        return self._param('exposureUnit', a)
+
+    def nImages(self, a=None):
+        "number of images"
+        return self._param('nImages', a)
+
+    def nAccumulations(self, a=None):
+        "number of accumulations"
+        return self._param('nAccumulations', a)
+
+    def adcSpeed(self, a=None):
+        "ADC speed"
+        return self._param('adcSpeed', a)
+
+    def dataType(self, a=None):
+        "data type"
+        return self._param('dataType', a)
+
+    def filename(self, a=None):
+        "filename"
+        return self._param('filename', a)
+
+    def removeBackground(self, a=None):
+        """Substract (or not) a background from measurement"""
+        return self._param('removeBackground', a)
+
+    def shutter(self, a=None):
+        "shutter 'normal', 'closed', 'open'"
+        return self._param('shutter', a)
+
+    def actualTemperature(self, a=None):
+        "actual detector temperature (C)"
+        return [self._params['setTemperature'], 0]
+
+    def setTemperature(self, a=None):
+        "detector set temperature (C)"
+        return self._param('setTemperature', a)
+
+    def cosmicMode(self, a=None):
+        "cosmic removal mode"
+        return self._param('cosmicMode', a)
+
+    def cosmicSensitivity(self, a=None):
+        "cosmic ray thershold"
+        return self._param('cosmicSensitivity', a)
+
+# ROI
+    def useROI(self, a=None):
+        """Use Roi or not (full chip)"""
+        if a is not None and not a:
+            self.clearROI()
+        return self._param('useROI', a)
+
+    def ROI(self, index=1, newRoi=None):
+        """
+        CCD ROI (region of interest)
+
+        index    index of the ROI 1,2,3...
+        roiList  (xmin, xmax, xgroup, ymin, ymax, ygroup)
+        """
+        if newRoi is None:
+            return list(self._rois[index-1])
+        else:
+            rois = self.ROIs()
+            rois[index-1:index] = [newRoi]  # other ROIs are kept
+            self.ROIs(rois)
+
+    def ROIs(self, newRois=None):
+        """
+        All the ROIs (one track each)
+        
+        newRois
+            [(xmin, xmax, xgroup, ymin, ymax, ygroup), ...] replaces all the ROIs
+            All tracks have the same pixels (xmin, xmax, xgroup).
+        """
+        if newRois is None:
+            return [list(roi) for roi in self._rois]
+        else:
+            self._checkTracks(newRois)
+            self._rois = [[int(i) for i in roi] for roi in newRois]
+            self._params['useROI'] = True
+
+    def clearROI(self):
+        self._rois = [[1, self.nPixel, 1, 1, self.nRows, self.nRows]]
@@ -12,25 +12,45 @@ Todo:
 
 import serial
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 #import visa
 
 class U1000():
-    def __init__(self, port='/dev/ttyACM0'):  # use serial
+    def __init__(self, port='/dev/ttyACM0', initDelay=2, calibration=None):  # use serial
 #    def __init__(self, ressource='ASRL13::INSTR'):  # use visa
         self.serial = serial.Serial(port)
         self.serial.baudrate = 57600
         self.serial.timeout = 1
+        self.timeout = 1  # deadline for the reply to a query (s)
+        self.moveTimeout = 120  # deadline for the end of a movement (s)
+        self._latency = {}  # round trip statistics of each command
         #self.position = None
-        time.sleep(2)  # time for initialisation of the serial port
+        time.sleep(initDelay)  # time for initialisation of the serial port
         self._positionOffset = 0  # difference between read (spectrometer display) and real wavelength        
                                  # If read=5321, real=5320 then _positionOffset = -1
         #self.position  # is always the read position (spectrometer display) NOT the actual wavelength
         #self.realPosition = self.position - self._positionOffset 
         self.stepIndex = 0  # Steps since last correction
         self._displayPositionInitialised = False  # has the user given the actual display position
+        # Motion state model (display positions). Updated from the 'OK' acknowledgements,
+        # so the instrument is only queried when the model is invalidated.
+        self._commandedPosition = None  # last position sent to the instrument
+        self._position = None  # position confirmed by the instrument (None: unknown)
+        # Asynchronous movements (see gotoAsync)
+        self._lock = threading.RLock()  # serial port is shared with the movement thread
+        self._stops = 0  # number of stop() calls
+        self._moveStops = 0  # stop() calls before the current movement was requested
+        self._mover = ThreadPoolExecutor(max_workers=1)
+        self._move = None  # Future of the last movement
+        self.backlashDelay = .2  # pause between the backlash and the final move (s)
+        # pixel -> wavelength of the camera (see Utilitaire/calibration.py, ex.: calibration.U1000CCDNe)
+        # Mesure gives the one of the scan
+        self.calibration = calibration
         
     def close(self):
+        self._mover.shutdown(wait=True)
         self.serial.close()
         
     def _write(self, arg):
@@ -58,6 +78,7 @@ class U1000():
     @positionOffset.setter
     def positionOffset(self, arg):
         self._positionOffset = float(arg)
+        self.invalidatePosition()
 
     @property
     def realPosition(self):
@@ -73,6 +94,23 @@ class U1000():
     # deprecated, use realPosition
     def getRealPosition(self):
         return self.posi() + self._positionOffset
+
+    def _displayPosition(self):
+        """
+        Display position from the motion state model.
+        The instrument is queried only if the model has been invalidated.
+        
+        :rtype: float
+        """
+        if self._position is None:
+            self._position = float(self._query('posi?'))
+        return self._position
+
+    def invalidatePosition(self):
+        """
+        Forget the known position. Next read will query the instrument.
+        """
+        self._position = None
     
     def _read(self):
         """
@@ -82,20 +120,117 @@ class U1000():
         """
         return self.serial.read(self.serial.inWaiting()).decode(encoding='ascii')
 
-    def _query(self, arg):
+    def _readline(self, deadline, interruptible=False):
+        """
+        Read one reply line from instrument serial port.
+        Returns as soon as the line terminator is received.
+        
+        :param deadline: time (time.time()) after which we stop waiting
+        :type deadline: float
+        :param interruptible: stop() aborts the wait
+        :type interruptible: bool
+        :returns: reply without its terminator
+        :rtype: str
+        """
+        line = b''
+        while not line.endswith(b'\n'):
+            if interruptible and self._stopped():
+                self.invalidatePosition()
+                raise serial.SerialException('U1000 movement stopped')
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.invalidatePosition()
+                raise serial.SerialTimeoutException('U1000 did not reply in time (received ' + repr(line) + ')')
+            self.serial.timeout = remaining
+            line = line + self.serial.read_until(b'\n')
+        return line.decode(encoding='ascii').strip()
+
+    def _readlines(self, deadline, idle=.1):
+        """
+        Read a multi-lines reply from instrument serial port.
+        The reply is considered complete when no new line comes in for idle seconds.
+        
+        :param deadline: time (time.time()) after which we stop waiting
+        :type deadline: float
+        :param idle: silence that ends the reply (s)
+        :type idle: float
+        :rtype: str
+        """
+        out = b''
+        while time.time() < deadline:
+            self.serial.timeout = min(idle, deadline - time.time())
+            t = time.time()
+            line = self.serial.read_until(b'\n')
+            if not line:
+                if time.time() - t < idle / 2:  # read cancelled (see stop), not a silence
+                    continue
+                break
+            out = out + line
+        return out.decode(encoding='ascii')
+
+    def _acknowledge(self, deadline, interruptible=False):
+        """
+        Wait for the 'OK' acknowledgement of the last command
+        
+        :param deadline: time (time.time()) after which we stop waiting
+        :type deadline: float
+        :param interruptible: stop() aborts the wait
+        :type interruptible: bool
+        """
+        while self._readline(deadline, interruptible)[:2] != 'OK':
+            pass
+
+    def _logLatency(self, arg, elapsed):
+        """
+        Accumulate round trip statistics of a command
+        
+        :param arg: command sent (only its first word is used)
+        :type arg: str
+        :param elapsed: round trip time (s)
+        :type elapsed: float
+        """
+        command = arg.split()[0]
+        count, total, maximum, last = self._latency.get(command, (0, 0., 0., 0.))
+        self._latency[command] = (count + 1, total + elapsed, max(maximum, elapsed), elapsed)
+
+    @property
+    def latency(self):
+        """
+        Round trip time of each command sent to the spectrometer (s)
+        
+        :getter: {command: {'count':, 'mean':, 'max':, 'last':}}
+        :type: dict
+        """
+        return {command: {'count': count, 'mean': total/count, 'max': maximum, 'last': last}
+                for command, (count, total, maximum, last) in self._latency.items()}
+
+    def resetLatency(self):
+        """
+        Forget round trip statistics
+        """
+        self._latency = {}
+
+    def _query(self, arg, timeout=None):
         """
         Query instrument parameter
         
         :param arg: Parameter queried
         :type arg: str
+        :param timeout: Deadline for the reply (s). If omited, use self.timeout
+        :type timeout: float
         :rtype: str        
         """
-        self._emptyCache()
-        self._write(arg)
-        time.sleep(.2)
-        return self._read()
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            t = time.time()
+            self._emptyCache()
+            self._write(arg)
+            out = self._readline(t + timeout)
+        self._logLatency(arg, time.time() - t)
+        return out
 
-    def _set(self, param, value):
+    def _set(self, param, value, acknowledge=False):
         """
         Set instrument parameter
         
@@ -103,37 +238,78 @@ class U1000():
         :type param: str
         :param value: Value of the parameter
         :type value: str, float
+        :param acknowledge: Wait for the 'OK' of the instrument
+        :type acknowledge: bool
         """
         #print(param + ' ' + str(value))
-        self._write(param + ' ' + str(value))
+        with self._lock:
+            t = time.time()
+            if acknowledge:
+                self._emptyCache()
+            self._write(param + ' ' + str(value))
+            if acknowledge:
+                self._acknowledge(t + self.timeout)
+                self._logLatency(param, time.time() - t)
         
-    def goto(self, destination, protection=True):
+    def _checkDestination(self, destination, protection=True):
         """
-        Move to another position with a backlash before movement
+        Raise an error if a destination is not valid
         
         :param destination: position to go to (Angtroms)
         :type destination: float
         :param protection: Protects from user foolness
         :type protection: bool
         """
-        
         # Make sure the display position has been setted
         if not self._displayPositionInitialised:   
             raise AssertionError("U1000 display position must be used before: ex.: spectro.displayPosition = 5320")
       
-        self.stepIndex = self.stepIndex + 1
-        if self.stepIndex > 14:
-            self.stepIndex = 0
-            p = self.posi()
-            self.posi(p-0.005)
-        
         if destination<1000 and protection:
             # do nothing (sometimes users enter position in nm instead of A)
             raise ValueError('U1000 goto destination should be in Armstrong. To override: goto(' + str(destination) + ', protection=False)')
         elif destination>10000 and protection:
             # do nothing (sometimes users enter position in nm instead of A)
             raise ValueError('U1000 goto destination should be in Armstrong. U1000 will jam after 9300 A.')
-        else:
+
+    def goto(self, destination, protection=True):
+        """
+        Move to another position with a backlash before movement
+        
+        :param destination: position to go to (Angtroms)
+        :type destination: float
+        :param protection: Protects from user foolness
+        :type protection: bool
+        """
+        self._checkDestination(destination, protection)
+        self._goto(destination, self._stops)
+
+    def _stopped(self):
+        """
+        Has stop() been called since the current movement was requested
+        
+        :rtype: bool
+        """
+        return self._stops != self._moveStops
+
+    def _goto(self, destination, stops):
+        """
+        Movement of goto (also in the thread of gotoAsync)
+        
+        :param destination: position to go to (Angtroms)
+        :type destination: float
+        :param stops: number of stop() calls when the movement was requested.
+                      A stop() before the movement starts cancels it.
+        :type stops: int
+        """
+        with self._lock:
+            self._moveStops = stops
+
+            self.stepIndex = self.stepIndex + 1
+            if self.stepIndex > 14:
+                self.stepIndex = 0
+                p = self.posi()  # from the motion state model
+                self.posi(p-0.005)
+        
             currentPosition = self.getRealPosition()
     #        # Move to reverse direction
     #        if destination > currentPosition:
@@ -147,9 +323,49 @@ class U1000():
             # Move a bit too much
             if destination < currentPosition:
                 self._gotoNoBacklash(destination - 1)
-                time.sleep(.2)
+                time.sleep(self.backlashDelay)
             # Move to final destination
             self._gotoNoBacklash(destination) 
+
+    def gotoAsync(self, destination, protection=True, callback=None):
+        """
+        Start a movement (see goto) and return immediately.
+        Other commands sent to the spectrometer wait for the end of the movement.
+        
+        :param destination: position to go to (Angtroms)
+        :type destination: float
+        :param protection: Protects from user foolness
+        :type protection: bool
+        :param callback: called with the Future when the movement is over
+        :type callback: function
+        :returns: the movement. future.result() waits for it and raises its errors.
+        :rtype: concurrent.futures.Future
+        """
+        self._checkDestination(destination, protection)
+        self._move = self._mover.submit(self._goto, destination, self._stops)
+        if callback is not None:
+            self._move.add_done_callback(callback)
+        return self._move
+
+    def wait(self, timeout=None):
+        """
+        Wait for the end of the last movement started by gotoAsync.
+        Errors of the movement are raised here.
+        
+        :param timeout: maximum wait (s). None: no limit
+        :type timeout: float
+        """
+        if self._move is not None:
+            self._move.result(timeout)
+
+    @property
+    def moving(self):
+        """
+        Is a movement started by gotoAsync still running
+        
+        :type: bool
+        """
+        return self._move is not None and not self._move.done()
     
     def _gotoNoBacklash(self, arg):
         """
@@ -158,22 +374,25 @@ class U1000():
         :param destination: position to go to (Angtroms)
         :type destination: float
         """
-        self._emptyCache()
-        self._write('goto ' + str(arg-self._positionOffset))
-        terminate = False
-        while (self.serial.inWaiting() < 4) and not terminate:
-            time.sleep(.1)
-            if self.serial.inWaiting() == 4:
-                a = self._read()
-                if a[:2] == 'OK':
-                    terminate = True
+        with self._lock:
+            t = time.time()
+            self._emptyCache()
+            self._commandedPosition = float(arg - self._positionOffset)
+            if self._stopped():  # stop() before this part of the movement
+                self.invalidatePosition()
+                raise serial.SerialException('U1000 movement stopped')
+            self._position = None  # unknown while moving
+            self._write('goto ' + str(self._commandedPosition))
+            self._acknowledge(t + self.moveTimeout, interruptible=True)
+            self._position = self._commandedPosition
+        self._logLatency('goto', time.time() - t)
         #self.position = self._query('posi?')
 
     def _emptyCache(self):
         """
         Empty instrument serial port
         """
-        self._read()
+        self.serial.reset_input_buffer()
 
 # displayed position (on physical spectrometer's counter) in Angstroms
     @property
@@ -186,32 +405,27 @@ class U1000():
         :type: float
         """
         assert self._displayPositionInitialised, "U1000 displayPosition not initialised"
-        position = self._query('posi?')
-        #print(position)
-        return float(position)
+        return self._displayPosition()
         
     @displayPosition.setter
     def displayPosition(self, arg):
-        self._set('posi', arg)
+        self._set('posi', arg, acknowledge=True)
+        self._position = float(arg)
         self._displayPositionInitialised = True
         #print(arg)
-        time.sleep(.1)
 
     # Deprecated, use displayPosition
     def posi(self, arg=None):
         if arg is None:
             #self.position = self._query('posi?')
             #print("ici ca marche pas: " + str(self.position))
-            position = self._query('posi?')
-            #print(position)
-            return float(position)
+            return self._displayPosition()
         else: 
             #print('write')
             #print(arg)
-            self._set('posi', arg)
+            self._set('posi', arg, acknowledge=True)
+            self._position = float(arg)
             #print(arg)
-            time.sleep(.1)
-            #print(self._read())  #  purge the OK
             #self.position = self._query('posi?')
             #print(self.position)
 
@@ -239,11 +453,15 @@ class U1000():
             
     def _status(self):
         """
-        Spectrometer internal parameters
+        Spectrometer internal parameters, one per line ('\n' terminated)
         """
-        self._write('PARAM')
-        time.sleep(.6)
-        return self._read()
+        with self._lock:
+            t = time.time()
+            self._emptyCache()
+            self._write('PARAM')
+            first = self._readline(t + self.timeout)  # wait for the beginning of the reply
+            rest = self._readlines(t + self.timeout)
+        return ''.join(line.strip() + '\n' for line in [first] + rest.splitlines() if line.strip())
     
     @property
     def speedFast(self):
@@ -267,11 +485,33 @@ class U1000():
         else:
             self._set('speed', arg)     
     
+    def travelTime(self, positions, currentPosition=None):
+        """
+        Predicted time to visit positions, in order, with goto
+        (speeds are read once from the instrument)
+        
+        :param positions: positions to visit (Angtroms)
+        :type positions: numpy array
+        :param currentPosition: start position (Angtroms). If omited, use current one.
+        :type currentPosition: float
+        :rtype: float
+        """
+        if currentPosition is None:
+            currentPosition = self.realPosition
+        return travelTime(positions, self.speedSlow, self.speedFast, currentPosition, self.backlashDelay)
+    
     def stop(self):
         """
         Stop movement immediately
+        (also interrupts a movement started by gotoAsync)
         """
-        self._write('stop')
+        self._stops = self._stops + 1
+        self._write('stop')  # not locked: the movement thread holds the port
+        if hasattr(self.serial, 'cancel_read'):
+            self.serial.cancel_read()  # wake up the movement thread
+        with self._lock:  # the movement thread has given up the port
+            self._readlines(time.time() + self.timeout)  # reply to stop (must not end a later reply)
+        self.invalidatePosition()
         
     def pixel2A(self, position = None):
         """
@@ -279,26 +519,15 @@ class U1000():
         (This works only for the Si CCD already installed on the spectrometer.)
         
         :param position: Position of the spectrometer (Angtroms). If omited, use current one.
-        :type position: float
-        :returns: Wavelength of each pixels
+        :type position: float, numpy array
+        :returns: Wavelength of each pixels, (positions x pixels) for many positions
         :rtype: numpy array        
         """
+        if self.calibration is None:
+            raise ValueError('No calibration, see U1000(calibration=...)')
         if position is None:
-            position = self._query('posi?')
-
-        # Parametres prit integralement de la version Matlab 
-        #        dv = 2.341131e-001;
-        #        fact = 1.812402816604375e-004;
-        # Parametres ajustes sur des mesures sur le pic Ne @ 6929.4673 
-        dv = 0.19583658
-        fact = 1.812402816604375e-004  # Fixe
-        dispersion = 1e7 / 3.6e6 * np.cos(np.asin(fact*position/2)+dv/2) / 50
-
-        a = position - dispersion * 670
-        x = np.arange(1340)
-        x = a + dispersion * x
-        #x = claser - 1e8 / x / n_air
-        return x
+            position = self.realPosition
+        return self.calibration.pixel2A(position)
         
     def pixel2wavenumber(self, laser, position = None):
         """
@@ -308,8 +537,8 @@ class U1000():
         :param laser: Wavelgnth of the laser (Angtroms). 
         :type laser: float
         :param position: Position of the spectrometer (Angtroms). If omited, use current one.
-        :type position: float
-        :returns: Wavenumbers (cm-1) for each pixel
+        :type position: float, numpy array
+        :returns: Wavenumbers (cm-1) for each pixel, (positions x pixels) for many positions
         :rtype: numpy array        
         """
         n_air = 1.00028  #indice de refraction de l'air
@@ -318,6 +547,70 @@ class U1000():
         x = claser - 1e8 / (x * n_air)
         return x
     
+def moveTime(distance, speedSlow, speedFast, slowDistance=1.):
+    """
+    Predicted duration of a single movement (no backlash)
+    The last slowDistance Angtroms are done at speedSlow, the remaining at speedFast.
+    
+    :param distance: length of the movement (Angtroms)
+    :type distance: float, numpy array
+    :param speedSlow: approach speed (Angtroms/s)
+    :type speedSlow: float
+    :param speedFast: speed far from the destination (Angtroms/s)
+    :type speedFast: float
+    :param slowDistance: length of the approach (Angtroms)
+    :type slowDistance: float
+    :returns: duration (s)
+    :rtype: float, numpy array
+    """
+    distance = np.abs(distance)
+    slow = np.minimum(distance, slowDistance)
+    return slow / speedSlow + (distance - slow) / speedFast
+
+def planPath(positions):
+    """
+    Order positions to be measured so that they are all approached from below.
+    goto makes a backlash move each time it goes down, an ascending path
+    makes at most one (before the first position).
+    
+    :param positions: positions (Angtroms). May be a list of arrays (many ranges),
+                      they are concatenated.
+    :type positions: numpy array, list
+    :returns: index that orders the (concatenated) positions
+    :rtype: numpy array
+    """
+    if isinstance(positions, (list, tuple)):
+        positions = np.hstack([np.atleast_1d(p) for p in positions])
+    positions = np.atleast_1d(positions)
+    return np.argsort(positions, kind='stable')
+
+def travelTime(positions, speedSlow, speedFast, currentPosition, backlashDelay=.2, backlash=1.):
+    """
+    Predicted time to visit positions, in order, with U1000.goto
+    
+    :param positions: positions to visit (Angtroms)
+    :type positions: numpy array
+    :param speedSlow: approach speed (Angtroms/s)
+    :type speedSlow: float
+    :param speedFast: speed far from the destination (Angtroms/s)
+    :type speedFast: float
+    :param currentPosition: start position (Angtroms)
+    :type currentPosition: float
+    :param backlashDelay: pause after a backlash move (s)
+    :type backlashDelay: float
+    :param backlash: overshoot of a backlash move (Angtroms)
+    :type backlash: float
+    :returns: duration (s)
+    :rtype: float
+    """
+    positions = np.atleast_1d(np.asarray(positions, dtype=float))
+    previous = np.append(currentPosition, positions[:-1])
+    down = positions < previous  # these need a backlash move
+    # going down: overshoot to position - backlash, pause, then come back up
+    first = np.where(down, previous - (positions - backlash), positions - previous)
+    t = moveTime(first, speedSlow, speedFast) + down * (backlashDelay + moveTime(backlash, speedSlow, speedFast))
+    return float(np.sum(t))
+
 # deprecated, see cm12A
 def cibleram(wavenumber, laser):
     return cm12A(wavenumber, laser)
@@ -335,7 +628,7 @@ def cm12A(wavenumber, laser):
     """   
     n_air = 1.00028  #air refraction index
     claser = 1e8*n_air/laser
-    spectro = 1e8*n_air/(claser-wavenumber)
+    spectro = 1e8*n_air/(claser-np.asarray(wavenumber))
     return spectro          
 
 def A2cm1(wavelength, laser):
@@ -350,5 +643,5 @@ def A2cm1(wavelength, laser):
     :rtype: float        
     """   
     n_air = 1.00028  #air refraction index
-    return 1e8 * n_air *  (1/laser - 1/wavelength)
+    return 1e8 * n_air *  (1/laser - 1/np.asarray(wavelength))
 
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Simulates the U1000 spectrometer (and its Arduino) on a pseudo-terminal,
+so U1000.py can be used without the instrument (Linux, Mac).
+
+ex.:
+    sim = U1000sim.U1000Simulator(speedSlow=2, speedFast=20)
+    spectro = U1000.U1000(sim.port, initDelay=0)
+    spectro.displayPosition = 5320
+    spectro.goto(5400)
+    print(spectro.latency)
+    spectro.close()
+    sim.close()
+
+Protocol (commands end with \\r\\n, replies too):
+    goto X    move to X, reply OK at the end of the movement
+    posi X    set counter to X, reply OK
+    posi?     reply counter position
+    SLOW X    set approach speed (A/s), no reply
+    SLOW?     reply approach speed
+    speed X   set fast speed (A/s), no reply
+    speed?    reply fast speed
+    PARAM     reply internal parameters (many lines)
+    stop      abort movement (no OK for the aborted goto)
+"""
+
+import os
+import pty
+import tty
+import select
+import random
+import threading
+import time
+import U1000
+
+class U1000Simulator():
+    def __init__(self, position=5320., speedSlow=2., speedFast=20., backlash=0., jitter=0., timeScale=1., seed=None):
+        """
+        position
+            initial counter position (A)
+        speedSlow, speedFast
+            movement speeds (A/s), see U1000.moveTime
+        backlash
+            dead band of the mechanics (A). After moving down, the grating lags
+            backlash A above the counter until it moves up again.
+        jitter
+            standard deviation of movement durations (s)
+        timeScale
+            multiply every movement duration (ex.: 0 for instantaneous movements)
+        seed
+            seed of the jitter random generator
+        """
+        self.position = float(position)  # counter position
+        self.grating = float(position)  # actual position of the grating
+        self.speedSlow = float(speedSlow)
+        self.speedFast = float(speedFast)
+        self.backlash = float(backlash)
+        self.jitter = float(jitter)
+        self.timeScale = float(timeScale)
+        self.random = random.Random(seed)
+        self.commands = []  # history of received commands
+        self._move = None  # (t0, t1, start, destination) of the current movement
+        self._pending = []  # commands received during a movement
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)  # no echo, no line translation
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _reply(self, arg):
+        os.write(self._master, bytes(str(arg), encoding='ascii') + b'\r\n')
+
+    def _currentPosition(self):
+        """Counter position, interpolated during a movement"""
+        if self._move is None:
+            return self.position
+        t0, t1, start, destination = self._move
+        fraction = 1. if t1 <= t0 else min(1., (time.time() - t0) / (t1 - t0))
+        return start + fraction * (destination - start)
+
+    def _startMove(self, destination):
+        start = self.position
+        duration = U1000.moveTime(destination - start, self.speedSlow, self.speedFast)
+        if self.jitter:
+            duration = abs(duration + self.random.gauss(0, self.jitter))
+        t0 = time.time()
+        self._move = (t0, t0 + duration * self.timeScale, start, destination)
+
+    def _endMove(self, position):
+        start = self._move[2]
+        self._move = None
+        if position > start:
+            self.grating = position
+        elif position < start:
+            self.grating = position + self.backlash
+        self.position = position
+
+    def _execute(self, line):
+        words = line.split()
+        if not words:
+            return
+        command = words[0]
+        if command == 'stop':
+            if self._move is not None:
+                self._endMove(self._currentPosition())
+        elif command == 'posi?':
+            self._reply('%.4f' % self._currentPosition())
+        elif self._move is not None:
+            self._pending.append(line)  # Arduino is busy
+        elif command == 'goto':
+            self._startMove(float(words[1]))
+        elif command == 'posi':
+            self.position = float(words[1])
+            self.grating = self.position
+            self._reply('OK')
+        elif command == 'SLOW?':
+            self._reply(self.speedSlow)
+        elif command == 'SLOW':
+            self.speedSlow = float(words[1])
+        elif command == 'speed?':
+            self._reply(self.speedFast)
+        elif command == 'speed':
+            self.speedFast = float(words[1])
+        elif command == 'PARAM':
+            self._reply('position ' + str(self.position))
+            self._reply('SLOW ' + str(self.speedSlow))
+            self._reply('speed ' + str(self.speedFast))
+
+    def _serve(self):
+        buffer = b''
+        while self._running:
+            timeout = .05
+            if self._move is not None:
+                timeout = max(0, min(timeout, self._move[1] - time.time()))
+            ready = select.select([self._master], [], [], timeout)[0]
+            if ready:
+                buffer = buffer + os.read(self._master, 1024)
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    line = line.decode(encoding='ascii').strip()
+                    self.commands.append(line)
+                    self._execute(line)
+            if self._move is not None and time.time() >= self._move[1]:
+                self._endMove(self._move[3])
+                self._reply('OK')
+                pending, self._pending = self._pending, []
+                for line in pending:
+                    self._execute(line)
+
+if __name__ == '__main__':
+    import numpy as np
+    sim = U1000Simulator(speedSlow=2, speedFast=20)
+    spectro = U1000.U1000(sim.port, initDelay=0)
+    spectro.displayPosition = 5320
+    positions = np.arange(5330, 5400, 7.)
+    print('Predicted: ' + str(round(spectro.travelTime(positions), 2)) + ' s')
+    t = time.time()
+    for p in positions:
+        spectro.goto(p)
+    print('Measured:  ' + str(round(time.time() - t, 2)) + ' s')
+    print(spectro.latency)
+    spectro.close()
+    sim.close()
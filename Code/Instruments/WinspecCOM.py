@@ -46,6 +46,7 @@ Created on Wed Sep  9 15:04:23 2015
 import comtypes.client as cc
 import comtypes.gen.WINX32Lib as WinSpecLib
 import time
+import threading
 import win32com.client as w32c
 #from win32com.client import constants
 
@@ -53,9 +54,11 @@ import win32com.client as w32c
 from ctypes import c_long
 #import types 
 import numpy as np
+from CCDbackend import CCDbackend
 
-class winspec:
+class winspec(CCDbackend):
     def __init__(self, baseFilename='test', filenameIndex=0):
+        CCDbackend.__init__(self)
         cc.GetModule( ('{1A762221-D8BA-11CF-AFC2-508201C10000}', 3, 11))  # comes from regedit (look for IWinx32App2), major version, minor version
         w32c.pythoncom.CoInitialize()
         self.WinspecDoc = w32c.Dispatch("WinX32.DocFile")
@@ -64,8 +67,17 @@ class winspec:
         # For measurement filename        
         self.baseFilename = baseFilename
         self.filenameIndex = filenameIndex
+        self._paramCache = {}  # {param: value} see experimentParam
+        self._roiCache = {}  # {index: roi} see ROI
         self.initialConfiguration()
         self.readOutTime = 0.037  # second
+        self.singleStart = True  # measureSimple takes all images in a single experiment
+        # End of acquisition detection (see _run)
+        self.pollInterval = .01  # polling period near the end of the acquisition (s)
+        self.pollMargin = .05  # polling starts this long before the expected end (s)
+        self.acquisitionDone = threading.Event()  # set at the end of each experiment
+        self.onAcquisitionDone = None  # function(status) called at the end of each experiment
+        self._abort = threading.Event()
 
     def initialConfiguration(self):
         """
@@ -76,66 +88,104 @@ class winspec:
         self.setTemperature(-100)
         self.dataType('long')
 
-    def measureSimple(self, exposureTime=1, images=1, accumulations=1, filename=False):
+    def measureSimple(self, exposureTime=1, images=1, accumulations=1, filename=False, singleStart=None, out=None):
         """
+        Do images measurements
+        Returns pixels, data (images x pixels) and filename
+        data is (images x tracks x pixels) with many ROIs (see ROIs)
+        The dark is subtracted if there is a darkLibrary (see CCDbackend.dark).
         
+        singleStart
+            True: all images are taken in a single experiment (nImages)
+            False: one experiment per image
+            None (default): use self.singleStart
+        out
+            array (images x pixels) or (images x tracks x pixels) where data is written
+            If None, use the ring of buffers (see frameRingSize) or allocate a new array
         """
         #print(filename)
         if not filename:
             self.filenameIndex = self.filenameIndex + 1
             filename = self.baseFilename + '-' + str(self.filenameIndex)
+        if singleStart is None:
+            singleStart = self.singleStart
 #        import time
 #        time.sleep(.5)
 #        time.sleep(.5)
         #print(filename)
-        self.filename(filename)  # set measurement outpur file
-        self.exposureUnit('s')  # set exposure unit
-        self.exposure(exposureTime)  # set exposure time
-        self.nAccumulations(accumulations)
+        # set measurement output file, exposure unit, exposure time, accumulations
+        # (unchanged parameters are not sent to Winspec)
+        self.applyParams({'filename': filename, 'exposureUnit': 's', 'exposure': exposureTime, 'nAccumulations': accumulations})
 #        import time
 #        print(self.nImages())
 #        print(self.nImages())
 #            self.nImagesTest(images)  # set number of images
 
-        #TODO preallocation de x et y pour accelerer l'acquisition        
-        
-        i = 0
-        x, y = self.measure(filename + '-1')
-        for i in np.arange(2, images+1):
-            xtemp, ytemp = self.measure(filename + '-' + str(i))  # start measurement
-#            y = np.concatenate((y, ytemp))
-            y = np.vstack((y, ytemp))
-            
         # y will be of dimension (image, sizeOfDetector)
-        # This is neaded for images=1
-        y = np.atleast_2d(y)
+        # Frames are written directly in y (allocated when the frame size is known)
+        y = None
+        i = 0  # images already acquired
+        if singleStart and images > 1:
+            self.nImages(images)
+            if self._run(images):
+                # Some Winspec versions ignore EXP_SEQUENTS, get what was really acquired
+                nFrames = min(images, int(self.WinspecDoc.GetParam(WinSpecLib.DM_NUMFRAMES)[0]))
+                for i in range(nFrames):
+                    if y is None:
+                        frame = self._getFrame(i + 1)
+                        y = self._frameBuffer((images,) + frame.shape, frame.dtype, out)
+                        y[i] = frame
+                    else:
+                        self._getFrame(i + 1, out=y[i])
+                i = nFrames
+            self.nImages(1)
+        for i in range(i, images):
+            if y is None:
+                x, frame = self.measure(filename + '-' + str(i+1))  # start measurement
+                y = self._frameBuffer((images,) + frame.shape, frame.dtype, out)
+                y[i] = frame
+            else:
+                self.measure(filename + '-' + str(i+1), out=y[i])  # start measurement
+        x = self.pixelAxis(np.size(y, -1))
+        self._subtractDark(y, exposureTime, accumulations)
         
         return x, y, filename + '.SPE'
 
     def stop(self):
         """Stop current measurement"""        
         self.WinspecExpt.Stop()
-        
-    def measure(self, filename='filename.SPE'):
+        self._abort.set()  # wake up _run
+
+    def _run(self, images=1):
         """
-        Do a measurement.
+        Start an experiment and wait for its end
+        Returns True if it was started
         
-        filename
-            
+        images
+            number of images of the experiment (used for the time limit)
         """
         self.stop()
+        self._abort.clear()
+        self.acquisitionDone.clear()
         if self.WinspecExpt.Start(self.WinspecDoc)[0]: # start the experiment
+            t = time.time()
             # Wait for acquisition to finish (and check for errors continually)
             # If we didn't care about errors, we could just run WinspecExpt.WaitForExperiment()
         
             expt_is_running, status = self.isRunning()
         
-            maxElapsed = (self.readOutTime + self.exposure()[0]) * self.nAccumulations()[0] + 15
-            t = time.time()
+            exposure = self.exposure()[0] * {'ms':1e-3, 's':1, 'min':60, 'h':3600}[self.exposureUnit()[0]]
+            expected = (self.readOutTime + exposure) * self.nAccumulations()[0] * images
+            maxElapsed = expected + 15
+            # Sleep until the acquisition is nearly done (check for errors every few seconds)
+            while expt_is_running and status == 0 and time.time() - t < expected - self.pollMargin:
+                self._abort.wait(min(5, expected - self.pollMargin - (time.time() - t)))
+                expt_is_running, status = self.isRunning()
+            # then poll tightly
 #            endNow = False
             #while expt_is_running and status == 0 and not endNow:
             while expt_is_running and status == 0:
-                time.sleep(.1)
+                time.sleep(self.pollInterval)
                 expt_is_running, status = self.isRunning()
                 #print(expt_is_running + " " + status)
                 elapsed = time.time() - t
@@ -147,41 +197,75 @@ class winspec:
         
             if status != 0:
                 print('MsgBox ("Error running experiment.")')
+            self.acquisitionDone.set()
+            if self.onAcquisitionDone is not None:
+                self.onAcquisitionDone(status)
+            return True
+        else:
+            print("Could not initiate acquisition.")
+            self.invalidateParams()  # maybe changed in Winspec
+            return False
+
+    def _getFrame(self, index=1, out=None):
+        """
+        Get a frame of the last experiment
+        The frame is converted once to the dtype of dataType (or of out)
         
-            # Save the file from winspec
-            # self.WinspecDoc.SaveAs(filename)        
+        index
+            frame number (1, 2, 3...)
+        out
+            array where the frame is written. If None, return a new array.
+        """
+        # Save the file from winspec
+        # self.WinspecDoc.SaveAs(filename)        
 
-            # The remaining plot data by reading directly from winspec
-            """ Pass a pointer to Winspec so it can put the spectrum in a place in
-                memory where python will be able to find it. """
-#            datapointer = c_float()
+        # The remaining plot data by reading directly from winspec
+        """ Pass a pointer to Winspec so it can put the spectrum in a place in
+            memory where python will be able to find it. """
+#        datapointer = c_float()
 # test 13 janvier 2016 pour faire fonctionner nAccumulations
-            datapointer = c_long()
-            y = self.WinspecDoc.GetFrame( 1, datapointer )  # seems to return just the first frame
-            #calibration = WinspecDoc.GetCalibration()
-            #if calibration.Order != 2:
-            #    raise ValueError('Cannot handle current winspec wavelength calibration...')
-            #import numpy as np
-            #print(np.shape(y))
-                
-            """ Winspec doesn't actually store the wavelength information as an array but
-                instead calculates it every time you plot using the calibration information
-                stored with the spectrum. """
-            #p = pylab.array([ calibration.PolyCoeffs(2),
-            #                  calibration.PolyCoeffs(1),
-            #                  calibration.PolyCoeffs(0) ])
+        datapointer = c_long()
+        y = self.WinspecDoc.GetFrame( index, datapointer )
+        #calibration = WinspecDoc.GetCalibration()
+        #if calibration.Order != 2:
+        #    raise ValueError('Cannot handle current winspec wavelength calibration...')
+            
+        """ Winspec doesn't actually store the wavelength information as an array but
+            instead calculates it every time you plot using the calibration information
+            stored with the spectrum. """
+        #p = pylab.array([ calibration.PolyCoeffs(2),
+        #                  calibration.PolyCoeffs(1),
+        #                  calibration.PolyCoeffs(0) ])
+    
+        #wavelen = pylab.polyval( p, xrange( 1, 1+len(spectrum) ) )
+        # win32com gives a sequence of Python numbers: convert it in a single pass
+        if out is None:
+            frame = np.squeeze(np.asarray(y, dtype=self.frameDtype[self.dataType()[0]]))
+            if frame.ndim == 2:  # many ROIs: Winspec gives (pixels x tracks)
+                frame = frame.T
+            return np.ascontiguousarray(frame)
+        # out seen as (pixels x tracks), like y
+        view = np.atleast_2d(out).T
+        if len(y) != len(view):
+            raise ValueError('out has ' + str(len(view)) + ' pixels, the frame ' + str(len(y)))
+        view[...] = np.asarray(y, dtype=out.dtype).reshape(view.shape)
+        return out
         
-            #wavelen = pylab.polyval( p, xrange( 1, 1+len(spectrum) ) )
+    def measure(self, filename='filename.SPE', out=None):
+        """
+        Do a measurement.
+        Returns pixels, data (pixels) or (tracks x pixels) with many ROIs
         
-            #pylab.plot( y )
-            #pylab.show()   
+        filename
             
-            x = np.arange(0, len(y))
+        out
+            array where the frame is written. If None, return a new array.
+        """
+        if self._run():
+            y = self._getFrame(1, out)  # first frame
+            x = self.pixelAxis(np.size(y, -1))
             
-            return x, np.squeeze(y)
-        
-        else:
-            print("Could not initiate acquisition.")
+            return x, y
 #
 #    def loadConfig(self, filename):
 #       self.WinspecExpt.Load(filename)
@@ -210,36 +294,76 @@ class winspec:
     def getParam(self, param):
         """Get an internal winspec variable"""
         result, status = self.WinspecExpt.GetParam(param)
+        if status != 0:  # Winspec state is not what we think
+            self.invalidateParams()
         return result, status
         
     def setParam(self, param, value):
         """Set an internal winspec variable"""
+        self._paramCache.pop(param, None)
         return self.WinspecExpt.SetParam(param, value)
+
+    def invalidateParams(self):
+        """
+        Forget cached parameters (see experimentParam)
+        Use it if parameters have been changed in Winspec itself.
+        """
+        self._paramCache = {}
+        self._roiCache = {}
+
+    def applyParams(self, params):
+        """
+        Set many parameters in one pass. Unchanged parameters are skipped.
+        
+        params
+            {name: value} where name is a parameter method
+            ex.: {'exposureUnit': 's', 'exposure': 2, 'nAccumulations': 1}
+            (applied in this order)
+        """
+        for name, value in params.items():
+            getattr(self, name)(value)
          
     class experimentParam(object):
-        """This class is used as a decorator to get/set internal variables"""
-        def __init__(self, value, dic=None):
+        """
+        This class is used as a decorator to get/set internal variables
+        
+        Values are cached (write-through): reads are served from memory and
+        setting the current value does nothing. volatile parameters
+        (changed by Winspec itself, ex.: actual temperature) are always read.
+        A value refused by Winspec (status not 0) is not cached.
+        The cache is forgotten when Winspec reports an error (status not 0,
+        experiment not started) or by invalidateParams (after changing
+        parameters in Winspec by hand).
+        """
+        def __init__(self, value, dic=None, volatile=False):
             #pass
             self.value = value
             self.dic = dic
+            self.volatile = volatile
+            if dic is not None:
+                self.DictInvert = dict([(v, k) for k, v in dic.items()])
             
         def __call__(self, original_func):
             decorator_self = self
             def wrappee( *args, **kwargs): 
                 param = decorator_self.value
                 valueDict = decorator_self.dic
-                if valueDict is not None:
-                    DictInvert = dict([(v, k) for k, v in valueDict.items()])
                 #param = self.value
                 #print(param)
                 #print('in decorator before wrapee with flag ',param)
                 obj = original_func(*args,**kwargs)
+                cache = obj._paramCache
                 if len(args) == 1:
                     #print("get parameter", param)
-                    out =  list(obj.getParam(param))
+                    if decorator_self.volatile or param not in cache:
+                        out =  list(obj.getParam(param))
+                        if out[1] == 0 and not decorator_self.volatile:
+                            cache[param] = out[0]
+                    else:
+                        out = [cache[param], 0]
                     #print(out)
                     if valueDict is not None:
-                        out[0] = DictInvert[out[0]]
+                        out[0] = decorator_self.DictInvert[out[0]]
                     return out
                 else:
                     #print("set parameter", param, "=", args[1])
@@ -248,8 +372,12 @@ class winspec:
                     if valueDict is not None:
                         value = valueDict[value]
                     #    out = DictInvert[out]
+                    if not decorator_self.volatile and param in cache and cache[param] == value:
+                        return 0  # nothing to do
                     out =  obj.setParam(param, value)
                     #print(out)
+                    if not out:  # status 0: accepted (setParam forgot the old value)
+                        cache[param] = value
                     
                     return out
     
@@ -269,9 +397,14 @@ class winspec:
     def acquireBackground(self):
         """Acquire the background"""
         self.WinspecExpt.AcquireBackground()
+
+    @experimentParam(WinSpecLib.EXP_SHUTTER_CONTROL, {'normal':1, 'closed':2, 'open':3})
+    def shutter(self, a=None):
+        """Shutter 'normal', 'closed' (darks) or 'open'"""
+        return self
     
 # Temperature 
-    @experimentParam(WinSpecLib.EXP_ACTUAL_TEMP)
+    @experimentParam(WinSpecLib.EXP_ACTUAL_TEMP, volatile=True)
     def actualTemperature(self, a=None):
         "actual detector temperature (C)"
         return self
@@ -303,7 +436,7 @@ class winspec:
         """do filename increment (or not)"""
         return self
         
-    @experimentParam(WinSpecLib.EXP_FILEINCCOUNT)
+    @experimentParam(WinSpecLib.EXP_FILEINCCOUNT, volatile=True)
     def filenameIncrementCount(self, a=None):
         """current file increment index"""
         return self
@@ -332,7 +465,7 @@ class winspec:
         "exposure unit"
         return self
         
-    #This doesn't seem to work
+    #This doesn't seem to work (on some versions, measureSimple checks DM_NUMFRAMES)
     @experimentParam(WinSpecLib.EXP_SEQUENTS)
     def nImages(self, a=None):
         "number of images"
@@ -411,18 +544,45 @@ class winspec:
         roiList  (xmin, xmax, xgroup, ymin, ymax, ygroup)
         """
         if newRoi is None:
-            roiClass = self.WinspecExpt.GetROI(index)  
-            roiList = roiClass.Get()
-            return [int(i) for i in [roiList[1], roiList[3], roiList[4], roiList[0], roiList[2], roiList[5]]]
+            if index not in self._roiCache:
+                roiClass = self.WinspecExpt.GetROI(index)  
+                roiList = roiClass.Get()
+                self._roiCache[index] = [int(i) for i in [roiList[1], roiList[3], roiList[4], roiList[0], roiList[2], roiList[5]]]
+            return list(self._roiCache[index])
+        else:
+            rois = self.ROIs()
+            rois[index-1:index] = [newRoi]  # other ROIs are kept
+            self.ROIs(rois)
+
+    def ROIs(self, newRois=None):
+        """
+        All the ROIs (one track each)
+        
+        newRois
+            [(xmin, xmax, xgroup, ymin, ymax, ygroup), ...] replaces all the ROIs
+            All tracks have the same pixels (xmin, xmax, xgroup).
+        """
+        if newRois is None:
+            rois = []
+            while True:
+                try:
+                    rois.append(self.ROI(len(rois) + 1))
+                except Exception:  # no more ROI (COM error)
+                    return rois
         else:
-            self.clearROI()  # have to clear all ROIs because it create a new one. have not found how to just replace one
+            self._checkTracks(newRois)
+            self.clearROI()  # have to clear all ROIs because SetROI create a new one. have not found how to just replace one
             self.useROI(True)  # clear automaticaly put in full chip. So we need to but it back to ROI
-            roiClass = self.WinspecROI
-            roiClass.Set(newRoi[3], newRoi[0], newRoi[4], newRoi[1], newRoi[2], newRoi[5])
-            self.WinspecExpt.SetROI(roiClass)  
+            for roi in newRois:
+                roiClass = self.WinspecROI
+                roiClass.Set(roi[3], roi[0], roi[4], roi[1], roi[2], roi[5])
+                self.WinspecExpt.SetROI(roiClass)  
+            self._roiCache = dict((i + 1, [int(j) for j in roi]) for i, roi in enumerate(newRois))
             
     def clearROI(self):
         self.WinspecExpt.ClearROIs()
+        self._roiCache = {}
+        self._paramCache.pop(WinSpecLib.EXP_USEROI, None)  # full chip
         
 #Timing
 #   DM_SHUTTERCONTROL  ?
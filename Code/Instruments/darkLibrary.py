@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+On-disk library of CCD dark frames (shutter closed)
+
+A dark depends on the exposure, the accumulations, the ADC speed, the ROIs
+(binning) and the detector temperature. Darks are kept between sessions
+(one .npy file each) and forgotten after maxAge.
+
+Used by CCDbackend.measureSimple (see CCDbackend.darkLibrary):
+    ccd.darkLibrary = darkLibrary.DarkLibrary('darks', maxAge=24*3600)
+    x, y, filename = ccd.measureSimple(exposureTime=1, images=5)  # dark subtracted
+"""
+
+import os
+import time
+import hashlib
+import numpy as np
+
+class DarkLibrary():
+    def __init__(self, folder='darks', maxAge=7*24*3600., temperatureStep=2.):
+        """
+        folder
+            where dark frames are saved
+        maxAge
+            darks older than this are acquired again (s)
+        temperatureStep
+            darks are shared by temperatures in the same bucket (C)
+        """
+        self.folder = folder
+        self.maxAge = maxAge
+        self.temperatureStep = temperatureStep
+        self._darks = {}  # {filename: (time, frame)} already read
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.evict()
+
+    def key(self, exposureTime, accumulations, adcSpeed, rois, temperature):
+        """
+        Identify a dark
+
+        exposureTime
+            (s)
+        rois
+            list of (xmin, xmax, xgroup, ymin, ymax, ygroup), None for full chip
+        temperature
+            actual detector temperature (C)
+        """
+        if rois is not None:
+            rois = tuple(tuple(int(i) for i in roi) for roi in rois)
+        bucket = int(np.round(temperature / self.temperatureStep))
+        return (round(float(exposureTime), 6), int(accumulations), str(adcSpeed), rois, bucket)
+
+    def _filename(self, key):
+        return os.path.join(self.folder, 'dark-' + hashlib.sha1(repr(key).encode('ascii')).hexdigest()[:16] + '.npy')
+
+    def get(self, key):
+        """
+        Dark frame of key, None if it is not in the library (or too old)
+        """
+        filename = self._filename(key)
+        if not os.path.isfile(filename):
+            self._darks.pop(filename, None)
+            return None
+        date = os.path.getmtime(filename)
+        if time.time() - date > self.maxAge:
+            self._remove(filename)
+            return None
+        if filename not in self._darks or self._darks[filename][0] != date:
+            self._darks[filename] = (date, np.load(filename))
+        return self._darks[filename][1]
+
+    def put(self, key, frame):
+        """
+        Add (or replace) the dark frame of key
+        """
+        filename = self._filename(key)
+        frame = np.array(frame, dtype=float)
+        np.save(filename, frame)
+        self._darks[filename] = (os.path.getmtime(filename), frame)
+
+    def _remove(self, filename):
+        self._darks.pop(filename, None)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def evict(self, maxAge=None):
+        """
+        Remove darks older than maxAge (s) (default: self.maxAge)
+        """
+        if maxAge is None:
+            maxAge = self.maxAge
+        now = time.time()
+        for name in os.listdir(self.folder):
+            filename = os.path.join(self.folder, name)
+            if name.startswith('dark-') and name.endswith('.npy') and now - os.path.getmtime(filename) > maxAge:
+                self._remove(filename)
+
+    def clear(self):
+        """Remove all darks"""
+        self.evict(-1)
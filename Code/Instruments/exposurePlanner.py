@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Choose exposure, images, accumulations and ADC speed of a CCD measurement
+
+Noise of a pixel after frames = images x accumulations readouts of exposure t:
+    signal  S t frames
+    noise   sqrt((S + D) t frames + frames R**2)
+S signal, D dark current (electrons/s), R read noise (electrons rms).
+Each readout also costs a readout time, which depends on the ADC speed.
+
+Either the shortest measurement reaching a SNR, or the best SNR in a time budget.
+
+ex.:
+    import exposurePlanner
+    plan = exposurePlanner.planExposure(signal=50, snr=100, darkCurrent=.2,
+                                        readNoise={'100 kHz':3.5, '1 MHz':11.},
+                                        readOutTime={'100 kHz':.035, '1 MHz':.022})
+    plan['exposure'], plan['images'], plan['accumulations'], plan['adcSpeed']
+"""
+
+import numpy as np
+
+def signalToNoise(signal, darkCurrent, readNoise, exposure, frames):
+    """
+    Signal to noise ratio of the sum of frames readouts of exposure (s)
+
+    signal, darkCurrent
+        electrons/s in the pixel
+    readNoise
+        electrons rms per readout
+    """
+    integration = exposure * frames
+    return signal * integration / np.sqrt((signal + darkCurrent) * integration + frames * readNoise**2)
+
+def planExposure(signal, snr=None, totalTime=None, darkCurrent=0., readNoise={'100 kHz':3.5}, readOutTime={'100 kHz':.035}, peak=None, fullWell=65535., fraction=.8, minImages=5, maxImages=100, accumulations=(1, 2, 5, 10), minExposure=1e-3, maxExposure=300.):
+    """
+    Cheapest (exposure, images, accumulations, adcSpeed) of a measurement
+    Give snr (shortest measurement reaching it) or totalTime (best SNR within it).
+    Returns {'exposure', 'images', 'accumulations', 'adcSpeed', 'snr', 'time'}
+
+    signal
+        electrons/s in the pixel of interest (weakest feature to measure)
+    snr
+        SNR to reach
+    totalTime
+        time budget, readouts included (s)
+    darkCurrent
+        electrons/s in the (binned) pixel
+    readNoise, readOutTime
+        {adcSpeed: electrons rms per readout}, {adcSpeed: s per readout}
+    peak
+        electrons/s in the brightest pixel. The exposure is limited to
+        fraction of fullWell (electrons). None: no limit
+    minImages
+        5 for despiking (see spikes.cleanSpikes), 1 without
+    accumulations
+        allowed numbers of accumulations per image
+    """
+    if (snr is None) == (totalTime is None):
+        raise ValueError('Give snr or totalTime')
+    maxExp = maxExposure
+    if peak is not None and peak > 0:
+        maxExp = min(maxExp, fraction * fullWell / peak)
+    images = np.arange(minImages, maxImages + 1)
+    best = None
+    for adcSpeed in readNoise:
+        R = readNoise[adcSpeed]
+        ro = readOutTime[adcSpeed]
+        for A in accumulations:
+            frames = images * A
+            if snr is not None:
+                # integration time (exposure x frames) needed for snr (quadratic in it)
+                s2 = snr**2
+                integration = (s2 * (signal + darkCurrent) + np.sqrt(s2**2 * (signal + darkCurrent)**2 + 4 * signal**2 * s2 * frames * R**2)) / (2 * signal**2)
+                exposure = np.maximum(integration / frames, minExposure)
+                ok = exposure <= maxExp
+            else:
+                exposure = np.minimum(totalTime / frames - ro, maxExp)
+                ok = exposure >= minExposure
+                exposure = np.maximum(exposure, minExposure)  # not ok anyway
+            if not np.any(ok):
+                continue
+            time = frames * (exposure + ro)
+            quality = signalToNoise(signal, darkCurrent, R, exposure, frames)
+            # shortest time for a snr, best snr for a budget
+            i = np.argmin(np.where(ok, time, np.inf)) if snr is not None else np.argmax(np.where(ok, quality, -np.inf))
+            candidate = {'exposure': float(exposure[i]), 'images': int(images[i]), 'accumulations': int(A),
+                         'adcSpeed': adcSpeed, 'snr': float(quality[i]), 'time': float(time[i])}
+            if best is None or (candidate['time'] < best['time'] if snr is not None else candidate['snr'] > best['snr']):
+                best = candidate
+    if best is None:
+        raise ValueError('No exposure possible (time budget too short or signal saturates)')
+    return best
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Write files in a thread, so saving never stops the acquisition
+
+Writes are put in a bounded queue and done in order by one thread. When the
+queue is full (storage slower than the measurement for a long time), the
+acquisition waits (see blockedTime) instead of using all the memory.
+An error of the thread is raised at the next call (submit, flush or close).
+close waits for all the writes (also called at the end of python).
+
+fsync
+    'never'  leave it to the operating system
+    'close'  (default) files are on the disk when they are closed
+    'always' after each record (slow, safest)
+
+ex.:
+    writer = backgroundWriter.BackgroundWriter(maxsize=16, fsync='close')
+    scan = writer.scanWriter('261018-1.scan', compression='zlib')
+    scan.write('window/y', y, position=5320.1)  # returns immediately
+    scan.close()
+    writer.copyFile('log.txt', '261018-1.log')
+    writer.flush()  # everything is written
+    writer.close()
+"""
+
+import os
+import time
+import atexit
+import threading
+import queue
+import numpy as np
+import scanFile
+
+class BackgroundWriter():
+    def __init__(self, maxsize=16, fsync='close'):
+        """
+        maxsize
+            writes waiting in the queue before submit blocks
+        fsync
+            'never', 'close', 'always'
+        """
+        if fsync not in ('never', 'close', 'always'):
+            raise ValueError("fsync should be 'never', 'close' or 'always'")
+        self.fsync = fsync
+        self.blockedTime = 0.  # time (s) spent waiting for a place in the queue
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                function, args, kwargs = task
+                function(*args, **kwargs)
+            except Exception as error:
+                if self._error is None:  # the first one is raised, the other files are still written
+                    self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs) in the thread (in order)
+        Arguments should not be modified afterward (not copied)
+        """
+        self._raise()
+        if self._closed:
+            raise IOError('BackgroundWriter is closed')
+        t = time.time()
+        self._queue.put((function, args, kwargs))  # back-pressure
+        self.blockedTime = self.blockedTime + time.time() - t
+
+    def flush(self):
+        """Wait until everything submitted is written"""
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        """Write everything, then stop the thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            atexit.unregister(self.close)
+        self._raise()
+
+    def pending(self):
+        """Number of writes waiting"""
+        return self._queue.qsize()
+
+    def scanWriter(self, filename, compression=None, level=6):
+        """
+        scanFile.ScanWriter which writes in the thread (same methods)
+        """
+        return _BackgroundScanWriter(self, filename, compression, level)
+
+    def copyFile(self, source, destination):
+        """
+        Copy source to destination. source is read now (it can be modified
+        afterward, ex.: log.txt of the next measurement)
+        """
+        with open(source, 'rb') as f:
+            data = f.read()
+        self.submit(self._writeFile, destination, data)
+
+    def _writeFile(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+            if self.fsync != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+
+def _sync(writer):
+    writer.flush()
+    os.fsync(writer.file.fileno())
+
+class _BackgroundScanWriter():
+    def __init__(self, background, filename, compression=None, level=6):
+        if compression not in (None, 'zlib'):
+            raise ValueError('compression should be None or zlib')
+        self.background = background
+        self.filename = filename
+        self._writer = None
+        background.submit(self._open, filename, compression, level)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self, filename, compression, level):
+        self._writer = scanFile.ScanWriter(filename, compression=compression, level=level)
+
+    def _do(self, method, *args, **kwargs):
+        getattr(self._writer, method)(*args, **kwargs)
+        if self.background.fsync == 'always':
+            _sync(self._writer)
+
+    def write(self, name, array, **attrs):
+        """see scanFile.ScanWriter.write (array is copied: it can be reused)"""
+        self.background.submit(self._do, 'write', name, np.array(array), **attrs)
+
+    def writeMetadata(self, metadata):
+        """see scanFile.ScanWriter.writeMetadata"""
+        self.background.submit(self._do, 'writeMetadata', dict(metadata))
+
+    def flush(self):
+        self.background.submit(self._do, 'flush')
+
+    def _close(self):
+        if self.background.fsync != 'never':
+            _sync(self._writer)
+        self._writer.close()
+
+    def close(self):
+        self.background.submit(self._close)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Pixel -> wavelength calibration of a spectrometer + camera
+
+One Calibration object holds the fit parameters of the dispersion, the
+refraction index of air and the camera geometry.
+Pixel axes of each spectrometer position are memoised (LRU cache).
+Many positions are converted at once: positions (windows) x pixels.
+
+ex.:
+    import calibration
+    x = calibration.U1000CCD.pixel2A(np.array([5300, 5320, 5340]))  # (3, 1340) A
+    x = calibration.U1000CCD.pixel2wavenumber(positions, laser=5145)  # cm-1
+
+Todo:
+    Trivista
+"""
+
+import functools
+import numpy as np
+
+class Calibration():
+    # Changing one of these empties the cache of pixel axes
+    _parameters = ('fact', 'dv', 'groove', 'focal', 'stage', 'nPixel', 'centerPixel')
+
+    def __init__(self, fact=1.812402816604375e-004, dv=2.341131e-001, groove=1800, focal=1000, stage=2, nPixel=1340, centerPixel=None, nAir=1.00028, cacheSize=4096):
+        """
+        fact, dv
+            fit parameters of the dispersion
+        groove
+            grating groove density (groove/mm)
+        focal
+            focal length (mm)
+        stage
+            number of stages
+        nPixel
+            number of pixels of the camera
+        centerPixel
+            pixel at the spectrometer position. If None, center of the camera.
+        nAir
+            air refraction index
+        cacheSize
+            number of pixel axes kept in memory
+        """
+        self._axis = functools.lru_cache(maxsize=cacheSize)(self.__axis)
+        self.fact = fact
+        self.dv = dv
+        self.groove = groove
+        self.focal = focal
+        self.stage = stage
+        self.nPixel = nPixel
+        if centerPixel is None:
+            centerPixel = round(nPixel/2)
+        self.centerPixel = centerPixel
+        self.nAir = nAir
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self._parameters:
+            self._axis.cache_clear()
+
+    def dispersion(self, position):
+        """
+        Dispersion of the spectrometer (A/pixel)
+
+        position
+            position of the spectrometer (A), float or array
+        """
+        return 1e7/(self.groove * self.focal * self.stage) * np.cos(np.arcsin(self.fact*np.asarray(position)/2)+self.dv/2)/50
+
+    def __axis(self, position):
+        axis = self.dispersion(position) * (np.arange(self.nPixel) - self.centerPixel) + position
+        axis.flags.writeable = False  # shared by every caller
+        return axis
+
+    def axis(self, position):
+        """
+        Wavelength (A) of every pixel of the camera for a spectrometer position (memoised)
+        The returned array is read only.
+
+        position
+            position of the spectrometer (A)
+        """
+        return self._axis(float(position))
+
+    def pixel2A(self, position, pixel=None):
+        """
+        Convert pixel index to wavelength (A)
+
+        position
+            position of the spectrometer (A)
+            float: returns an array like pixel
+            array (windows): returns an array (windows x pixels)
+        pixel
+            pixel indexes. If None, every pixel of the camera.
+        """
+        position = np.asarray(position, dtype=float)
+        if position.ndim == 0:
+            if pixel is None:
+                return self.axis(position).copy()
+            pixel = np.asarray(pixel)
+            if pixel.dtype.kind in 'iu' and np.all((pixel >= 0) & (pixel < self.nPixel)):
+                return self.axis(position)[pixel]  # from the cache
+        elif pixel is None:
+            pixel = np.arange(self.nPixel)
+        disper = self.dispersion(position)
+        return disper[..., np.newaxis] * (pixel - self.centerPixel) + position[..., np.newaxis]
+
+    def pixel2wavenumber(self, position, laser, pixel=None):
+        """
+        Convert pixel index to (relative) wavenumber (cm-1)
+
+        position
+            position of the spectrometer (A), float or array (windows)
+        laser
+            wavelength of the laser (A)
+        pixel
+            pixel indexes. If None, every pixel of the camera.
+        """
+        return self.A2cm1(self.pixel2A(position, pixel), laser)
+
+    def A2cm1(self, wavelength, laser):
+        """
+        (relative) Wavenumber (cm-1) corresponding to a Wavelength (A)
+        """
+        return 1e8 * self.nAir * (1/laser - 1/np.asarray(wavelength))
+
+    def cm12A(self, wavenumber, laser):
+        """
+        Wavelength (A) corresponding to a (relative) wavenumber (cm-1)
+        """
+        claser = 1e8*self.nAir/laser
+        return 1e8*self.nAir/(claser-np.asarray(wavenumber))
+
+# U1000 with the Si CCD
+# Parametres prit integralement de la version Matlab (importSPE)
+U1000CCD = Calibration(fact=1.812402816604375e-004, dv=2.341131e-001, groove=1800, focal=1000, stage=2, nPixel=1340)
+# Parametres ajustes sur des mesures sur le pic Ne @ 6929.4673 (ancien U1000.pixel2A)
+# Choisir avec U1000_scan.Mesure(calibration=...), utilise pour la mesure et U1000.pixel2A
+U1000CCDNe = Calibration(fact=1.812402816604375e-004, dv=0.19583658, groove=1800, focal=1000, stage=2, nPixel=1340)
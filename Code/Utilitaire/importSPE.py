@@ -3,7 +3,8 @@
 @author: Colin-N. Brosseau
 
 Read data from .spe file
-Convert pixel -> wavelength (U1000)
+Convert pixel -> wavelength (U1000) (see calibration.py)
+Import many .spe files at once in a single array file (see importFolder)
 
 Todo:
         remove pixel->wavelength from this file !
@@ -12,8 +13,15 @@ Todo:
 	document code
 """
 
-from readSPE import PrincetonSPEFile
+import os
+import re
+import glob
+import csv
+import warnings
+import concurrent.futures
 import numpy as np
+import calibration
+from readSPE import PrincetonSPEFile
 
 def test():
     import pylab as pl
@@ -44,35 +52,38 @@ def importSPE(filename, centralWavelength, maskCCD=[175, 1125]):
     """
     Import .spe file and calculate corresponding wavelength
     """
-    x, y, accTime = readSPE(filename)  # import raw data from file
+    x, y, accTime = readSPE(filename, maskCCD)  # import raw data from file (only good pixels)
     x = pixel2A(x, centralWavelength)  # convert unit from pixels to A
-    maskCCD = np.arange(maskCCD[0], maskCCD[1]+1)  # mask for good pixels
-    x, y = applyMask(x, y, maskCCD)  # only keep good pixels
     return x, y
     
 
-def readSPE(filename):
+def readSPE(filename, maskCCD=None):
+    """
+    Returns pixels, data (frames x pixels) and accumulation time
+    data is (frames x tracks x pixels) with many tracks
+
+    maskCCD
+        first and last chip pixels to read, None: all
+    """
     data = PrincetonSPEFile(filename)
-    y = np.squeeze(data.getData(), axis=1)
-    #y = y.T
-    x = np.arange(0,np.size(y, 1))
+    pixels = slice(None) if maskCCD is None else data.pixelRange(maskCCD[0], maskCCD[1])
+    x = data.pixels()[pixels]
+    y = np.array(data.getData(pixels=pixels))  # only read these pixels
+    if data.ydim == 1:
+        y = np.squeeze(y, axis=1)
     accTime = data.getAccumulationTime()
+    data.close()
     return x, y, accTime
 
 def pixel2A(pixel, positionSpectrometer, nameSpectrometer='U1000', errorSpectro=0, cameraName='CCD'):
     """
     Convert from pixel index to wavenumber (A)
+    positionSpectrometer can be an array (windows), then returns (windows x pixels)
+    (see calibration.Calibration)
    """
-    #indexAir = 1.00029  # index of refraction of air
-    disper = dispersion(positionSpectrometer, nameSpectrometer)
-    #centerPixel = round(len(pixel)/2)
-    centerPixel = round(numberPixel(cameraName=cameraName)/2)
-    #print(centerPixel)
-    #print(errorSpectro)
-    A = disper * (pixel - centerPixel) + positionSpectrometer + errorSpectro
-    #print(A[centerPixel])
-    #return A * indexAir
-    return A  # A vérifier
+    if nameSpectrometer == 'U1000' and cameraName == 'CCD':
+        return calibration.U1000CCD.pixel2A(np.asarray(positionSpectrometer) + errorSpectro, pixel)
+    return np.nan * np.asarray(pixel)
 
 def dispersion(positionSpectrometer, nameSpectrometer='U1000'):
     """
@@ -81,21 +92,124 @@ def dispersion(positionSpectrometer, nameSpectrometer='U1000'):
     disper = np.nan
 
     if nameSpectrometer == 'U1000':
-        # Parametres prit integralement de la version Matlab 
-        fact = 1.812402816604375e-004  # (A)
-        dv = 2.341131e-001  # (B)
-        # Parametres fites sur des mesures sur le pic Ne @ 6929.4673 
-        #fact = 1.812402816604375e-004  # Fixe (A)
-        #dv = 0.19583658  # (B)
-        #fact = 1.28884458661e-09  # Fixe (A)
-        #dv = 1.55055761919  # (B)
-        groove = 1800  # groove/mm
-        focal = 1000  # focal length (mm)
-        stage = 2  # number of stages
-        disper = 1e7/(groove * focal * stage) * np.cos(np.arcsin(fact*positionSpectrometer/2)+dv/2)/50
+        disper = calibration.U1000CCD.dispersion(positionSpectrometer)
 
     return disper
 
 def numberPixel(cameraName):
     if cameraName == 'CCD':
         return 1340
+
+def readLog(filename='log.txt'):
+    """
+    Spectrometer position of each measurement, from a log of U1000_scan.Mesure
+    Returns {measurement name (without .SPE): position (A)}
+    """
+    positions = {}
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('#') or ',' not in line:
+                continue
+            position, name = line.split(',', 1)
+            name = os.path.basename(name.strip())
+            positions[os.path.splitext(name)[0]] = float(position)
+    return positions
+
+def _logPosition(filename, positions):
+    """Position of a file <base>-<n>.SPE or <base>-<n>-<i>.SPE (one image), None if not logged"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if name not in positions:
+        name = name.rsplit('-', 1)[0]
+    return positions.get(name)
+
+def _readFile(filename, maskCCD):
+    """Worker of importFolder (one process)"""
+    x, y, accTime = readSPE(filename, maskCCD)
+    return x, y.astype(np.float32)
+
+def importFolder(files, output, log='log.txt', maskCCD=None, positionOffset=0., processes=None):
+    """
+    Import many .spe files (ex.: a day of measurements) in one array file
+    Files are read in parallel (processes), pixels converted to A with the 
+    spectrometer positions of the log.
+    
+    files
+        directory (all its .SPE files), glob pattern or list of files
+    output
+        name of the array files (see loadFolder):
+            output.npy          data (spectra x pixels), float32, NaN padded
+                                (one spectrum per frame and track)
+            output-x.npy        A (files x pixels)
+            output-index.csv    one line per file (position, exposure, spectra...)
+    log
+        log file(s) of the positions (see readLog), list for many logs
+    maskCCD
+        first and last pixels to import (only these are read), None: all
+    positionOffset
+        added to the logged positions (see U1000.positionOffset)
+    Returns index (list of dict), x, data
+    Files missing from the log are imported with a NaN position (and x), with a warning.
+    """
+    if isinstance(files, str):
+        if os.path.isdir(files):
+            files = glob.glob(os.path.join(files, '*.SPE')) + glob.glob(os.path.join(files, '*.spe'))
+        else:
+            files = glob.glob(files)
+    files = sorted(set(files), key=lambda name: [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', name)])  # -2 before -10
+    positions = {}
+    for filename in ([log] if isinstance(log, str) else log):
+        positions.update(readLog(filename))
+
+    # Headers first: size of the array file
+    index = []
+    spectra = 0
+    nPixel = 0
+    missing = []
+    for filename in files:
+        spe = PrincetonSPEFile(filename)
+        pixels = slice(None) if maskCCD is None else spe.pixelRange(maskCCD[0], maskCCD[1])
+        n = len(spe.pixels()[pixels])
+        position = _logPosition(filename, positions)
+        if position is None:
+            missing.append(os.path.basename(filename))
+            position = np.nan
+        index.append({'file': filename, 'position_A': position + positionOffset,
+                      'exposure_s': spe.exposure, 'accumulations': spe.accumulations, 'temperature_C': spe.temperature,
+                      'frames': spe.nFrames, 'tracks': spe.ydim, 'firstSpectrum': spectra, 'pixels': n})
+        spectra = spectra + spe.nFrames * spe.ydim
+        nPixel = max(nPixel, n)
+        spe.close()
+    if missing:
+        warnings.warn('No position in the log for ' + ', '.join(missing) + ' (position_A and x are NaN)')
+
+    data = np.lib.format.open_memmap(output + '.npy', mode='w+', dtype=np.float32, shape=(spectra, nPixel))
+    x = np.full((len(files), nPixel), np.nan)
+    # Files are written as they are read, never all in memory
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        for i, (pixel, y) in enumerate(pool.map(_readFile, files, [maskCCD] * len(files))):
+            first = index[i]['firstSpectrum']
+            y = y.reshape(-1, np.shape(y)[-1])
+            data[first:first+len(y), :np.shape(y)[1]] = y
+            data[first:first+len(y), np.shape(y)[1]:] = np.nan
+            x[i, :len(pixel)] = pixel2A(pixel, index[i]['position_A'])
+    data.flush()
+    np.save(output + '-x.npy', x)
+    with open(output + '-index.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(index[0].keys()) if index else ['file'])
+        writer.writeheader()
+        writer.writerows(index)
+    return index, x, data
+
+def loadFolder(output):
+    """
+    Load the files of importFolder (data is memory mapped)
+    Returns index (list of dict), x, data
+    Spectra of file i are data[index[i]['firstSpectrum']:][:frames*tracks], A are x[i]
+    """
+    with open(output + '-index.csv', newline='') as f:
+        index = list(csv.DictReader(f))
+    for record in index:
+        for key in record:
+            if key != 'file':
+                record[key] = float(record[key]) if key in ('position_A', 'exposure_s', 'temperature_C') else int(record[key])
+    return index, np.load(output + '-x.npy'), np.load(output + '.npy', mmap_mode='r')
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Merge overlapping windows (CCD) into one spectrum
+
+Windows are added one at a time. Each point falls in a bin of a common axis
+(width step, centered on multiples of step), where its position and intensity
+are summed (np.bincount). The merged spectrum is the mean of each bin that
+received points, available at any time. Memory only depends on the range
+covered (not on the number of windows).
+
+The bins do not depend on the order of the windows when step is given (ex.:
+the smallest pixel spacing of the whole scan, see minimumStep). step no
+larger than the pixel spacing puts at most one point of a window in a bin.
+
+ex.:
+    merger = merge.WindowMerger()
+    for position in positions:
+        x, y = ...                  # one window (A), y: pixels or (tracks x pixels)
+        merger.add(x, y)
+    x, y = merger.result()          # also during the scan
+    x, y = merge.merge(xx, yy)      # all windows at once (step: minimumStep(xx))
+"""
+
+import numpy as np
+
+class WindowMerger():
+    def __init__(self, step=None, origin=0.):
+        """
+        step
+            width of the bins (same unit as x)
+            None: pixel spacing of the first window (depends on the order
+            of the windows if the spacing changes, see minimumStep)
+        origin
+            center of a bin
+        """
+        self.step = step
+        self.origin = origin
+        self.first = 0  # bin of the first element of the arrays
+        self.sumX = None  # (bins)
+        self.sumY = None  # (tracks x bins)
+        self.counts = None  # (bins)
+        self.tracks = None  # None: y of one track (1-D)
+        self.windows = 0
+
+    def _reserve(self, low, high):
+        """Arrays cover bins low to high (included)"""
+        if self.counts is None:
+            size = high - low + 1
+            self.first = low
+            self.sumX = np.zeros(size)
+            self.sumY = np.zeros((self.tracks or 1, size))
+            self.counts = np.zeros(size, dtype=np.int64)
+            return
+        size = len(self.counts)
+        last = self.first + size - 1
+        if low >= self.first and high <= last:
+            return
+        # at least double, on the side that grows (few reallocations for a long scan)
+        first = min(low, self.first - size) if low < self.first else self.first
+        newLast = max(high, last + size) if high > last else last
+        start = self.first - first
+        sumX = np.zeros(newLast - first + 1)
+        sumX[start:start + size] = self.sumX
+        sumY = np.zeros((len(self.sumY), len(sumX)))
+        sumY[:, start:start + size] = self.sumY
+        counts = np.zeros(len(sumX), dtype=np.int64)
+        counts[start:start + size] = self.counts
+        self.first, self.sumX, self.sumY, self.counts = first, sumX, sumY, counts
+
+    def add(self, x, y):
+        """
+        Add a window
+
+        x
+            position of the points (pixels)
+        y
+            intensity (pixels) or (tracks x pixels)
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        tracks = None if y.ndim == 1 else len(y)
+        if self.windows == 0:
+            self.tracks = tracks
+        elif tracks != self.tracks:
+            raise ValueError('All windows should have the same number of tracks')
+        y = np.reshape(y, (-1, len(x)))
+        if self.step is None:
+            if len(x) < 2:
+                raise ValueError('step is needed for windows of one point')
+            self.step = float(np.median(np.abs(np.diff(x))))
+        index = np.rint((x - self.origin) / self.step).astype(np.int64)
+        low, high = index.min(), index.max()
+        self._reserve(low, high)
+        span = high - low + 1
+        index = index - low
+        start = low - self.first
+        self.sumX[start:start + span] += np.bincount(index, weights=x, minlength=span)
+        self.counts[start:start + span] += np.bincount(index, minlength=span)
+        # all tracks in one bincount (track t in bins t*span...)
+        trackIndex = (index + span * np.arange(len(y))[:, np.newaxis]).ravel()
+        self.sumY[:, start:start + span] += np.bincount(trackIndex, weights=y.ravel(), minlength=span * len(y)).reshape(len(y), span)
+        self.windows = self.windows + 1
+
+    def result(self):
+        """
+        Merged spectrum x, y (increasing x, bins with points only)
+        y: points or (tracks x points)
+        """
+        if self.counts is None:
+            return np.array([]), np.array([])
+        good = self.counts > 0
+        counts = self.counts[good]
+        x = self.sumX[good] / counts
+        y = self.sumY[:, good] / counts
+        if self.tracks is None:
+            y = y[0]
+        return x, y
+
+    def count(self):
+        """Number of points merged in each point of result()"""
+        if self.counts is None:
+            return np.array([], dtype=np.int64)
+        return self.counts[self.counts > 0]
+
+def minimumStep(xx):
+    """
+    Smallest spacing of the points of all the windows xx (windows x pixels)
+    """
+    return float(min(np.min(np.abs(np.diff(x))) for x in xx))
+
+def merge(xx, yy, step=None):
+    """
+    Merge all the windows xx (windows x pixels), yy (windows x pixels)
+    or (windows x tracks x pixels). Returns x, y (see WindowMerger)
+    step: width of the bins, None: minimumStep(xx) (same result in any order)
+    """
+    if step is None and len(xx) > 0:
+        step = minimumStep(xx)
+    merger = WindowMerger(step)
+    for x, y in zip(xx, yy):
+        merger.add(x, y)
+    return merger.result()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Fit many peaks at once (Gaussian, Lorentzian, pseudo-Voigt)
+
+Every peak is a row of stacked arrays x, y (peaks x points). All the rows are
+fitted together by Levenberg-Marquardt (numpy only): one iteration is a few
+array operations on all the peaks, with analytic derivatives. Initial values
+come from a centroid around the maximum (see centroid).
+
+Profiles (u = (x - center) / width, width: half width at half maximum)
+    gaussian     amplitude exp(-ln2 u**2) + offset
+    lorentzian   amplitude / (1 + u**2) + offset
+    voigt        pseudo-Voigt: amplitude (eta L + (1-eta) G) + offset
+
+ex.:
+    r = peakFit.fit(x, y, 'gaussian')          # x, y: (peaks x points) or (points)
+    r['center'], r['width'], r['centerError']
+    r = peakFit.fitPeaks(x, y, [[6929.5, 7032.4]] * len(y), halfWidth=8)  # (spectra x peaks)
+"""
+
+import numpy as np
+
+LN2 = np.log(2)
+_names = {'gaussian': ('amplitude', 'center', 'width', 'offset'),
+          'lorentzian': ('amplitude', 'center', 'width', 'offset'),
+          'voigt': ('amplitude', 'center', 'width', 'offset', 'eta')}
+
+def profile(x, p, kind='gaussian'):
+    """
+    Value of the profile and its derivatives
+
+    x
+        (peaks x points)
+    p
+        parameters (peaks x parameters), see _names
+    Returns f (peaks x points), jacobian (peaks x points x parameters)
+    """
+    amplitude, center, width, offset = [p[:, i, np.newaxis] for i in range(4)]
+    u = (x - center) / width
+    if kind in ('gaussian', 'voigt'):
+        G = np.exp(-LN2 * u**2)
+        dGdu = -2 * LN2 * u * G
+    if kind in ('lorentzian', 'voigt'):
+        L = 1 / (1 + u**2)
+        dLdu = -2 * u * L**2
+    if kind == 'gaussian':
+        shape, dshape = G, dGdu
+    elif kind == 'lorentzian':
+        shape, dshape = L, dLdu
+    else:
+        eta = p[:, 4, np.newaxis]
+        shape = eta * L + (1 - eta) * G
+        dshape = eta * dLdu + (1 - eta) * dGdu
+    jacobian = [shape,
+                -amplitude * dshape / width,  # du/dcenter = -1/width
+                -amplitude * dshape * u / width,  # du/dwidth = -u/width
+                np.ones_like(u)]
+    if kind == 'voigt':
+        jacobian.append(amplitude * (L - G))
+    return amplitude * shape + offset, np.stack(jacobian, axis=-1)
+
+def centroid(x, y, halfWidth=3):
+    """
+    Fast initial values: amplitude, center, width, offset of each row (peaks)
+    center: centroid of the points around the maximum (subpixel)
+
+    x, y
+        (peaks x points)
+    halfWidth
+        points on each side of the maximum used for the centroid
+    """
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    offset = np.nanmin(y, axis=1)
+    top = np.nanargmax(y, axis=1)
+    amplitude = y[np.arange(len(y)), top] - offset
+    index = np.clip(top[:, np.newaxis] + np.arange(-halfWidth, halfWidth + 1), 0, np.size(y, 1) - 1)
+    weight = np.clip(np.take_along_axis(y, index, axis=1) - offset[:, np.newaxis], 0, None)
+    weight = np.nan_to_num(weight)
+    xTop = np.take_along_axis(x, index, axis=1)
+    total = weight.sum(axis=1)
+    center = np.where(total > 0, (weight * xTop).sum(axis=1) / np.where(total > 0, total, 1), x[np.arange(len(x)), top])
+    # half width: points above half maximum
+    step = np.nanmedian(np.abs(np.diff(x, axis=1)), axis=1)
+    above = np.sum(y - offset[:, np.newaxis] >= amplitude[:, np.newaxis] / 2, axis=1)
+    width = np.maximum(above, 1) * step / 2
+    return amplitude, center, width, offset
+
+def fit(x, y, kind='gaussian', p0=None, weights=None, maxIter=100, tolerance=1e-10, eta=.5):
+    """
+    Fit a peak in each row of x, y (all at once)
+    Returns {name: (peaks), name + 'Error': (peaks), 'chi2', 'iterations', 'converged'}
+    names: amplitude, center, width (HWHM), offset (+ eta for voigt)
+
+    x, y
+        (peaks x points) or (points). nan in y are ignored.
+    kind
+        'gaussian', 'lorentzian', 'voigt'
+    p0
+        initial parameters (peaks x parameters). None: from centroid
+    weights
+        1/sigma**2 of each point (like y). None: 1
+    eta
+        initial Lorentzian fraction (voigt)
+    """
+    if kind not in _names:
+        raise ValueError("kind should be 'gaussian', 'lorentzian' or 'voigt'")
+    single = np.ndim(y) == 1
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.atleast_2d(np.asarray(x, dtype=float)), y.shape)
+    names = _names[kind]
+    if p0 is None:
+        p0 = np.stack(centroid(x, y), axis=1)
+        if kind == 'voigt':
+            p0 = np.hstack([p0, np.full((len(y), 1), float(eta))])
+    p = np.array(p0, dtype=float).reshape(len(y), len(names))
+    w = np.ones(y.shape) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), y.shape).copy()
+    w[np.isnan(y)] = 0
+    y = np.nan_to_num(y)
+
+    def residuals(p):
+        f, J = profile(x, p, kind)
+        r = f - y
+        return r, J, np.sum(w * r**2, axis=1)
+
+    r, J, cost = residuals(p)
+    damping = np.full(len(y), 1e-3)
+    converged = np.zeros(len(y), dtype=bool)
+    identity = np.eye(len(names))
+    for iteration in range(maxIter):
+        JTJ = np.einsum('nmk,nm,nml->nkl', J, w, J)
+        gradient = np.einsum('nmk,nm,nm->nk', J, w, r)
+        diagonal = np.diagonal(JTJ, axis1=1, axis2=2)
+        A = JTJ + damping[:, np.newaxis, np.newaxis] * identity * np.maximum(diagonal, 1e-30)[:, np.newaxis, :]
+        try:
+            step = np.linalg.solve(A, -gradient[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:  # a singular peak (ex.: flat), slower
+            step = -np.einsum('nkl,nl->nk', np.linalg.pinv(A), gradient)
+        step[converged] = 0
+        trial = p + step
+        trial[:, 2] = np.abs(trial[:, 2])  # width > 0
+        if kind == 'voigt':
+            trial[:, 4] = np.clip(trial[:, 4], 0, 1)
+        rTrial, JTrial, costTrial = residuals(trial)
+        better = np.isfinite(costTrial) & (costTrial <= cost)
+        # accepted steps: converged when the cost does not change anymore
+        converged |= better & (cost - costTrial <= tolerance * np.maximum(cost, 1e-300))
+        p[better] = trial[better]
+        r[better], J[better], cost[better] = rTrial[better], JTrial[better], costTrial[better]
+        damping = np.where(better, damping / 10, damping * 10)
+        converged |= damping > 1e12  # no better step
+        if np.all(converged):
+            break
+
+    # errors: covariance (J^T W J)^-1 scaled by the reduced chi2
+    dof = np.maximum(np.sum(w > 0, axis=1) - len(names), 1)
+    chi2 = cost / dof
+    JTJ = np.einsum('nmk,nm,nml->nkl', J, w, J)
+    covariance = np.linalg.pinv(JTJ)
+    errors = np.sqrt(np.abs(np.diagonal(covariance, axis1=1, axis2=2)) * chi2[:, np.newaxis])
+    out = {'chi2': chi2, 'iterations': iteration + 1, 'converged': converged}
+    for i, name in enumerate(names):
+        out[name] = p[:, i]
+        out[name + 'Error'] = errors[:, i]
+    if single:
+        out = {name: (value[0] if np.ndim(value) else value) for name, value in out.items()}
+    return out
+
+def fitPeaks(x, y, centers, halfWidth=10, kind='gaussian', **options):
+    """
+    Fit many peaks in many spectra at once
+    Returns the result of fit, each value (spectra x peaks)
+
+    x
+        (points) or (spectra x points), increasing
+    y
+        (spectra x points)
+    centers
+        approximate positions of the peaks (spectra x peaks), unit of x
+    halfWidth
+        points on each side of the approximate positions
+    options
+        see fit
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.atleast_2d(np.asarray(x, dtype=float)), y.shape)
+    centers = np.atleast_2d(np.asarray(centers, dtype=float))
+    nSpectra, nPeaks = centers.shape
+    # nearest point of each center, then a window of 2*halfWidth+1 points
+    nearest = np.sum(x[:, np.newaxis, :] < centers[:, :, np.newaxis], axis=2)
+    first = np.clip(nearest - halfWidth, 0, max(np.size(y, 1) - 2 * halfWidth - 1, 0))
+    index = np.minimum(first[..., np.newaxis] + np.arange(2 * halfWidth + 1), np.size(y, 1) - 1)
+    rows = np.arange(nSpectra)[:, np.newaxis, np.newaxis]
+    result = fit(x[rows, index].reshape(nSpectra * nPeaks, -1), y[rows, index].reshape(nSpectra * nPeaks, -1), kind, **options)
+    return {name: (np.reshape(value, (nSpectra, nPeaks)) if np.ndim(value) else value) for name, value in result.items()}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Read Princeton Instruments (Winspec) .SPE files, version 2.x
+
+The 4100 bytes header is parsed once. Frames are a read-only memory map
+of the file: only the frames and pixels used are read from the disk.
+
+ex.:
+    spe = PrincetonSPEFile('test-35.SPE')
+    spe.exposure, spe.nFrames, spe.xdim        # header only
+    y = spe.getData(pixels=slice(175, 1126))   # (frames, ydim, pixels)
+    spe.close()
+"""
+
+import os
+import numpy as np
+
+class PrincetonSPEFile():
+    headerSize = 4100
+    # datatype (header) -> numpy type
+    dataTypes = {0: np.float32, 1: np.int32, 2: np.int16, 3: np.uint16, 5: np.float64, 6: np.uint8, 8: np.uint32}
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            header = f.read(self.headerSize)
+        if len(header) < self.headerSize:
+            raise IOError(filename + ' is not a SPE file (header too short)')
+
+        def field(offset, dtype, count=1):
+            value = np.frombuffer(header, dtype=dtype, count=count, offset=offset)
+            return value if count > 1 else value[0].item()
+
+        self.exposure = field(10, '<f4')  # s (exp_sec)
+        self.temperature = field(36, '<f4')  # C (DetTemperature)
+        self.xdim = field(42, '<u2')
+        self.datatype = field(108, '<i2')
+        self.ydim = field(656, '<u2')
+        self.accumulations = field(668, '<i4')  # lavgexp
+        self.readoutTime = field(672, '<f4')  # ms
+        self.date = header[20:30].split(b'\x00')[0].decode('ascii', 'replace')
+        if self.datatype not in self.dataTypes:
+            raise IOError(filename + ': unknown data type ' + str(self.datatype))
+        self.dtype = np.dtype(self.dataTypes[self.datatype]).newbyteorder('<')
+        # NumFrames is not always right: also limited by the size of the file
+        frameSize = self.xdim * self.ydim * self.dtype.itemsize
+        nFrames = (os.path.getsize(filename) - self.headerSize) // frameSize if frameSize else 0
+        if field(1446, '<i4') > 0:
+            nFrames = min(nFrames, field(1446, '<i4'))
+        self.nFrames = nFrames
+        # ROIs (startx, endx, groupx, starty, endy, groupy), first pixel is 1
+        nROI = max(field(1510, '<i2'), 1)
+        self.rois = field(1512, '<u2', 6 * 10).reshape(10, 6)[:min(nROI, 10)].tolist()
+        if self.nFrames > 0:
+            self.data = np.memmap(filename, dtype=self.dtype, mode='r', offset=self.headerSize, shape=(self.nFrames, self.ydim, self.xdim))
+        else:  # empty files cannot be mapped
+            self.data = np.empty((0, self.ydim, self.xdim), dtype=self.dtype)
+
+    def close(self):
+        """Release the file (the memory map)"""
+        self.data = None
+
+    def pixels(self):
+        """
+        Chip pixel (0: first pixel of the chip) of each point of a frame
+        (offset and horizontal binning of the ROI, see CCDbackend.pixelAxis)
+        """
+        startx, endx, groupx = self.rois[0][:3]
+        if startx < 1 or groupx < 1:  # no ROI information
+            return np.arange(self.xdim)
+        return startx - 1 + (groupx - 1) / 2. + groupx * np.arange(self.xdim)
+
+    def pixelRange(self, first, last):
+        """Slice of the data with chip pixels first to last (included)"""
+        x = self.pixels()
+        return slice(int(np.searchsorted(x, first, 'left')), int(np.searchsorted(x, last, 'right')))
+
+    def getData(self, frames=slice(None), pixels=slice(None)):
+        """
+        Frames (frames, ydim, pixels), a view of the file (nothing is read before use)
+
+        frames, pixels
+            index or slice of frames, of points of a frame (see pixelRange)
+        """
+        return self.data[frames, :, pixels]
+
+    def getAccumulationTime(self):
+        """Exposure (s)"""
+        return self.exposure
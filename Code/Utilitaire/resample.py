@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Put the windows of a scan on a uniform grid (cm-1 or A)
+
+The windows (positions of the spectrometer x pixels) are mapped on the grid
+by one sparse matrix (linear interpolation or bins), averaged where windows
+overlap. The matrix only depends on the positions and the pixels: it is
+built once and kept (LRU cache), so repeated scans (same positions) and many
+spectra at once cost one sparse product.
+
+ex.:
+    r = resample.Resampler(100, 1000, .5, unit='cm-1', laser=5145.)
+    y = r.resample(positions, windows, pixels)   # windows: (windows x pixels) -> (grid)
+    y = r.resample(positions, scans, pixels)     # scans: (scans x windows x pixels) -> (scans x grid)
+    y = r.resample(*resample.scanWindows('261018-1.scan'))
+    r.grid
+"""
+
+import functools
+import numpy as np
+import scipy.sparse
+import calibration
+import scanFile
+
+class Resampler():
+    def __init__(self, start, stop, step, unit='cm-1', laser=None, method='linear', spectrometer=calibration.U1000CCD, cacheSize=64, decimals=3):
+        """
+        start, stop, step
+            grid (unit), stop included
+        unit
+            'cm-1', 'A'
+        laser
+            wavelength of the laser (A), for cm-1
+        method
+            'linear': linear interpolation of each window
+            'bin': mean of the pixels in each point of the grid (width step)
+        spectrometer
+            pixel -> wavelength (see calibration.Calibration)
+        cacheSize
+            number of position sets kept
+        decimals
+            positions (A) are rounded to identify a position set
+        """
+        if unit not in ('cm-1', 'A'):
+            raise ValueError("unit should be 'cm-1' or 'A'")
+        if unit == 'cm-1' and not laser:
+            raise ValueError('laser is needed for cm-1')
+        if method not in ('linear', 'bin'):
+            raise ValueError("method should be 'linear' or 'bin'")
+        self.grid = start + step * np.arange(int(round((stop - start) / step)) + 1)
+        self.step = step
+        self.unit = unit
+        self.laser = laser
+        self.method = method
+        self.spectrometer = spectrometer
+        self.decimals = decimals
+        self._operator = functools.lru_cache(maxsize=cacheSize)(self.__operator)
+
+    def axis(self, positions, pixels=None):
+        """
+        Position of every pixel (unit) (windows x pixels)
+
+        positions
+            positions of the spectrometer (A) (windows)
+        pixels
+            chip pixels of the windows. None: all the pixels
+        """
+        x = self.spectrometer.pixel2A(np.asarray(positions, dtype=float), pixels)
+        if self.unit == 'cm-1':
+            x = self.spectrometer.A2cm1(x, self.laser)
+        return x
+
+    def __operator(self, positions, pixels):
+        x = self.axis(positions, None if pixels is None else np.array(pixels))
+        nWindows, nPixels = np.shape(x)
+        rows = []
+        columns = []
+        weights = []
+        if self.method == 'linear':
+            for window in range(nWindows):
+                xw = x[window]
+                inside = np.where((self.grid >= xw[0]) & (self.grid <= xw[-1]))[0]
+                j = np.clip(np.searchsorted(xw, self.grid[inside]), 1, nPixels - 1)
+                t = (self.grid[inside] - xw[j-1]) / (xw[j] - xw[j-1])
+                column = window * nPixels + j
+                rows.extend([inside, inside])
+                columns.extend([column - 1, column])
+                weights.extend([1 - t, t])
+        else:
+            index = np.rint((x.ravel() - self.grid[0]) / self.step).astype(np.int64)
+            inside = np.where((index >= 0) & (index < len(self.grid)))[0]
+            rows.append(index[inside])
+            columns.append(inside)
+            weights.append(np.ones(len(inside)))
+        rows = np.concatenate(rows)
+        columns = np.concatenate(columns)
+        weights = np.concatenate(weights)
+        # mean of the windows (linear) or pixels (bin) in each point of the grid
+        if self.method == 'linear':
+            cover = np.bincount(rows, weights=weights, minlength=len(self.grid))
+        else:
+            cover = np.bincount(rows, minlength=len(self.grid)).astype(float)
+        covered = cover > 0
+        weights = weights / cover[rows]
+        operator = scipy.sparse.csr_matrix((weights, (rows, columns)), shape=(len(self.grid), nWindows * nPixels))
+        return operator, covered
+
+    def operator(self, positions, pixels=None):
+        """
+        Sparse matrix (grid x (windows*pixels)) and points of the grid covered
+        by the windows (bool). Built once for each position set.
+        """
+        positions = tuple(np.round(np.asarray(positions, dtype=float), self.decimals))
+        if pixels is not None:
+            pixels = tuple(np.asarray(pixels, dtype=float))
+        return self._operator(positions, pixels)
+
+    def resample(self, positions, y, pixels=None):
+        """
+        Windows y (... x windows x pixels) on the grid (... x grid)
+        Points of the grid without data are nan.
+
+        positions
+            positions of the spectrometer (A) (windows)
+        pixels
+            chip pixels of the windows (same for all). None: all the pixels
+        """
+        operator, covered = self.operator(positions, pixels)
+        y = np.asarray(y, dtype=float)
+        shape = y.shape[:-2]
+        out = operator.dot(y.reshape(-1, operator.shape[1]).T).T
+        out[:, ~covered] = np.nan
+        return out.reshape(shape + (len(self.grid),))
+
+def scanWindows(filename):
+    """
+    positions, y, pixels of the windows of a scan file (see U1000_scan.Mesure.measure)
+    y: (windows x pixels) or (tracks x windows x pixels)
+    """
+    scan = scanFile.ScanFile(filename)
+    windows = scan.getAll('window/y')
+    positions = np.array([attrs['position'] for y, attrs in windows])
+    y = np.array([y for y, attrs in windows])
+    first, last = windows[0][1]['pixels']
+    pixels = np.linspace(first, last, np.size(y, -1))
+    if y.ndim == 3:  # tracks first
+        y = np.moveaxis(y, 1, 0)
+    return positions, y, pixels
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Binary file of a scan (.scan): merged spectrum, raw windows and conditions
+
+One file instead of .csv + .csv.zip + .yaml (+ .npz + .txt). Records are
+appended during the scan (a window at a time); numbers are stored in binary
+(no text formatting), optionally compressed (zlib). Uncompressed arrays are
+read as memory maps. Text (CSV) is exported on demand (see exportCSV).
+
+File: MAGIC, then records. A record is
+    header length (uint32, little endian), header (JSON), padding, data
+    header: {"name", "dtype", "shape", "compression", "size", "attrs"}
+Data are aligned on 64 bytes.
+
+ex.:
+    with scanFile.ScanWriter('261018-1.scan') as f:
+        f.writeMetadata(state)
+        f.write('window/y', y, position=5320.1)
+        f.write('x', x)
+        f.write('y', y)
+    s = scanFile.ScanFile('261018-1.scan')
+    x, y = s.get('x'), s.get('y')
+    s.metadata()['sample']
+    scanFile.exportCSV('261018-1.scan')  # 261018-1.csv
+"""
+
+import json
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b'LLSCAN1\n'
+ALIGN = 64
+
+def _jsonDefault(o):
+    """numpy numbers and arrays in JSON"""
+    if hasattr(o, 'tolist'):
+        return o.tolist()
+    return str(o)
+
+class ScanWriter():
+    def __init__(self, filename, compression=None, level=6):
+        """
+        filename
+            file created (replaced)
+        compression
+            None, 'zlib'
+        level
+            zlib compression level (1 fast - 9 small)
+        """
+        if compression not in (None, 'zlib'):
+            raise ValueError('compression should be None or zlib')
+        self.filename = filename
+        self.compression = compression
+        self.level = level
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def flush(self):
+        self.file.flush()
+
+    def _record(self, header, data):
+        header = json.dumps(header, default=_jsonDefault).encode('utf-8')
+        position = self.file.tell() + 4 + len(header)
+        padding = -position % ALIGN
+        self.file.write(struct.pack('<I', len(header) + padding) + header + b' ' * padding)  # JSON ignores trailing spaces
+        self.file.write(data)
+
+    def write(self, name, array, **attrs):
+        """
+        Append an array (ex.: a window during the scan)
+
+        attrs
+            values kept with the array (ex.: position=5320.1)
+        """
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        compression = self.compression
+        if compression == 'zlib':
+            data = zlib.compress(data, self.level)
+        self._record({'name': name, 'dtype': array.dtype.str, 'shape': array.shape,
+                      'compression': compression, 'size': len(data), 'attrs': attrs}, data)
+
+    def writeMetadata(self, metadata):
+        """
+        Append the conditions of the scan (dict, see U1000_scan.Mesure.measureRange)
+        The last one is used.
+        """
+        data = json.dumps(metadata, default=_jsonDefault).encode('utf-8')
+        self._record({'name': 'metadata', 'dtype': 'json', 'shape': None,
+                      'compression': None, 'size': len(data), 'attrs': {}}, data)
+
+class ScanFile():
+    def __init__(self, filename):
+        """
+        Read the headers of the records of filename (not the data)
+        An incomplete last record (scan interrupted) is ignored.
+        """
+        self.filename = filename
+        self.records = []  # headers, with 'offset' of the data
+        with open(filename, 'rb') as f:
+            fileSize = f.seek(0, 2)
+            f.seek(0)
+            if f.read(len(MAGIC)) != MAGIC:
+                raise IOError(filename + ' is not a scan file')
+            while True:
+                size = f.read(4)
+                if len(size) < 4:
+                    break
+                length = struct.unpack('<I', size)[0]
+                header = f.read(length)
+                if len(header) < length:  # incomplete header (scan interrupted)
+                    break
+                try:
+                    record = json.loads(header.decode('utf-8'))
+                except ValueError:  # damaged header (UnicodeDecodeError too): end of the readable records
+                    break
+                record['offset'] = f.tell()
+                if record['offset'] + record['size'] > fileSize:  # incomplete (scan interrupted)
+                    break
+                f.seek(record['offset'] + record['size'])
+                self.records.append(record)
+
+    def names(self):
+        """Names of the records (in order, without repetition)"""
+        out = []
+        for record in self.records:
+            if record['name'] not in out:
+                out.append(record['name'])
+        return out
+
+    def _read(self, record):
+        if record['dtype'] == 'json':
+            with open(self.filename, 'rb') as f:
+                f.seek(record['offset'])
+                return json.loads(f.read(record['size']).decode('utf-8'))
+        shape = tuple(record['shape'])
+        if record['compression'] is None:
+            if record['size'] == 0:
+                return np.empty(shape, dtype=record['dtype'])
+            return np.memmap(self.filename, dtype=record['dtype'], mode='r', offset=record['offset'], shape=shape)
+        with open(self.filename, 'rb') as f:
+            f.seek(record['offset'])
+            return np.frombuffer(zlib.decompress(f.read(record['size'])), dtype=record['dtype']).reshape(shape)
+
+    def get(self, name, index=-1):
+        """
+        Array of the record name (memory map if not compressed)
+        index: which one if there are many (default: last)
+        """
+        return self._read([record for record in self.records if record['name'] == name][index])
+
+    def getAll(self, name):
+        """
+        All the records name: list of (array, attrs)
+        """
+        return [(self._read(record), record['attrs']) for record in self.records if record['name'] == name]
+
+    def metadata(self):
+        """Conditions of the scan (dict), {} if none"""
+        if 'metadata' not in self.names():
+            return {}
+        return self.get('metadata')
+
+def exportCSV(filename, csvFilename=None):
+    """
+    Export merged x, y of a scan file as text (format of the old .csv files)
+    Returns the name of the CSV file
+    """
+    scan = ScanFile(filename)
+    if csvFilename is None:
+        csvFilename = filename.rsplit('.scan', 1)[0] + '.csv'
+    x = scan.get('x')
+    y = scan.get('y')
+    header = 'Position,Intensity'
+    if np.ndim(y) > 1:  # one column per track
+        header = 'Position,' + ','.join('Intensity' + str(n+1) for n in range(len(y)))
+    np.savetxt(csvFilename, np.vstack([x, y]).transpose(), delimiter=',', fmt='%.8e', header=header, comments='')
+    return csvFilename
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Colin-N. Brosseau
+
+Data of a measurement: Spectrum (x, y) and Scan (windows of the CCD)
+
+Spectrum
+    x (points), y (points) or (tracks x points), unit and metadata.
+    It unpacks like the old (x, y) tuples: x, y = mesure.measure(...)
+Scan
+    windows in contiguous arrays (windows x pixels) grown by doubling
+    (no copy of all the windows at each append). A window is a view
+    (no copy), scans are concatenated with one copy.
+
+Both are written to / read from scan files (see scanFile).
+
+ex.:
+    scan = spectrum.Scan()
+    scan.append(5320.1, x, y, '261018-1.SPE')
+    scan.window(0).y         # view
+    scan.y                   # (windows x pixels), view
+    s = scan.merge()         # Spectrum
+    x, y = s
+    s = spectrum.Spectrum.read('261018-1.scan')
+"""
+
+import numpy as np
+import merge
+import scanFile
+
+class Spectrum():
+    __slots__ = ('x', 'y', 'unit', 'metadata')
+
+    def __init__(self, x, y, unit='A', metadata=None):
+        """
+        x
+            positions (points)
+        y
+            intensity (points) or (tracks x points)
+        unit
+            unit of x: 'A', 'cm-1'
+        metadata
+            conditions of the measurement (dict)
+        """
+        self.x = x
+        self.y = y
+        self.unit = unit
+        self.metadata = {} if metadata is None else metadata
+
+    # like a tuple (x, y)
+    def __iter__(self):
+        return iter((self.x, self.y))
+
+    def __getitem__(self, index):
+        return (self.x, self.y)[index]
+
+    def __repr__(self):
+        return 'Spectrum(' + str(len(self.x)) + ' points, ' + self.unit + ')'
+
+    def tracks(self):
+        """Number of tracks (1 for y of one dimension)"""
+        return 1 if np.ndim(self.y) == 1 else len(self.y)
+
+    def write(self, writer):
+        """
+        Write x, y (and metadata) in writer (scanFile.ScanWriter)
+        """
+        writer.write('x', self.x, unit=self.unit)
+        writer.write('y', self.y)
+        if self.metadata:
+            writer.writeMetadata(self.metadata)
+
+    @classmethod
+    def read(cls, filename):
+        """Merged spectrum of a scan file (memory maps if not compressed)"""
+        scan = scanFile.ScanFile(filename)
+        x, attrs = scan.getAll('x')[-1]
+        return cls(x, scan.get('y'), attrs.get('unit', 'A'), scan.metadata())
+
+class Scan():
+    __slots__ = ('_positions', '_x', '_y', '_n', 'files', 'pixels', 'unit', 'metadata')
+
+    def __init__(self, pixels=None, unit='A', metadata=None):
+        """
+        pixels
+            chip pixels of the windows (same for all)
+        unit
+            unit of x
+        metadata
+            conditions of the measurement (dict)
+        """
+        self._positions = np.zeros(0)
+        self._x = None  # (capacity x pixels)
+        self._y = None  # (capacity x pixels) or (capacity x tracks x pixels)
+        self._n = 0
+        self.files = []
+        self.pixels = pixels
+        self.unit = unit
+        self.metadata = {} if metadata is None else metadata
+
+    def __len__(self):
+        return self._n
+
+    def __repr__(self):
+        return 'Scan(' + str(self._n) + ' windows, ' + self.unit + ')'
+
+    def _reserve(self, capacity, x, y):
+        if self._x is None:
+            self._positions = np.zeros(capacity)
+            self._x = np.empty((capacity,) + np.shape(x))
+            self._y = np.empty((capacity,) + np.shape(y))
+        elif capacity > len(self._x):
+            capacity = max(capacity, 2 * len(self._x))
+            for name in ('_positions', '_x', '_y'):
+                old = getattr(self, name)
+                new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self._n] = old[:self._n]
+                setattr(self, name, new)
+
+    def append(self, position, x, y, file=None):
+        """
+        Add a window (copied: frames of the camera are reused)
+
+        position
+            position of the spectrometer (A)
+        x
+            position of each pixel (pixels)
+        y
+            intensity (pixels) or (tracks x pixels)
+        """
+        self._reserve(max(self._n + 1, 16), x, y)
+        if np.shape(y) != self._y.shape[1:]:
+            raise ValueError('All windows should have the same shape')
+        self._positions[self._n] = position
+        self._x[self._n] = x
+        self._y[self._n] = y
+        self.files.append(file)
+        self._n = self._n + 1
+
+    @property
+    def positions(self):
+        """Positions of the spectrometer (windows), view"""
+        return self._positions[:self._n]
+
+    @property
+    def x(self):
+        """(windows x pixels), view"""
+        return np.empty((0, 0)) if self._x is None else self._x[:self._n]
+
+    @property
+    def y(self):
+        """(windows x pixels) or (windows x tracks x pixels), view"""
+        return np.empty((0, 0)) if self._y is None else self._y[:self._n]
+
+    def window(self, index):
+        """Spectrum of a window (views)"""
+        return Spectrum(self.x[index], self.y[index], self.unit, {'position': self.positions[index], 'file': self.files[index]})
+
+    def __iter__(self):
+        return (self.window(n) for n in range(self._n))
+
+    @staticmethod
+    def concatenate(scans):
+        """One scan with the windows of scans (same shapes)"""
+        scans = [scan for scan in scans if len(scan) > 0]
+        out = Scan(scans[0].pixels if scans else None, scans[0].unit if scans else 'A')
+        if scans:
+            n = sum(len(scan) for scan in scans)
+            out._positions = np.concatenate([scan.positions for scan in scans])
+            out._x = np.concatenate([scan.x for scan in scans])
+            out._y = np.concatenate([scan.y for scan in scans])
+            out._n = n
+            out.files = sum((scan.files for scan in scans), [])
+            out.metadata = dict(scans[0].metadata)
+        return out
+
+    def merge(self, step=None):
+        """Merged spectrum of the windows (see merge.merge), step None: smallest pixel spacing"""
+        x, y = merge.merge(self.x, self.y, step)
+        return Spectrum(x, y, self.unit, dict(self.metadata))
+
+    def write(self, writer):
+        """
+        Write the windows (window/x, window/y) in writer (scanFile.ScanWriter)
+        """
+        for n in range(self._n):
+            attrs = {'position': self._positions[n], 'file': self.files[n]}
+            if self.pixels is not None:
+                attrs['pixels'] = [self.pixels[0], self.pixels[-1]]
+            writer.write('window/x', self._x[n], **attrs)
+            writer.write('window/y', self._y[n], **attrs)
+
+    @classmethod
+    def read(cls, filename):
+        """Windows of a scan file"""
+        f = scanFile.ScanFile(filename)
+        scan = cls(metadata=f.metadata())
+        for (x, attrs), (y, yAttrs) in zip(f.getAll('window/x'), f.getAll('window/y')):
+            scan.append(attrs['position'], x, y, attrs.get('file'))
+            if 'pixels' in attrs:
+                scan.pixels = np.linspace(attrs['pixels'][0], attrs['pixels'][1], np.size(x))
+        return scan
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Modules are imported by name (import calibration), like in the lab scripts
+"""
+
+import os
+import sys
+import pytest
+
+code = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ('Instruments', 'Utilitaire', 'Experiences'):
+    sys.path.insert(0, os.path.join(code, folder))
+
+@pytest.fixture
+def mesure(tmp_path, monkeypatch):
+    """Mesure with the simulated U1000 and CCD"""
+    monkeypatch.setenv('MPLBACKEND', 'Agg')
+    monkeypatch.chdir(tmp_path)
+    import U1000, U1000sim, CCDsim, U1000_scan, calibration
+    sim = U1000sim.U1000Simulator(timeScale=.01)
+    spectrometer = U1000.U1000(sim.port, initDelay=0)
+    ccd = CCDsim.simulatedCCD(position=lambda: spectrometer.realPosition, timeScale=.01, seed=1, calibration=calibration.U1000CCD)
+    m = U1000_scan.Mesure(5320, laser=5145., CCD=ccd, spectrometer=spectrometer)
+    calls = []
+    measureSimple = ccd.measureSimple
+    def spy(**options):
+        calls.append(options)
+        return measureSimple(**options)
+    ccd.measureSimple = spy
+    yield m, calls
+    m.close()
+    sim.close()
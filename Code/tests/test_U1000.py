@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import numpy as np
+import pytest
+import serial
+import U1000, U1000sim
+
+@pytest.fixture
+def spectro():
+    """U1000 on the simulator, display position initialised"""
+    sim = U1000sim.U1000Simulator(timeScale=.01)
+    spectro = U1000.U1000(sim.port, initDelay=0)
+    spectro.displayPosition = 5320
+    yield spectro, sim
+    spectro.close()
+    sim.close()
+
+def test_status_lines_end_with_newline_only(spectro):
+    spectro, sim = spectro
+    status = spectro._status()
+    assert '\r' not in status
+    assert status.splitlines() == ['position 5320.0', 'SLOW 2.0', 'speed 20.0']
+
+def test_latency_of_each_command(spectro):
+    spectro, sim = spectro
+    spectro.resetLatency()
+    spectro.speedSlow
+    spectro.speedSlow
+    spectro.goto(5330)
+    latency = spectro.latency
+    assert latency['SLOW?']['count'] == 2
+    assert latency['goto']['count'] == 1
+    assert 0 < latency['SLOW?']['mean'] <= latency['SLOW?']['max'] < spectro.timeout
+
+def test_query_without_reply_times_out(spectro):
+    spectro, sim = spectro
+    t = time.time()
+    with pytest.raises(serial.SerialTimeoutException):
+        spectro._query('nothing?', timeout=.2)
+    assert time.time() - t < 1
+    assert spectro._position is None  # no longer trusted
+    assert spectro.posi() == pytest.approx(5320)  # the port is still usable
+
+def test_no_position_query_after_an_acknowledged_goto(spectro):
+    spectro, sim = spectro
+    n = len(sim.commands)
+    spectro.goto(5330)
+    spectro.goto(5325)  # backlash move
+    assert spectro.posi() == pytest.approx(5325)
+    assert spectro.realPosition == pytest.approx(5325)
+    assert 'posi?' not in sim.commands[n:]
+    assert [c.split()[0] for c in sim.commands[n:]] == ['goto', 'goto', 'goto']
+
+def test_invalidated_position_is_queried_once(spectro):
+    spectro, sim = spectro
+    spectro.goto(5330)
+    spectro.invalidatePosition()
+    n = len(sim.commands)
+    assert spectro.posi() == pytest.approx(5330)
+    assert spectro.posi() == pytest.approx(5330)
+    assert sim.commands[n:] == ['posi?']
+
+def test_stop_interrupts_a_running_gotoAsync(spectro):
+    spectro, sim = spectro
+    sim.timeScale = 1.  # 14 s movement
+    move = spectro.gotoAsync(5600)
+    time.sleep(.3)
+    assert spectro.moving
+    spectro.stop()
+    with pytest.raises(serial.SerialException):
+        move.result(timeout=1)
+    assert spectro._position is None  # invalidated
+    n = len(sim.commands)
+    assert 5320 < spectro.posi() < 5600
+    assert sim.commands[n:] == ['posi?']
+
+def test_stop_cancels_a_queued_gotoAsync(spectro):
+    spectro, sim = spectro
+    spectro._lock.acquire()  # the movement cannot start yet
+    n = len(sim.commands)
+    move = spectro.gotoAsync(5400)
+    stopping = threading.Thread(target=spectro.stop)
+    stopping.start()
+    time.sleep(.2)
+    spectro._lock.release()
+    stopping.join()
+    with pytest.raises(serial.SerialException):
+        move.result(timeout=1)
+    assert not any(c.startswith('goto') for c in sim.commands[n:])
+    assert spectro._position is None
+    assert spectro.posi() == pytest.approx(5320)
+    spectro.goto(5330)  # later movements are not cancelled
+    assert spectro.posi() == pytest.approx(5330)
+
+def test_moveTime_slow_approach():
+    assert U1000.moveTime(0, 2., 20.) == 0
+    assert U1000.moveTime(.5, 2., 20.) == pytest.approx(.25)
+    assert U1000.moveTime(-11, 2., 20.) == pytest.approx(1/2. + 10/20.)
+
+def test_multi_range_plan_only_goes_up():
+    ranges = [np.arange(5500, 5530, 10.), np.arange(5300, 5330, 10.)]
+    order = U1000.planPath(ranges)
+    path = np.hstack(ranges)[order]
+    assert sorted(order) == list(range(6))
+    assert np.all(np.diff(path) > 0)
+    assert U1000.travelTime(path, 2., 20., 5290.) == pytest.approx(
+        np.sum(U1000.moveTime(np.diff(np.append(5290., path)), 2., 20.)))
+
+def test_descending_path_pays_one_backlash_per_step():
+    down = U1000.travelTime([5330., 5320., 5310.], 2., 20., 5340., backlashDelay=.2, backlash=1.)
+    step = U1000.moveTime(11, 2., 20.) + .2 + U1000.moveTime(1, 2., 20.)  # overshoot, pause, come back
+    assert down == pytest.approx(3 * step)
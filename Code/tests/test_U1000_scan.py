@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+def test_hardware_roi_is_restored_after_an_error(mesure):
+    m, calls = mesure
+    roi = [1, 1340, 1, 10, 90, 81]
+    m.CCD.ROIs([roi])
+    during = []
+    def fail(**options):
+        during.append(m.CCD.ROIs())
+        raise RuntimeError('camera error')
+    m.CCD.measureSimple = fail
+    with pytest.raises(RuntimeError):
+        m.measure([5320.], unit='A', maskCCD=[200, 1100], plot=False)
+    assert during == [[[201, 1101, 1, 10, 90, 81]]]  # only the mask, same rows
+    assert m.CCD.ROIs() == [roi]
+    assert m.CCD.useROI()[0]
+
+def test_camera_without_roi(mesure, monkeypatch):
+    m, calls = mesure
+    rois = []
+    monkeypatch.setattr(m.CCD, 'ROIs', lambda newRois=None: [] if newRois is None else rois.append(newRois))
+    previous = m.setROI([200, 1100])
+    assert rois == [[[201, 1101, 1, 1, m.CCD.nRows, m.CCD.nRows]]]  # full chip, binned vertically
+    m.CCD.useROI(True)
+    m.restoreROI(previous)
+    assert not m.CCD.useROI()[0]  # back to the full chip
+
+def test_tracks_give_one_spectrum_each(mesure):
+    m, calls = mesure
+    m.CCD.spectrum = lambda wavelength: 1000. * np.ones_like(wavelength)
+    x, y = m.measure([5320., 5330.], accTime=.1, images=1, unit='A', maskCCD=[200, 1100], plot=False, tracks=[[1, 20], [41, 100]])
+    assert np.shape(y) == (2, len(x))
+    assert np.nanmean(y[1]) > 2 * np.nanmean(y[0])  # 60 rows against 20
+    assert m.CCD.ROIs() == [[1, 1340, 1, 1, 100, 100]]  # restored
+
+def test_saturated_preview_shortens_the_exposure(mesure):
+    m, calls = mesure
+    m.CCD.spectrum = lambda wavelength: 1e7 * np.ones_like(wavelength)  # saturates in 10 ms
+    x, y = m.measure([5320.], accTime=.05, images=1, unit='A', maskCCD=[200, 1100], plot=False, autoExposure=True)
+    previews = [call['exposureTime'] for call in calls if call['filename'].endswith('-preview')]
+    assert previews == pytest.approx([.05, .005])  # shortened while saturated
+    exposure, images = calls[-1]['exposureTime'], calls[-1]['images']
+    assert exposure < .01
+    assert exposure * images == pytest.approx(.05)  # same total time
+    assert 1e7 * exposure < m.saturationLevel  # frames are not saturated
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pytest
+import backgroundWriter
+import scanFile
+
+@pytest.mark.parametrize('fsync', ['never', 'close', 'always'])
+def test_scan_writer(tmp_path, fsync):
+    writer = backgroundWriter.BackgroundWriter(maxsize=2, fsync=fsync)
+    filename = str(tmp_path / 'a.scan')
+    y = np.arange(10.)
+    with writer.scanWriter(filename, compression='zlib') as scan:
+        for position in range(5):
+            scan.write('window/y', y, position=position)
+            y[:] = -1  # reused buffer: the written array was copied
+        scan.writeMetadata({'sample': 'GaAs'})
+    writer.flush()
+    s = scanFile.ScanFile(filename)
+    windows = s.getAll('window/y')
+    assert [attrs['position'] for data, attrs in windows] == list(range(5))
+    np.testing.assert_array_equal(windows[0][0], np.arange(10.))
+    np.testing.assert_array_equal(windows[1][0], -np.ones(10))
+    assert s.metadata() == {'sample': 'GaAs'}
+    writer.close()
+
+def test_copy_file_reads_the_source_now(tmp_path):
+    writer = backgroundWriter.BackgroundWriter()
+    source = tmp_path / 'log.txt'
+    source.write_text('first')
+    writer.copyFile(str(source), str(tmp_path / 'a.log'))
+    source.write_text('second')
+    writer.close()
+    assert (tmp_path / 'a.log').read_text() == 'first'
+
+def test_errors_are_raised_in_the_caller(tmp_path):
+    writer = backgroundWriter.BackgroundWriter()
+    writer.submit(open, os.path.join(str(tmp_path), 'missing', 'a.txt'), 'w')
+    with pytest.raises(IOError):
+        writer.flush()
+    writer.flush()  # raised once
+    writer.close()
+    with pytest.raises(IOError):
+        writer.submit(print)
+
+def test_writes_are_in_order(tmp_path):
+    writer = backgroundWriter.BackgroundWriter(maxsize=1)
+    done = []
+    for n in range(20):
+        writer.submit(done.append, n)
+    writer.close()
+    assert done == list(range(20))
+    assert writer.pending() == 0
+
+def test_fsync_option():
+    with pytest.raises(ValueError):
+        backgroundWriter.BackgroundWriter(fsync='sometimes')
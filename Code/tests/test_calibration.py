@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import calibration
+
+def test_center_pixel_is_the_position():
+    x = calibration.U1000CCD.pixel2A(5320.)
+    assert len(x) == 1340
+    assert x[calibration.U1000CCD.centerPixel] == pytest.approx(5320.)
+    assert np.all(np.diff(x) > 0)
+
+def test_many_positions_match_one_at_a_time():
+    positions = np.array([5300., 5320., 5340.])
+    pixels = np.arange(175, 1126)
+    xx = calibration.U1000CCD.pixel2A(positions, pixels)
+    assert xx.shape == (3, len(pixels))
+    for position, x in zip(positions, xx):
+        np.testing.assert_allclose(x, calibration.U1000CCD.pixel2A(position, pixels))
+
+def test_cached_axis_is_read_only():
+    axis = calibration.U1000CCD.axis(5320.)
+    with pytest.raises(ValueError):
+        axis[0] = 0
+    x = calibration.U1000CCD.pixel2A(5320.)
+    x[0] = 0  # copy
+    assert calibration.U1000CCD.axis(5320.)[0] != 0
+
+def test_changing_a_parameter_clears_the_cache():
+    c = calibration.Calibration()
+    before = c.axis(6000.)
+    c.dv = calibration.U1000CCDNe.dv
+    np.testing.assert_allclose(c.axis(6000.), calibration.U1000CCDNe.axis(6000.))
+    assert not np.allclose(c.axis(6000.), before)
+
+def test_ne_dispersion():
+    assert calibration.U1000CCD.dv == pytest.approx(.2341131)
+    assert calibration.U1000CCDNe.dv == pytest.approx(.19583658)
+
+def test_wavenumber_round_trip():
+    c = calibration.U1000CCD
+    wavenumber = np.array([100., 520., 1000.])
+    np.testing.assert_allclose(c.A2cm1(c.cm12A(wavenumber, 5145.), 5145.), wavenumber)
+    np.testing.assert_allclose(c.pixel2wavenumber(5320., 5145.), c.A2cm1(c.pixel2A(5320.), 5145.))
+
+def test_u1000_pixel2wavenumber_keeps_its_formula():
+    import U1000
+    spectrometer = U1000.U1000.__new__(U1000.U1000)  # no serial port
+    spectrometer.calibration = None
+    with pytest.raises(ValueError):
+        spectrometer.pixel2A(5320.)
+    spectrometer.calibration = calibration.U1000CCDNe
+    x = calibration.U1000CCDNe.pixel2A(5320.)
+    np.testing.assert_allclose(spectrometer.pixel2A(5320.), x)
+    # 1e8/n_air (not U1000.A2cm1, 1e8*n_air)
+    np.testing.assert_allclose(spectrometer.pixel2wavenumber(5145., 5320.), 1e8 / 1.00028 * (1 / 5145. - 1 / x))
+    np.testing.assert_allclose(U1000.A2cm1(U1000.cm12A(np.array([500., 700.]), 5145.), 5145.), [500., 700.])
+    np.testing.assert_allclose(U1000.A2cm1(x, 5145.), calibration.U1000CCD.A2cm1(x, 5145.))
+
+def test_instruments_do_not_need_utilitaire():
+    import os
+    import subprocess
+    import sys
+    code = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', 'import sys; sys.path[:0] = [sys.argv[1]]; import U1000, U1000sim', os.path.join(code, 'Instruments')],
+                   check=True, cwd=os.path.join(code, 'Instruments'))
+
+def test_mesure_uses_one_calibration(mesure):
+    m, calls = mesure
+    assert m.calibration is calibration.U1000CCD
+    assert m.spectrometer.calibration is m.calibration
+    m.measure([5320], accTime=1, images=1, unit='A', plot=False)
+    np.testing.assert_allclose(m.scan.x[0], m.calibration.pixel2A(m.scan.positions[0], m.scan.pixels))
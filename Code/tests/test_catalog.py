@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import catalog
+import U1000
+
+laser = 5145.
+
+def add(cat, wavenumbers, sample='GaAs', date='20261018120000'):
+    A = U1000.cm12A(np.array(wavenumbers, dtype=float), laser)
+    return cat.add({'laser_A': laser, 'outFilename': sample + '.scan', 'sample': sample, 'date': date, 'unit': 'cm-1'},
+                   [sample + '.scan', sample + '-1.SPE'], np.min(A), np.max(A))
+
+def test_cover_at_the_exact_range(tmp_path):
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'))
+    add(cat, [500, 700])
+    assert len(cat.scans(cover=[500, 700])) == 1
+    assert len(cat.scans(cover=[700, 500])) == 1
+    assert len(cat.scans(cover=[550, 650])) == 1
+    assert cat.scans(cover=[499, 700]) == []
+    assert cat.scans(cover=[500, 701]) == []
+    A = U1000.cm12A(np.array([500., 700.]), laser)
+    assert len(cat.scans(cover=list(A), unit='A')) == 1
+
+def test_stored_range_matches_the_scan(tmp_path):
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'))
+    add(cat, [500, 700])
+    scan = cat.scans()[0]
+    np.testing.assert_allclose([scan['xmin_cm1'], scan['xmax_cm1']], [500, 700])
+
+def test_sample_dates_and_files(tmp_path):
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'))
+    first = add(cat, [100, 200], 'GaAs', '20261017120000')
+    add(cat, [100, 200], 'InP', '20261018120000')
+    assert [scan['sample'] for scan in cat.scans()] == ['InP', 'GaAs']  # newest first
+    assert [scan['id'] for scan in cat.scans(sample='Ga%')] == [first]
+    assert [scan['sample'] for scan in cat.scans(since=20261018)] == ['InP']
+    assert [scan['sample'] for scan in cat.scans(until=20261017)] == ['GaAs']
+    assert [path.endswith('GaAs-1.SPE') for path in cat.files(first, 'spe')] == [True]
+    assert len(cat.files(first)) == 2
+
+def test_next_file(tmp_path):
+    (tmp_path / '261018-3.scan').write_bytes(b'')
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'))
+    assert cat.nextFile(str(tmp_path), '261018-', '.scan') == '261018-4.scan'
+    assert cat.nextFile(str(tmp_path), '261018-', '.scan') == '261018-5.scan'
+
+def test_gap_between_ranges_is_not_covered(tmp_path):
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'))
+    ranges = [U1000.cm12A(np.array(r, dtype=float), laser) for r in ([500, 560], [300, 340])]
+    cat.add({'laser_A': laser, 'outFilename': 'GaAs.scan', 'sample': 'GaAs', 'Range': [[500, 560], [300, 340]]},
+            ['GaAs.scan'], ranges=ranges)
+    assert cat.scans(cover=[400, 450]) == []
+    assert cat.scans(cover=[300, 560]) == []
+    assert len(cat.scans(cover=[510, 550])) == 1
+    assert len(cat.scans(cover=[300, 340])) == 1
+    scan = cat.scans()[0]
+    np.testing.assert_allclose([scan['xmin_cm1'], scan['xmax_cm1']], [300, 560])  # whole span
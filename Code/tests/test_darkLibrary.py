@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import darkLibrary
+import CCDbackend
+
+def test_put_get(tmp_path):
+    library = darkLibrary.DarkLibrary(str(tmp_path))
+    key = library.key(1., 1, '100 kHz', [[176, 1126, 1, 1, 100, 100]], -120.)
+    assert library.get(key) is None
+    library.put(key, np.arange(5))
+    np.testing.assert_array_equal(library.get(key), np.arange(5))
+    # kept between sessions
+    np.testing.assert_array_equal(darkLibrary.DarkLibrary(str(tmp_path)).get(key), np.arange(5))
+
+def test_key():
+    library = darkLibrary.DarkLibrary.__new__(darkLibrary.DarkLibrary)
+    library.temperatureStep = 2.
+    assert library.key(1., 1, '100 kHz', None, -120.2) == library.key(1.0000001, 1, '100 kHz', None, -119.8)
+    assert library.key(1., 1, '100 kHz', None, -120.) != library.key(1., 2, '100 kHz', None, -120.)
+    assert library.key(1., 1, '100 kHz', None, -120.) != library.key(1., 1, '1 MHz', None, -120.)
+    assert library.key(1., 1, '100 kHz', None, -120.) != library.key(1., 1, '100 kHz', None, -110.)
+
+def test_old_darks_are_removed(tmp_path):
+    library = darkLibrary.DarkLibrary(str(tmp_path))
+    key = library.key(1., 1, '100 kHz', None, -120.)
+    library.put(key, np.zeros(3))
+    library.maxAge = -1
+    assert library.get(key) is None
+    assert os.listdir(str(tmp_path)) == []
+
+class _Camera(CCDbackend.CCDbackend):
+    def __init__(self, dark):
+        self.darkLibrary = True
+        self._dark = dark
+
+    def removeBackground(self, a=None):
+        return [0, 0]
+
+    def dark(self, exposureTime, accumulations=1):
+        return self._dark
+
+def test_subtract_dark_does_not_wrap_around():
+    camera = _Camera(np.array([10., 10., 10.]))
+    y = np.array([[5, 10, 20], [65535, 0, 11]], dtype=np.uint16)
+    assert camera._subtractDark(y, 1, 1) is y
+    np.testing.assert_array_equal(y, [[0, 0, 10], [65525, 0, 1]])
+    y = np.array([5., 10., 20.])
+    np.testing.assert_array_equal(camera._subtractDark(y, 1, 1), [-5., 0., 10.])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+import exposurePlanner
+
+noise = dict(darkCurrent=.2, readNoise={'100 kHz': 3.5, '1 MHz': 11.}, readOutTime={'100 kHz': .035, '1 MHz': .022})
+
+def test_snr_is_reached():
+    plan = exposurePlanner.planExposure(50., snr=100, **noise)
+    assert plan['snr'] >= 100 * (1 - 1e-9)
+    assert plan['images'] >= 5
+    assert plan['time'] == pytest.approx(plan['images'] * plan['accumulations'] * (plan['exposure'] + noise['readOutTime'][plan['adcSpeed']]))
+    assert plan['snr'] == pytest.approx(exposurePlanner.signalToNoise(50., .2, noise['readNoise'][plan['adcSpeed']], plan['exposure'], plan['images'] * plan['accumulations']))
+
+def test_time_budget_is_kept():
+    plan = exposurePlanner.planExposure(50., totalTime=10., **noise)
+    assert plan['time'] <= 10. * (1 + 1e-9)
+    # more time, better SNR
+    assert exposurePlanner.planExposure(50., totalTime=100., **noise)['snr'] > plan['snr']
+
+def test_weak_signal_prefers_low_read_noise():
+    assert exposurePlanner.planExposure(.5, totalTime=60., **noise)['adcSpeed'] == '100 kHz'
+
+def test_saturation_limits_the_exposure():
+    plan = exposurePlanner.planExposure(50., totalTime=100., peak=1e4, fullWell=65535., fraction=.8, **noise)
+    assert plan['exposure'] <= .8 * 65535. / 1e4
+
+def test_min_images():
+    assert exposurePlanner.planExposure(50., snr=10, minImages=1, **noise)['images'] >= 1
+    assert exposurePlanner.planExposure(50., snr=10, minImages=7, **noise)['images'] >= 7
+
+def test_errors():
+    with pytest.raises(ValueError):
+        exposurePlanner.planExposure(50., **noise)
+    with pytest.raises(ValueError):
+        exposurePlanner.planExposure(50., snr=10, totalTime=10, **noise)
+    with pytest.raises(ValueError):  # not even 5 readouts
+        exposurePlanner.planExposure(50., totalTime=.05, **noise)
+
+def test_measure_without_plan_keeps_the_old_defaults(mesure):
+    m, calls = mesure
+    m.measure([5320], accTime=1, unit='A', plot=False)
+    assert (calls[-1]['exposureTime'], calls[-1]['images']) == (1, 1)
+    assert m.exposurePlan is None
+    m.measure([5320], accTime=120, unit='A', plot=False)
+    assert (calls[-1]['exposureTime'], calls[-1]['images']) == (24, 5)
+
+def test_measure_with_plan_restores_the_adc_speed(mesure):
+    m, calls = mesure
+    m.CCD.adcSpeed('1 MHz')
+    m.expectedSignal = 100.
+    m.measure([5320], accTime=1, unit='A', plot=False)
+    assert calls[-1]['images'] >= 5
+    assert calls[-1]['exposureTime'] == m.exposurePlan['exposure']
+    assert m.exposurePlan['adcSpeed'] == '100 kHz'  # changed for the measurement
+    assert m.CCD.adcSpeed()[0] == '1 MHz'
+    m.expectedSignal = None
+    with pytest.raises(ValueError):
+        m.measure([5320], snr=10, unit='A', plot=False)
+
+def test_camera_drivers_do_not_need_utilitaire():
+    import os
+    import subprocess
+    import sys
+    code = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', 'import sys; sys.path[:0] = [sys.argv[1]]; import CCDbackend, CCDsim, exposurePlanner', os.path.join(code, 'Instruments')],
+                   check=True, cwd=os.path.join(code, 'Instruments'))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import calibration
+import importSPE
+from test_readSPE import writeSPE
+
+def writeFolder(folder):
+    """Two measurements of a scan (the second has 2 frames) and their log"""
+    first = np.arange(951).reshape(1, 1, 951) % 60000
+    second = np.arange(2 * 951).reshape(2, 1, 951) % 60000
+    writeSPE(str(folder / '261018-1.SPE'), first)
+    writeSPE(str(folder / '261018-2.SPE'), second, exposure=2.)
+    (folder / 'log.txt').write_text('#position(A), filename\n5320.0, ./261018-1.SPE\n5340.0, ./261018-2.SPE\n')
+    return first, second
+
+def test_readLog(tmp_path):
+    writeFolder(tmp_path)
+    assert importSPE.readLog(str(tmp_path / 'log.txt')) == {'261018-1': 5320., '261018-2': 5340.}
+
+def test_importFolder_and_loadFolder(tmp_path):
+    first, second = writeFolder(tmp_path)
+    output = str(tmp_path / 'day')
+    index, x, data = importSPE.importFolder(str(tmp_path), output, log=str(tmp_path / 'log.txt'), positionOffset=1., processes=1)
+    assert [record['position_A'] for record in index] == [5321., 5341.]
+    assert [record['firstSpectrum'] for record in index] == [0, 1]
+    assert index[1]['exposure_s'] == pytest.approx(2.)
+    np.testing.assert_array_equal(data, np.vstack([first[:, 0], second[:, 0]]))
+    np.testing.assert_allclose(x[1], calibration.U1000CCD.pixel2A(5341., np.arange(175, 1126)))
+    loaded = importSPE.loadFolder(output)
+    assert loaded[0] == index
+    np.testing.assert_array_equal(loaded[1], x)
+    np.testing.assert_array_equal(loaded[2], data)
+
+def test_file_missing_from_the_log_warns(tmp_path):
+    writeFolder(tmp_path)
+    writeSPE(str(tmp_path / 'manual.SPE'), np.ones((1, 1, 951)))
+    with pytest.warns(UserWarning, match='manual.SPE'):
+        index, x, data = importSPE.importFolder(str(tmp_path), str(tmp_path / 'day'), log=str(tmp_path / 'log.txt'), processes=1)
+    assert np.isnan(index[2]['position_A'])
+    assert np.all(np.isnan(x[2]))
+    assert index[0]['position_A'] == 5320.
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import merge
+import calibration
+
+def windows(positions=(5300., 5320., 5340.)):
+    """Overlapping windows (A) of the U1000 CCD and a smooth spectrum"""
+    xx = calibration.U1000CCD.pixel2A(np.array(positions), np.arange(175, 1126))
+    return xx, np.sin(xx / 3.)
+
+def test_same_result_in_any_order():
+    xx, yy = windows()
+    x, y = merge.merge(xx, yy)
+    for order in ([2, 1, 0], [1, 0, 2], [0, 2, 1]):
+        x2, y2 = merge.merge(xx[order], yy[order])
+        np.testing.assert_allclose(x2, x)
+        np.testing.assert_allclose(y2, y)
+
+def test_at_most_one_point_per_window_in_a_bin():
+    xx, yy = windows()
+    for order in ([0, 1, 2], [2, 1, 0]):
+        merger = merge.WindowMerger(merge.minimumStep(xx))
+        for x, y in zip(xx[order], yy[order]):
+            merger.add(x, y)
+        assert merger.count().max() <= len(xx)
+        assert merger.count().min() >= 1
+
+def test_streaming_equals_all_at_once():
+    xx, yy = windows()
+    merger = merge.WindowMerger(merge.minimumStep(xx))
+    for x, y in zip(xx, yy):
+        merger.add(x, y)
+    for a, b in zip(merger.result(), merge.merge(xx, yy)):
+        np.testing.assert_allclose(a, b)
+
+def test_mean_of_the_windows():
+    x = np.arange(10.)
+    merger = merge.WindowMerger(1.)
+    merger.add(x, np.ones(10))
+    merger.add(x + 5, 3 * np.ones(10))
+    xm, ym = merger.result()
+    np.testing.assert_allclose(xm, np.arange(15.))
+    np.testing.assert_allclose(ym, [1] * 5 + [2] * 5 + [3] * 5)
+    np.testing.assert_array_equal(merger.count(), [1] * 5 + [2] * 5 + [1] * 5)
+
+def test_tracks():
+    xx, yy = windows()
+    tracks = np.stack([yy, 2 * yy], axis=1)  # (windows x tracks x pixels)
+    x, y = merge.merge(xx, tracks)
+    assert y.shape == (2, len(x))
+    np.testing.assert_allclose(y[1], 2 * y[0])
+    merger = merge.WindowMerger(1.)
+    merger.add(xx[0], tracks[0])
+    with pytest.raises(ValueError):
+        merger.add(xx[1], yy[1])
+
+def test_grows_on_both_sides():
+    merger = merge.WindowMerger(1.)
+    for start in (100, 0, 300, -200):
+        merger.add(np.arange(start, start + 50.), np.full(50, start))
+    x, y = merger.result()
+    assert len(x) == 200
+    np.testing.assert_allclose(y, np.repeat([-200, 0, 100, 300], 50))
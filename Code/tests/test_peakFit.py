@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import peakFit
+
+x = np.linspace(6900., 6960., 121)
+
+@pytest.mark.parametrize('kind', ['gaussian', 'lorentzian'])
+def test_known_peak_is_recovered(kind):
+    p = np.array([[1000., 6929.47, 1.3, 50.]])
+    y = peakFit.profile(x[np.newaxis], p, kind)[0][0]
+    r = peakFit.fit(x, y, kind)
+    assert r['converged']
+    assert r['center'] == pytest.approx(6929.47, abs=1e-6)
+    assert r['width'] == pytest.approx(1.3, rel=1e-6)
+    assert r['amplitude'] == pytest.approx(1000., rel=1e-6)
+    assert r['offset'] == pytest.approx(50., abs=1e-4)
+
+def test_voigt():
+    p = np.array([[1000., 6929.47, 1.3, 50., .3]])
+    y = peakFit.profile(x[np.newaxis], p, 'voigt')[0][0]
+    r = peakFit.fit(x, y, 'voigt')
+    np.testing.assert_allclose([r[name] for name in ('amplitude', 'center', 'width', 'offset', 'eta')], p[0], rtol=1e-5)
+
+def test_noisy_peaks_at_once():
+    rng = np.random.default_rng(0)
+    centers = 6929.47 + rng.uniform(-3, 3, 50)
+    p = np.stack([np.full(50, 1000.), centers, np.full(50, 1.3), np.full(50, 50.)], axis=1)
+    y = peakFit.profile(np.broadcast_to(x, (50, len(x))), p, 'gaussian')[0]
+    y = rng.poisson(y).astype(float)
+    r = peakFit.fit(x, y, 'gaussian', weights=1 / np.maximum(y, 1))
+    assert r['center'].shape == (50,)
+    # within a few standard errors, and the errors are realistic
+    pull = (r['center'] - centers) / r['centerError']
+    assert np.all(np.abs(pull) < 5)
+    assert .5 < np.std(pull) < 2
+
+def test_nan_are_ignored():
+    p = np.array([[1000., 6929.47, 1.3, 50.]])
+    y = peakFit.profile(x[np.newaxis], p, 'gaussian')[0][0]
+    y[[10, 60]] = np.nan
+    assert peakFit.fit(x, y)['center'] == pytest.approx(6929.47, abs=1e-6)
+
+def test_fit_peaks_of_many_spectra():
+    positions = np.array([[6910., 6940.], [6912., 6945.], [6915., 6950.]])
+    y = np.zeros((3, len(x)))
+    for n, centers in enumerate(positions):
+        for center in centers:
+            y[n] += peakFit.profile(x[np.newaxis], np.array([[500., center, 1., 0.]]), 'gaussian')[0][0]
+    r = peakFit.fitPeaks(x, y, np.round(positions), halfWidth=8)
+    assert r['center'].shape == (3, 2)
+    np.testing.assert_allclose(r['center'], positions, atol=1e-4)
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        peakFit.fit(x, x, 'cauchy')
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import readSPE
+import importSPE
+
+def writeSPE(filename, data, exposure=.5, datatype=3, roi=(176, 1126, 1, 1, 100, 100), numFrames=None, extra=b''):
+    """Synthetic SPE file: header fields read by PrincetonSPEFile, then data (frames x ydim x xdim)"""
+    header = bytearray(readSPE.PrincetonSPEFile.headerSize)
+
+    def put(offset, dtype, value):
+        value = np.asarray(value, dtype=dtype).tobytes()
+        header[offset:offset + len(value)] = value
+
+    nFrames, ydim, xdim = data.shape
+    put(10, '<f4', exposure)
+    put(36, '<f4', -120.)
+    put(42, '<u2', xdim)
+    put(108, '<i2', datatype)
+    header[20:29] = b'18Oct2026'
+    put(656, '<u2', ydim)
+    put(668, '<i4', 3)
+    put(672, '<f4', 35.)
+    put(1446, '<i4', nFrames if numFrames is None else numFrames)
+    put(1510, '<i2', 1)
+    put(1512, '<u2', roi)
+    with open(filename, 'wb') as f:
+        f.write(bytes(header))
+        f.write(data.astype(np.dtype(readSPE.PrincetonSPEFile.dataTypes[datatype]).newbyteorder('<')).tobytes())
+        f.write(extra)
+
+def test_header_and_data(tmp_path):
+    filename = str(tmp_path / 'test.SPE')
+    data = np.arange(5 * 1 * 951).reshape(5, 1, 951) % 60000
+    writeSPE(filename, data)
+    spe = readSPE.PrincetonSPEFile(filename)
+    assert spe.exposure == pytest.approx(.5)
+    assert spe.temperature == pytest.approx(-120.)
+    assert (spe.xdim, spe.ydim, spe.nFrames, spe.accumulations) == (951, 1, 5, 3)
+    assert spe.readoutTime == pytest.approx(35.)
+    assert spe.date == '18Oct2026'
+    assert spe.rois == [[176, 1126, 1, 1, 100, 100]]
+    assert spe.dtype == np.dtype('<u2')
+    np.testing.assert_array_equal(spe.pixels(), np.arange(175, 1126))
+    np.testing.assert_array_equal(spe.getData(), data)
+    np.testing.assert_array_equal(spe.getData(frames=2, pixels=spe.pixelRange(200, 210)), data[2, :, 25:36])
+    spe.close()
+
+def test_frames_limited_by_the_file(tmp_path):
+    filename = str(tmp_path / 'test.SPE')
+    writeSPE(filename, np.ones((3, 2, 10)), datatype=0, roi=(1, 20, 2, 1, 100, 50), numFrames=10, extra=b'\x00' * 7)
+    spe = readSPE.PrincetonSPEFile(filename)
+    assert spe.nFrames == 3
+    assert spe.getData().shape == (3, 2, 10)
+    np.testing.assert_array_equal(spe.pixels(), .5 + 2 * np.arange(10))
+
+def test_short_file(tmp_path):
+    filename = str(tmp_path / 'test.SPE')
+    with open(filename, 'wb') as f:
+        f.write(b'\x00' * 100)
+    with pytest.raises(IOError):
+        readSPE.PrincetonSPEFile(filename)
+
+def test_importSPE_reads_the_mask(tmp_path):
+    filename = str(tmp_path / 'test.SPE')
+    data = np.arange(2 * 1340).reshape(2, 1, 1340)
+    writeSPE(filename, data, roi=(1, 1340, 1, 1, 100, 100))
+    x, y, accTime = importSPE.readSPE(filename, [175, 1125])
+    np.testing.assert_array_equal(x, np.arange(175, 1126))
+    np.testing.assert_array_equal(y, data[:, 0, 175:1126])
+    assert accTime == pytest.approx(.5)
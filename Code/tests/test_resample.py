@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import resample
+import calibration
+
+positions = np.array([5300., 5320., 5340.])
+pixels = np.arange(175., 1126.)
+
+def test_linear_is_exact_on_a_line():
+    r = resample.Resampler(5285., 5355., .05, unit='A', method='linear')
+    x = r.axis(positions, pixels)
+    y = r.resample(positions, 2 * x + 1, pixels)
+    covered = ~np.isnan(y)
+    assert covered.sum() > .9 * len(r.grid)
+    np.testing.assert_allclose(y[covered], 2 * r.grid[covered] + 1)
+    # outside of the windows
+    assert np.isnan(r.resample([5320.], (2 * x + 1)[1:2], pixels)[0])
+
+def test_cm1_axis():
+    r = resample.Resampler(400., 1000., .5, unit='cm-1', laser=5145.)
+    np.testing.assert_allclose(r.axis(positions, pixels), calibration.U1000CCD.pixel2wavenumber(positions, 5145., pixels))
+
+def test_bin_is_the_mean_of_the_pixels():
+    r = resample.Resampler(5285., 5355., .2, unit='A', method='bin')
+    y = r.resample(positions, np.full((3, len(pixels)), 7.), pixels)
+    covered = ~np.isnan(y)
+    np.testing.assert_allclose(y[covered], 7.)
+
+def test_operator_is_kept_for_a_position_set():
+    r = resample.Resampler(5285., 5355., .05, unit='A')
+    operator, covered = r.operator(positions, pixels)
+    assert r.operator(positions + 1e-5, pixels)[0] is operator  # rounded (decimals)
+    assert r.operator(positions + 1., pixels)[0] is not operator
+
+def test_many_scans_at_once():
+    r = resample.Resampler(5285., 5355., .05, unit='A')
+    y = np.random.default_rng(0).random((4, 3, len(pixels)))  # (scans x windows x pixels)
+    out = r.resample(positions, y, pixels)
+    assert out.shape == (4, len(r.grid))
+    np.testing.assert_allclose(out[2], r.resample(positions, y[2], pixels), equal_nan=True)
+
+def test_errors():
+    with pytest.raises(ValueError):
+        resample.Resampler(0, 10, 1, unit='cm-1')
+    with pytest.raises(ValueError):
+        resample.Resampler(0, 10, 1, unit='eV')
+    with pytest.raises(ValueError):
+        resample.Resampler(0, 10, 1, unit='A', method='cubic')
+
+def test_scan_windows(tmp_path):
+    import scanFile
+    filename = str(tmp_path / 'a.scan')
+    y = np.random.default_rng(0).random((3, 2, len(pixels)))  # (windows x tracks x pixels)
+    with scanFile.ScanWriter(filename) as f:
+        for position, window in zip(positions, y):
+            f.write('window/y', window, position=position, pixels=[pixels[0], pixels[-1]])
+    p, yy, px = resample.scanWindows(filename)
+    np.testing.assert_array_equal(p, positions)
+    np.testing.assert_array_equal(px, pixels)
+    np.testing.assert_array_equal(yy, np.moveaxis(y, 1, 0))  # tracks first
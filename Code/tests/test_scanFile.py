@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import scanFile
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_round_trip(tmp_path, compression):
+    filename = str(tmp_path / 'a.scan')
+    y = np.random.default_rng(0).random((2, 951))
+    with scanFile.ScanWriter(filename, compression=compression) as f:
+        f.writeMetadata({'sample': 'GaAs', 'accTime_s': np.float64(1.5)})
+        for position in (5300., 5320.):
+            f.write('window/y', y, position=position, pixels=[175, 1125])
+        f.write('x', np.arange(10.))
+        f.write('y', np.arange(10, dtype=np.uint16))
+        f.writeMetadata({'sample': 'InP'})
+    s = scanFile.ScanFile(filename)
+    assert s.names() == ['metadata', 'window/y', 'x', 'y']
+    assert s.metadata() == {'sample': 'InP'}  # the last one
+    windows = s.getAll('window/y')
+    assert [attrs['position'] for data, attrs in windows] == [5300., 5320.]
+    np.testing.assert_array_equal(windows[1][0], y)
+    np.testing.assert_array_equal(s.get('x'), np.arange(10.))
+    assert s.get('y').dtype == np.uint16
+
+def test_data_are_aligned(tmp_path):
+    filename = str(tmp_path / 'a.scan')
+    with scanFile.ScanWriter(filename) as f:
+        f.write('a', np.arange(3.), note='x' * 17)
+        f.write('b', np.arange(5.))
+    assert all(record['offset'] % scanFile.ALIGN == 0 for record in scanFile.ScanFile(filename).records)
+
+def test_interrupted_scan(tmp_path):
+    filename = str(tmp_path / 'a.scan')
+    with scanFile.ScanWriter(filename) as f:
+        f.write('x', np.arange(5.))
+        f.write('y', np.arange(7.), position=3.)
+    data = open(filename, 'rb').read()
+    first = scanFile.ScanFile(filename).records[0]
+    for cut in range(len(scanFile.MAGIC), len(data) + 1):
+        with open(filename, 'wb') as f:
+            f.write(data[:cut])
+        records = scanFile.ScanFile(filename).records  # never raises
+        assert [record['name'] for record in records] == ['x', 'y'][:(cut >= first['offset'] + first['size']) + (cut == len(data))]
+    with open(filename, 'wb') as f:  # damaged header
+        f.write(data[:len(scanFile.MAGIC) + 4] + b'\xff' * (len(data) - len(scanFile.MAGIC) - 4))
+    assert scanFile.ScanFile(filename).records == []
+
+def test_not_a_scan_file(tmp_path):
+    filename = str(tmp_path / 'a.scan')
+    with open(filename, 'wb') as f:
+        f.write(b'Position,Intensity\n')
+    with pytest.raises(IOError):
+        scanFile.ScanFile(filename)
+
+def test_export_csv(tmp_path):
+    filename = str(tmp_path / 'a.scan')
+    with scanFile.ScanWriter(filename) as f:
+        f.write('x', np.array([1., 2.]))
+        f.write('y', np.array([[3., 4.], [5., 6.]]))
+    csv = scanFile.exportCSV(filename)
+    assert csv == str(tmp_path / 'a.csv')
+    lines = open(csv).read().splitlines()
+    assert lines[0] == 'Position,Intensity1,Intensity2'
+    np.testing.assert_allclose(np.loadtxt(csv, delimiter=',', skiprows=1), [[1, 3, 5], [2, 4, 6]])
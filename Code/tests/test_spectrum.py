@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import spectrum
+import scanFile
+
+def test_spectrum_unpacks_like_a_tuple():
+    s = spectrum.Spectrum(np.arange(3.), np.ones(3), 'cm-1', {'sample': 'GaAs'})
+    x, y = s
+    np.testing.assert_array_equal(x, np.arange(3.))
+    assert s[1] is s.y
+    with pytest.raises(TypeError):  # not the number of points, len(s.x)
+        len(s)
+    assert s.tracks() == 1
+    assert spectrum.Spectrum(x, np.ones((2, 3))).tracks() == 2
+
+def test_scan_grows_and_keeps_the_windows():
+    scan = spectrum.Scan(unit='A')
+    x = np.arange(10.)
+    y = np.zeros(10)
+    for n in range(40):  # more than the first capacity
+        y[:] = n  # reused buffer: windows are copied
+        scan.append(5000. + n, x + n, y, 'f' + str(n) + '.SPE')
+    assert len(scan) == 40
+    assert scan.y.shape == (40, 10)
+    np.testing.assert_array_equal(scan.y[:, 0], np.arange(40))
+    window = scan.window(3)
+    assert window.metadata == {'position': 5003., 'file': 'f3.SPE'}
+    assert np.shares_memory(window.y, scan.y)  # view
+    with pytest.raises(ValueError):
+        scan.append(0., x, np.zeros(11))
+
+def test_concatenate():
+    a, b = spectrum.Scan(), spectrum.Scan()
+    a.append(1., np.arange(3.), np.ones(3), 'a')
+    b.append(2., np.arange(3.), 2 * np.ones(3), 'b')
+    b.append(3., np.arange(3.), 3 * np.ones(3), 'c')
+    scan = spectrum.Scan.concatenate([a, spectrum.Scan(), b])
+    np.testing.assert_array_equal(scan.positions, [1., 2., 3.])
+    assert scan.files == ['a', 'b', 'c']
+    np.testing.assert_array_equal(scan.y[:, 0], [1., 2., 3.])
+
+def test_merge():
+    scan = spectrum.Scan(unit='A')
+    scan.append(1., np.arange(10.), np.ones(10))
+    scan.append(2., np.arange(5., 15.), 3 * np.ones(10))
+    x, y = scan.merge()
+    np.testing.assert_allclose(x, np.arange(15.))
+    np.testing.assert_allclose(y, [1] * 5 + [2] * 5 + [3] * 5)
+
+def test_write_read(tmp_path):
+    filename = str(tmp_path / 'a.scan')
+    scan = spectrum.Scan(pixels=np.arange(175., 185.), unit='A', metadata={'sample': 'GaAs'})
+    for n in range(3):
+        scan.append(5300. + n, np.arange(10.) + n, np.full((2, 10), n), 'f' + str(n) + '.SPE')
+    merged = scan.merge()
+    merged.metadata['outFilename'] = 'a.scan'
+    with scanFile.ScanWriter(filename) as f:
+        scan.write(f)
+        merged.write(f)
+    read = spectrum.Scan.read(filename)
+    np.testing.assert_array_equal(read.positions, scan.positions)
+    np.testing.assert_array_equal(read.y, scan.y)
+    np.testing.assert_array_equal(read.pixels, scan.pixels)
+    assert read.files == scan.files
+    s = spectrum.Spectrum.read(filename)
+    np.testing.assert_array_equal(s.x, merged.x)
+    np.testing.assert_array_equal(s.y, merged.y)
+    assert s.unit == 'A'
+    assert s.metadata == {'sample': 'GaAs', 'outFilename': 'a.scan'}
+
+def test_measure_returns_a_spectrum(mesure):
+    m, calls = mesure
+    s = m.measure([5320, 5340], accTime=1, images=1, unit='A', plot=False, saveFile=True)
+    m.writer.flush()
+    assert isinstance(s, spectrum.Spectrum)
+    assert s.unit == 'A'
+    assert s.metadata['outFilename'].endswith('.scan')
+    saved = spectrum.Spectrum.read(s.metadata['outFilename'])
+    np.testing.assert_array_equal(saved.x, s.x)
+    assert len(spectrum.Scan.read(s.metadata['outFilename'])) == 2